@@ -0,0 +1,10 @@
+"""
+merakitoolkit
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+MerakiToolKit package metadata (modules are not imported here, so the command line starts fast)
+"""
+
+__author__ = "Giovanni Augusto"
+__copyright__ = "Copyright (C) 2022 Giovanni Augusto"
+__license__ = "MIT"
+__version__ = "1.1.5a"
@@ -5,14 +5,13 @@ main program executable
 """
 
 # standard libraries
-import asyncio
 import sys
 import os
 from importlib import resources
 
 # additional libraries
+# MerakiToolkit operations (with asyncio and Meraki SDK) are imported only by the psk command (fast startup)
 from merakitoolkit import merakitoolkitparser
-from merakitoolkit import merakitoolkit
 
 
 def main() -> int:
@@ -21,12 +20,22 @@ def main() -> int:
     mainparser,return_code = merakitoolkitparser.parser()
     if mainparser:
         if mainparser.command == "psk":
-            merakiobj = merakitoolkit.MerakiToolkit(vars(mainparser))
+            import asyncio # pylint: disable=import-outside-toplevel
+            from merakitoolkit import merakitoolkit # pylint: disable=import-outside-toplevel
+            settings = vars(mainparser)
+            # emails (requested in input, for each job of the job file or for each network of the recipients file)
+            # are sent as soon as SSIDs are changed
+            settings["notify"] = bool(mainparser.email or mainparser.jobs_file or mainparser.recipients_file)
+            merakiobj = merakitoolkit.MerakiToolkit(settings)
             # This is a bugfix for async Event loop in windows (seems for aiohttp) https://stackoverflow.com/a/68137823/13616177
             if os.name == 'nt':
                 asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
             asyncio.run(merakiobj.pskchangeasync())
-            if mainparser.email:
+            # some organizations or networks failed: the others were processed
+            if merakiobj.current_operation["failures"]:
+                return_code = merakitoolkit.EXIT_FAILURES
+            # emails of jobs not notified during the operation (eg: PSK already set in all the networks)
+            if settings["notify"]:
                 merakiobj.send_email_psk()
         if mainparser.command == "psktemplategen":
             # copy default template into local directory
@@ -3,31 +3,172 @@ merakitoolkit
 ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 Define MerakiToolKit class to ease operations with Meraki Cloud
 """
+# pylint: disable=too-many-lines
 
 # standard libraries
 import asyncio
+import contextlib
+import functools
 import os
 import sys
-import smtplib
-import ssl
+import time
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
-from datetime import date
+from datetime import date, datetime, timezone
 
 # additional libraries
 import meraki
 import meraki.aio
 from . import merakitoolkitsupport
+from . import merakitoolkitcache
+from . import merakitoolkitratelimit
+from . import merakitoolkitstats
+from . import merakitoolkitoutput
+from . import merakitoolkitjournal
+from . import merakitoolkitsmtp
+from . import merakitoolkitnotify
 
-__author__ = "Giovanni Augusto"
-__copyright__ = "Copyright (C) 2022 Giovanni Augusto"
-__license__ = "MIT"
-__version__ = "1.1.5a"
+# package metadata, defined in the package to be read without importing this module
+from . import __author__,__copyright__,__license__,__version__ # pylint: disable=unused-import
 
+# Settings that are not mandatory in input, applied when missing from the settings dictionary
+# (eg: MerakiToolkit instantiated programmatically instead of via merakitoolkitparser)
+OPTIONAL_SETTINGS = {
+    "org_concurrency": 10,
+    "all_product_types": False,
+    "tags_filter": "any",
+    "cache": False,
+    "cache_file": None,
+    "cache_ttl": 86400,
+    "refresh_cache": False,
+    "incremental": False,
+    "rate_limit": merakitoolkitratelimit.DEFAULT_RATE,
+    "max_attempts": merakitoolkitratelimit.DEFAULT_MAX_ATTEMPTS,
+    "retry_backoff": merakitoolkitratelimit.DEFAULT_BACKOFF,
+    "call_deadline": merakitoolkitratelimit.DEFAULT_DEADLINE,
+    "concurrency": merakitoolkitratelimit.DEFAULT_DISCOVERY_WORKERS,
+    "update_concurrency": merakitoolkitratelimit.DEFAULT_UPDATE_WORKERS,
+    "jobs_file": None,
+    "jobs": None,
+    "action_batches": False,
+    "action_batch_size": merakitoolkitratelimit.DEFAULT_ACTION_BATCH_SIZE,
+    "base_url": None,
+    "stats": False,
+    "stats_file": None,
+    "metrics_file": None,
+    "output": None,
+    "output_file": None,
+    "journal": None,
+    "resume": None,
+    "notify": False,
+    "smtp_connections": merakitoolkitsmtp.DEFAULT_SMTP_CONNECTIONS,
+    "smtp_attempts": merakitoolkitsmtp.DEFAULT_SMTP_ATTEMPTS,
+    "template_cache": None,
+    "notify_mode": "job",
+    "recipients_file": None,
+    "recipients": None,
+    "render_processes": None,
+    "psk_policy": "job",
+}
 
-class MerakiToolkit():
+# exit code of an operation completed with failures of some organizations or networks (other errors exit with 2)
+EXIT_FAILURES = 3
+
+# redirects followed by a Meraki dashboard call (request_once)
+MAX_REDIRECTS = 3
+# meraki.aio.AsyncRestSession attributes used by request_once (Meraki SDK 1.x),
+# with other SDK versions the requests are sent by Meraki SDK once (maximum_retries) and 429 errors are waited by it
+SDK_SESSION_ATTRIBUTES = [
+    "_request","_req_session","_base_url","_logger",
+    "_certificate_path","_requests_proxy","_single_request_timeout"
+    ]
+
+# Meraki Dashboard tagsFilterType values for each tags filter mode
+TAGS_FILTER_TYPES = {
+    "any": "withAnyTags",
+    "all": "withAllTags",
+}
+
+
+def api_error_message(err):
+    '''Returns the errors of a Meraki SDK exception (errors list of the response or a text message)'''
+    if isinstance(err.message,dict):
+        return err.message.get("errors",err.message)
+    return err.message
+
+
+async def request_once(session,metadata,method,url,**kwargs):
+    '''
+    Sends a Meraki SDK request once, replaces meraki.aio.AsyncRestSession._request of the dashboard session
+    429 errors (Too many requests), server errors (5XX) and connection errors are raised at once as AsyncAPIError
+    instead of waiting in Meraki SDK: waits and retries are done by dashboard_call() (rate limiter and retry policy)
+    requests and responses are logged with the session logger (verbose level 3) as Meraki SDK does
+    '''
+    # pylint: disable=protected-access
+    logger = session._logger
+    tag = metadata["tags"][0]
+    operation = metadata["operation"]
+    if session._certificate_path:
+        kwargs.setdefault("ssl",session._sslcontext)
+    if session._requests_proxy:
+        kwargs.setdefault("proxy",session._requests_proxy)
+    kwargs.setdefault("timeout",session._single_request_timeout)
+    url = str(url)
+    abs_url = url if "meraki.com" in url or "meraki.cn" in url else session._base_url + url
+    if logger:
+        logger.debug(metadata)
+    for _ in range(MAX_REDIRECTS + 1):
+        try:
+            if logger:
+                logger.info(f"{method} {abs_url}")
+            response = await session._req_session.request(method,abs_url,**kwargs)
+        except Exception as err: # pylint: disable=broad-except
+            if logger:
+                logger.warning(f"{tag}, {operation} > {abs_url} - {err}")
+            raise meraki.exceptions.AsyncAPIError(metadata,None,str(err)) from err
+        if 200 <= response.status < 300:
+            if logger:
+                page = f"; page {metadata['page']}" if "page" in metadata else ""
+                logger.info(f"{tag}, {operation}{page} > {abs_url} - {response.status} {response.reason}")
+            if method != "GET":
+                return response
+            try:
+                await response.json(content_type=None)
+                return response
+            except Exception as err: # pylint: disable=broad-except
+                # invalid JSON is retried as a failed connection (no status)
+                if logger:
+                    logger.warning(f"{tag}, {operation} > {abs_url} - {err}")
+                response.release()
+                raise meraki.exceptions.AsyncAPIError(metadata,None,f"invalid response: {err}") from err
+        if 300 <= response.status < 400:
+            # moved Organization (eg: other region), next calls are sent to the new base URL as Meraki SDK does
+            abs_url = response.headers["Location"]
+            substring = "meraki.com/api/v" if "meraki.com/api/v" in abs_url else "meraki.cn/api/v"
+            session._base_url = abs_url[:abs_url.find(substring) + len(substring) + 1]
+            response.release()
+            continue
+        try:
+            message = await response.json(content_type=None)
+        except Exception: # pylint: disable=broad-except
+            message = (await response.text())[:100]
+        if logger:
+            # 429 and server errors are retried by dashboard_call()
+            log = logger.warning if response.status == 429 or response.status >= 500 else logger.error
+            log(f"{tag}, {operation} > {abs_url} - {response.status} {response.reason}, {message}")
+        raise meraki.exceptions.AsyncAPIError(metadata,response,message)
+    raise meraki.exceptions.AsyncAPIError(metadata,response,f"more than {MAX_REDIRECTS} redirects")
+
+
+def supports_request_once(session):
+    '''
+    Returns True if a Meraki SDK dashboard session has the attributes used by request_once
+    (AsyncRestSession internals of the tested Meraki SDK versions, see SDK_SESSION_ATTRIBUTES)
+    '''
+    return all(hasattr(session,x) for x in SDK_SESSION_ATTRIBUTES)
+
+
+class MerakiToolkit(): # pylint: disable=too-many-public-methods disable=too-many-instance-attributes
     '''Defines the base class with all functionalities'''
     def __init__(self,settings):
         '''
@@ -47,12 +188,61 @@ class MerakiToolkit():
         smtp-mode
         smtp-user
         smtp-pass
+        org_concurrency (optional)
+        all_product_types (optional)
+        tags_filter (optional)
+        cache (optional)
+        cache_file (optional)
+        cache_ttl (optional)
+        refresh_cache (optional)
+        incremental (optional)
+        rate_limit (optional)
+        max_attempts (optional)
+        retry_backoff (optional)
+        call_deadline (optional)
+        concurrency (optional)
+        update_concurrency (optional)
+        jobs_file (optional)
+        jobs (optional) : list of PSK change jobs, instead of jobs_file
+        action_batches (optional)
+        action_batch_size (optional)
+        base_url (optional)
+        stats (optional)
+        stats_file (optional)
+        metrics_file (optional)
+        output (optional)
+        output_file (optional)
+        journal (optional)
+        resume (optional)
+        notify (optional) : send the emails of the jobs during the operation, as soon as their SSIDs are changed
+        smtp_connections (optional)
+        smtp_attempts (optional)
+        template_cache (optional)
+        notify_mode (optional) : job (one email for each job) or network (one email for each network SSID)
+        recipients_file (optional)
+        recipients (optional) : recipients of the networks for the network notify mode, instead of recipients_file
+        render_processes (optional)
+        psk_policy (optional) : job (the PSK of the job) or network (a unique generated PSK for each network SSID)
         '''
         # Meraki API key is common for all operations and is assigned via the property method
         self.apikey = settings["apikey"]
         # operation data received in input
         self.current_operation = settings
         self.dashboard = None
+        # local inventory cache (merakitoolkitcache.InventoryCache), opened during operations if enabled
+        self.cache = None
+        # pacing of Meraki dashboard calls (merakitoolkitratelimit.OrganizationRateLimiter)
+        self.ratelimiter = None
+        # retries of failed Meraki dashboard calls (merakitoolkitratelimit.RetryPolicy)
+        self.retrypolicy = None
+        # calls counters and latencies (merakitoolkitstats.OperationStats), collected if enabled
+        self.stats = None
+        # machine-readable results of the networks (merakitoolkitoutput.ResultWriter), written if enabled
+        self.output = None
+        # journal of the operation to resume it if interrupted (merakitoolkitjournal.Journal), written if enabled
+        self.journal = None
+        # processes rendering the notification emails of each network (merakitoolkitnotify.EmailRenderer)
+        self.renderer = None
 
 
     @property
@@ -93,8 +283,15 @@ class MerakiToolkit():
             self._last_operation = None
         self._current_operation = {
             "settings": {x: settings[x] for x in settings if x not in ["apikey"] },
-            "success": False
+            "success": False,
+            # failures of organizations and networks (see record_failure), the operation continues with the others
+            "failures": [],
+            # jobs (network keys in network notify mode) whose notification email was sent (or attempted)
+            "notified": set()
         }
+        # apply default values for optional settings not given in input
+        for setting,value in OPTIONAL_SETTINGS.items():
+            self._current_operation["settings"].setdefault(setting,value)
          # verify that at least one parameter for smtp is empty
         if None in ([ settings[x] for x in settings if "smtp" in x ]):
             # verify that the MERAKITK_SMTP environment variable exists and loads it
@@ -113,20 +310,58 @@ class MerakiToolkit():
                     self._current_operation["settings"]["smtp_pass"]=smtp_settings[4]
 
         # Generate a PSK
-        # priority of PSK choice : input psk > MERAKI_PSK env > automatic generation
-        # randomization has effect only if a PSK was given in input otherwise is always applied
-        if settings["passphrase"] is None:
+        self._current_operation["settings"]["passphrase"] = self.select_psk(
+                                                                    settings["passphrase"],
+                                                                    settings["passrandomize"]
+                                                                    )
+        # Validate PSK security
+
+        # Jobs of the operation: each job changes the PSK of an SSID in its organizations and networks
+        # without a job file the operation settings are the only job
+        operation = self._current_operation["settings"]
+        if operation["jobs"] is None and operation["jobs_file"]:
+            try:
+                operation["jobs"] = merakitoolkitsupport.load_jobs(operation["jobs_file"])
+            except Exception as err: # pylint: disable=broad-except
+                print("An error occurred while loading the job file: ",err)
+                sys.exit(2)
+        # recipients of the networks (network notify mode)
+        if operation["recipients"] is None and operation["recipients_file"]:
+            try:
+                operation["recipients"] = merakitoolkitnotify.load_recipients(operation["recipients_file"])
+            except Exception as err: # pylint: disable=broad-except
+                print("An error occurred while loading the recipients file: ",err)
+                sys.exit(2)
+        if operation["jobs"] is None:
+            operation["jobs"] = [{x: operation.get(x) for x in merakitoolkitsupport.JOB_SETTINGS}]
+        else:
+            jobs = []
+            for job in operation["jobs"]:
+                # job settings not given in the job are taken from the operation settings
+                job_settings = {x: job.get(x,operation.get(x)) for x in merakitoolkitsupport.JOB_SETTINGS}
+                # a job without a PSK gets its own PSK (not the one generated for the operation)
+                job_settings["passphrase"] = self.select_psk(
+                                                job.get("passphrase",settings["passphrase"]),
+                                                job_settings["passrandomize"]
+                                                )
+                jobs.append(job_settings)
+            operation["jobs"] = jobs
+
+    @staticmethod
+    def select_psk(passphrase,passrandomize):
+        '''
+        Returns the PSK to apply
+        priority of PSK choice : input psk > MERAKI_PSK env > automatic generation
+        randomization has effect only if a PSK was given in input otherwise is always applied
+        '''
+        if passphrase is None:
             if "MERAKITK_PSK" in os.environ:
                 psk_dictionary = os.environ["MERAKITK_PSK"].split("::")
             else:
                 psk_dictionary = [""]
         else:
-            psk_dictionary = [settings["passphrase"]]
-        self._current_operation["settings"]["passphrase"] = merakitoolkitsupport.generate_psk(
-                                                                    psk_dictionary,
-                                                                    randomize=settings["passrandomize"]
-                                                                    )
-        # Validate PSK security
+            psk_dictionary = [passphrase]
+        return merakitoolkitsupport.generate_psk(psk_dictionary,randomize=passrandomize)
 
 
     def connect(self):
@@ -141,41 +376,123 @@ class MerakiToolkit():
         else :
             logging = False
         try:
-            return meraki.aio.AsyncDashboardAPI(
+            dashboard = meraki.aio.AsyncDashboardAPI(
                 api_key=self.apikey,
+                # Meraki dashboard API endpoint (eg: regional dashboards, proxies or a local test dashboard)
+                base_url=self.current_operation["settings"]["base_url"] or meraki.config.DEFAULT_BASE_URL,
                 suppress_logging=not logging,
                 simulate=False,
-                caller="merakitoolkit"
+                caller="merakitoolkit",
+                # concurrency is bounded by the discovery and update workers pools
+                maximum_concurrent_requests=self.current_operation["settings"]["concurrency"] + \
+                                            self.current_operation["settings"]["update_concurrency"],
+                # failed calls are retried by dashboard_call() retry policy
+                maximum_retries=1
                 )
+            # failed calls are not waited by Meraki SDK: 429 errors pause the organization in dashboard_call()
+            session = dashboard._session # pylint: disable=protected-access
+            if supports_request_once(session):
+                session._request = functools.partial(request_once,session) # pylint: disable=protected-access
+            elif self.current_operation["settings"]["verbose"]>=1:
+                print(f"Meraki SDK {meraki.__version__} : 429 errors and failed requests are waited by Meraki SDK")
+            return dashboard
         except meraki.exceptions.AsyncAPIError as err:
-            print(f'operation: {err.operation} error: {err.message["errors"]}')
+            print(f'operation: {err.operation} error: {api_error_message(err)}')
         except meraki.exceptions.APIError as err:
-            print(f'operation: {err.operation} error: {err.message["errors"]}')
+            print(f'operation: {err.operation} error: {api_error_message(err)}')
         except Exception as err: # pylint: disable=broad-except
             print("An error occurred while connecting to Meraki Dashboard: ",err)
             sys.exit(2)
 
 
+    async def dashboard_call(self,organization_id,call,*args,max_attempts=None,**kwargs):
+        '''
+        Execute a Meraki dashboard API call paced by the organization rate limiter and return its result
+        failed calls are repeated according to the retry policy (merakitoolkitratelimit.RetryPolicy)
+        up to <max_attempts> if given (eg: 1 for calls that must not be sent twice)
+        on 429 errors (Too many requests) all calls for the organization are paused for the time
+        indicated in response header Retry-After before repeating the call
+        '''
+        settings = self.current_operation["settings"]
+        if self.ratelimiter is None:
+            self.ratelimiter = merakitoolkitratelimit.OrganizationRateLimiter(rate=settings["rate_limit"])
+        if self.retrypolicy is None:
+            self.retrypolicy = merakitoolkitratelimit.RetryPolicy(
+                max_attempts=settings["max_attempts"],
+                backoff=settings["retry_backoff"],
+                deadline=settings["call_deadline"]
+                )
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.retrypolicy.deadline
+        attempt = 1
+        rate_limited = 0
+        result = None
+        failed = True
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self.ratelimiter.acquire(organization_id),deadline - loop.time())
+                    result = await asyncio.wait_for(call(*args,**kwargs),deadline - loop.time())
+                    failed = False
+                    return result
+                except asyncio.TimeoutError as err:
+                    raise meraki.exceptions.AsyncAPIError(
+                        {"tags":["merakitoolkit"],"operation":call.__name__},
+                        None,
+                        f"call deadline of {self.retrypolicy.deadline} seconds exceeded"
+                        ) from err
+                except meraki.exceptions.AsyncAPIError as err:
+                    wait = self.retrypolicy.wait(attempt,err,max_attempts)
+                    if err.status == 429:
+                        # the organization is paused once, as soon as the 429 error is received (also the last attempt)
+                        rate_limited += 1
+                        pause = wait if wait is not None else merakitoolkitratelimit.retry_after(err)
+                        if pause:
+                            self.ratelimiter.pause(organization_id,pause)
+                            if self.stats:
+                                self.stats.count("rate_limit_wait_seconds",pause)
+                    if wait is None or loop.time() + wait >= deadline:
+                        raise
+                    attempt += 1
+                    if err.status != 429:
+                        await asyncio.sleep(wait)
+        finally:
+            # call time includes pacing and retries, sizes are the JSON size of parameters and response
+            if self.stats:
+                self.stats.record(
+                    call.__name__,
+                    loop.time() - started,
+                    attempts=attempt,
+                    rate_limited=rate_limited,
+                    failed=failed,
+                    sent=[args,kwargs],
+                    received=result
+                    )
+
+
     async def get_organizations(self):
         '''
         Retrieve organizations from Meraki dashboard and return them
         '''
         try:
+            if self.cache:
+                organizations = self.cache.get_organizations()
+                if organizations is not None:
+                    if self.current_operation["settings"]["verbose"]>=2:
+                        print("CACHE: getting Organizations")
+                    return organizations
             if self.current_operation["settings"]["verbose"]>=2:
                 print("START: getting Organizations")
-            organizations = await self.dashboard.organizations.getOrganizations()
+            organizations = await self.dashboard_call(None,self.dashboard.organizations.getOrganizations)
             if self.current_operation["settings"]["verbose"]>=2:
                 print("END: getting Organizations")
+            if self.cache:
+                self.cache.set_organizations(organizations)
             return organizations
         except meraki.exceptions.AsyncAPIError as err:
-            # Too many requests
-            if err.response.status == 429:
-                # wait for the time indicated in reponse header Retry-After and then retry
-                await asyncio.sleep(int(err.response.headers["Retry-After"]))
-                return await self.get_organizations()
-            else:
-                print(f'operation: {err.operation} error: {err.message["errors"]}')
-                return None
+            print(f'operation: {err.operation} error: {api_error_message(err)}')
+            return None
         except Exception as err: # pylint: disable=broad-except
             print("An error occurred while retrieving Organizations: ",err)
             sys.exit(2)
@@ -184,57 +501,128 @@ class MerakiToolkit():
     async def get_network_wireless_ssids(self,network):
         '''
         Retrieve SSIDs from a Network in Meraki dashboard and return them
+        SSIDs are always retrieved from Meraki dashboard (the inventory cache is only updated)
         '''
         try:
             if self.current_operation["settings"]["verbose"]>=2:
                 print(f"START: getting SSIDs for Network: {network['name']}")
-            ssids = await self.dashboard.wireless.getNetworkWirelessSsids(network["id"])
+            ssids = await self.dashboard_call(
+                network.get("organizationId"),
+                self.dashboard.wireless.getNetworkWirelessSsids,
+                network["id"]
+                )
             if self.current_operation["settings"]["verbose"]>=2:
                 print(f"END: getting SSIDs for Network: {network['name']}")
+            if self.cache and ssids is not None:
+                self.cache.set_ssids(network["id"],ssids)
             return ssids
         except meraki.exceptions.AsyncAPIError as err:
-            # Too many requests
-            if err.response.status == 429:
-                # wait for the time indicated in reponse header Retry-After and then retry
-                await asyncio.sleep(int(err.response.headers["Retry-After"]))
-                return await self.get_network_wireless_ssids(network)
-            else:
-                print(f'operation: {err.operation} error: {err.message["errors"]} network: {network["name"]}')
-                return None
+            print(f'operation: {err.operation} error: {api_error_message(err)} network: {network["name"]}')
+            self.record_failure("discovery",api_error_message(err),network=network)
+            return None
         except meraki.exceptions.APIError as err:
-            print(f'operation: {err.operation} error: {err.message["errors"]} network: {network["name"]}')
+            print(f'operation: {err.operation} error: {api_error_message(err)} network: {network["name"]}')
+            self.record_failure("discovery",api_error_message(err),network=network)
             return None
         except Exception as err: # pylint: disable=broad-except
-            print("An error occurred while retrieving Organizations: ",err)
-            sys.exit(2)
+            print(f"An error occurred while retrieving SSIDs of network {network['name']}: ",err)
+            self.record_failure("discovery",err,network=network)
+            return None
 
 
-    async def get_organization_networks(self,organization):
+    async def get_organization_networks(self,organization,tags=None,tags_filter="any"):
         '''
         Retrieve Networks from an organization in Meraki dashboard and return them
+        if tags are given, networks are filtered by Meraki dashboard (any or all tags must match)
         '''
         try:
+            if self.cache:
+                networks = self.cache.get_networks(organization["id"],tags,tags_filter)
+                if networks is not None:
+                    if self.current_operation["settings"]["verbose"]>=2:
+                        print(f"CACHE: getting networks for org: {organization['name']}")
+                    return networks
             if self.current_operation["settings"]["verbose"]>=2:
                 print(f"START: getting networks for org: {organization['name']}")
-            networks = await self.dashboard.organizations.getOrganizationNetworks(organization["id"])
+            filters = {}
+            if tags:
+                filters["tags"] = tags
+                filters["tagsFilterType"] = TAGS_FILTER_TYPES[tags_filter]
+            networks = await self.dashboard_call(
+                organization["id"],
+                self.dashboard.organizations.getOrganizationNetworks,
+                organization["id"],
+                total_pages="all",
+                **filters
+                )
             if self.current_operation["settings"]["verbose"]>=2:
                 print(f"END: getting networks for org: {organization['name']}")
+            if self.cache:
+                self.cache.set_networks(organization["id"],networks,tags,tags_filter)
             return networks
         except meraki.exceptions.AsyncAPIError as err:
-            # Too many requests
-            if err.response.status == 429:
-                # wait for the time indicated in reponse header Retry-After and then retry
-                await asyncio.sleep(int(err.response.headers["Retry-After"]))
-                return await self.get_organization_networks(organization)
-            else:
-                print(f'operation: {err.operation} error: {err.message["errors"]} Organization: {organization["name"]}')
-                return None
+            print(f'operation: {err.operation} error: {api_error_message(err)} Organization: {organization["name"]}')
+            self.record_failure("organization",api_error_message(err),organization=organization)
+            return None
         except meraki.exceptions.APIError as err:
-            print(f'operation: {err.operation} error: {err.message["errors"]} Organization: {organization["name"]}')
+            print(f'operation: {err.operation} error: {api_error_message(err)} Organization: {organization["name"]}')
+            self.record_failure("organization",api_error_message(err),organization=organization)
             return None
         except Exception as err: # pylint: disable=broad-except
-            print("An error occurred while retrieving Networks: ",err)
-            sys.exit(2)
+            print(f"An error occurred while retrieving Networks of organization {organization['name']}: ",err)
+            self.record_failure("organization",err,organization=organization)
+            return None
+
+
+    async def get_organization_configuration_changes(self,organization,since):
+        '''
+        Retrieve configuration changes of an organization in Meraki dashboard since a time (epoch) and return them
+        '''
+        try:
+            if self.current_operation["settings"]["verbose"]>=2:
+                print(f"START: getting configuration changes for org: {organization['name']}")
+            changes = await self.dashboard_call(
+                organization["id"],
+                self.dashboard.organizations.getOrganizationConfigurationChanges,
+                organization["id"],
+                total_pages="all",
+                t0=datetime.fromtimestamp(since,timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+                )
+            if self.current_operation["settings"]["verbose"]>=2:
+                print(f"END: getting configuration changes for org: {organization['name']}")
+            return changes
+        except meraki.exceptions.AsyncAPIError as err:
+            print(f'operation: {err.operation} error: {api_error_message(err)} Organization: {organization["name"]}')
+            return None
+        except meraki.exceptions.APIError as err:
+            print(f'operation: {err.operation} error: {api_error_message(err)} Organization: {organization["name"]}')
+            return None
+        except Exception as err: # pylint: disable=broad-except
+            print("An error occurred while retrieving configuration changes: ",err)
+            return None
+
+
+    async def refresh_organization_inventory(self,organization):
+        '''
+        Invalidate the cached inventory of an organization changed since its last synchronization
+        reading the organization configuration change log, never synchronized organizations are retrieved again
+        '''
+        synchronized = time.time()
+        last_synchronized = self.cache.get_sync(organization["id"])
+        if last_synchronized is None or \
+            synchronized - last_synchronized >= merakitoolkitcache.CONFIGURATION_CHANGES_LOOKBACK:
+            self.cache.invalidate_organization(organization["id"])
+        else:
+            changes = await self.get_organization_configuration_changes(
+                organization,
+                last_synchronized - merakitoolkitcache.CONFIGURATION_CHANGES_OVERLAP
+                )
+            if changes is None:
+                # configuration change log not available: organization inventory is retrieved again
+                self.cache.invalidate_organization(organization["id"])
+            else:
+                self.cache.apply_configuration_changes(organization["id"],changes)
+        self.cache.set_sync(organization["id"],synchronized)
 
 
     async def update_network_wireless_ssid(self,network,passphrase):
@@ -244,28 +632,184 @@ class MerakiToolkit():
         try:
             if self.current_operation["settings"]["verbose"]>=2:
                 print(f"START: updating PSK for network: {network['name']}")
-            ssid = await self.dashboard.wireless.updateNetworkWirelessSsid(network["id"],network["ssidPosition"],psk=passphrase)
+            ssid = await self.dashboard_call(
+                network.get("organizationId"),
+                self.dashboard.wireless.updateNetworkWirelessSsid,
+                network["id"],
+                network["ssidPosition"],
+                psk=passphrase
+                )
             if self.current_operation["settings"]["verbose"]>=2:
                 print(f"END: updating PSK for network: {network['name']}")
+            if ssid["name"] != network["ssidName"]:
+                # SSID moved since discovery (eg: position from a stale inventory cache): discovered again next time
+                if self.cache:
+                    self.cache.invalidate_ssids([network["id"]])
+                raise ValueError(f"PSK change : SSID in position {network['ssidPosition']} is {ssid['name']} "
+                                 f"instead of {network['ssidName']}")
             if ssid["psk"] == passphrase:
                 return True
             else:
                 raise ValueError(f"PSK change : {ssid['name']} passhprase was not changed!")
         except meraki.exceptions.AsyncAPIError as err:
-            # Too many requests
-            if err.response.status == 429:
-                # wait for the time indicated in reponse header Retry-After and then retry
-                await asyncio.sleep(int(err.response.headers["Retry-After"]))
-                return await self.update_network_wireless_ssid(network,passphrase)
-            else:
-                print(f'operation: {err.operation} error: {err.message["errors"]} Network: {network["id"]} SSID: {network["ssidName"]}') # pylint: disable=line-too-long
-                return False
+            print(f'operation: {err.operation} error: {api_error_message(err)} Network: {network["id"]} SSID: {network["ssidName"]}') # pylint: disable=line-too-long
+            self.record_failure("update",api_error_message(err),network=network)
+            return False
         except meraki.exceptions.APIError as err:
-            print(f'operation: {err.operation} error: {err.message["errors"]} Network: {network["id"]} SSID: {network["ssidName"]}') # pylint: disable=line-too-long
+            print(f'operation: {err.operation} error: {api_error_message(err)} Network: {network["id"]} SSID: {network["ssidName"]}') # pylint: disable=line-too-long
+            self.record_failure("update",api_error_message(err),network=network)
             return False
         except Exception as err: # pylint: disable=broad-except
-            print("An error occurred while retrieving Networks: ",err)
-            sys.exit(2)
+            print(f"An error occurred while updating the PSK of network {network['name']}: ",err)
+            self.record_failure("update",err,network=network)
+            return False
+
+
+    async def update_network_wireless_ssids_batch(self,organization_id,updates):
+        '''
+        update Wireless SSIDs of networks of an organization with a Meraki dashboard action batch
+        updates is a list of (network,passphrase), returns the outcome of the operation for each network
+        the batch is executed asynchronously by Meraki dashboard and its status is checked with a growing interval
+        '''
+        settings = self.current_operation["settings"]
+        actions = [
+            {
+                "resource": f"/networks/{network['id']}/wireless/ssids/{network['ssidPosition']}",
+                "operation": "update",
+                "body": {"psk": passphrase}
+            }
+            for network,passphrase in updates
+            ]
+        try:
+            if settings["verbose"]>=2:
+                print(f"START: updating PSK for {len(actions)} networks with an action batch")
+            batch = await self.dashboard_call(
+                organization_id,
+                self.dashboard.organizations.createOrganizationActionBatch,
+                organization_id,
+                actions,
+                confirmed=True,
+                synchronous=False,
+                # a repeated POST could run the batch twice (eg: created but its response lost)
+                max_attempts=1
+                )
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.retrypolicy.deadline
+            poll = settings["retry_backoff"]
+            while not batch["status"]["completed"] and not batch["status"]["failed"]:
+                if loop.time() + poll >= deadline:
+                    raise TimeoutError(f"action batch {batch['id']} not completed in {self.retrypolicy.deadline} seconds")
+                await asyncio.sleep(poll)
+                poll = min(poll*2,merakitoolkitratelimit.ACTION_BATCH_MAX_POLL)
+                batch = await self.dashboard_call(
+                    organization_id,
+                    self.dashboard.organizations.getOrganizationActionBatch,
+                    organization_id,
+                    batch["id"]
+                    )
+            if settings["verbose"]>=2:
+                print(f"END: updating PSK for {len(actions)} networks with action batch {batch['id']}")
+            # action batches are atomic: a failed batch does not apply any of its actions
+            if batch["status"]["failed"]:
+                raise ValueError(f"action batch {batch['id']} failed: {batch['status']['errors']}")
+            return [True for x in updates]
+        except meraki.exceptions.AsyncAPIError as err:
+            print(f'operation: {err.operation} error: {api_error_message(err)} Networks: {[x[0]["id"] for x in updates]}') # pylint: disable=line-too-long
+            error = api_error_message(err)
+        except (ValueError,TimeoutError) as err:
+            print(f'PSK change : {err} Networks: {[x[0]["id"] for x in updates]}')
+            error = err
+        except Exception as err: # pylint: disable=broad-except
+            print("An error occurred while running an action batch: ",err)
+            error = err
+        # action batches are atomic: all the networks of the batch failed
+        for network,_ in updates:
+            self.record_failure("update",error,network=network)
+        return [False for x in updates]
+
+
+    def measure(self,endpoint):
+        '''
+        context manager recording the execution time of a block in the operation statistics (if enabled)
+        yields a dictionary to set the sizes of data sent and received by the block
+        '''
+        if self.stats is None:
+            return contextlib.nullcontext({})
+        return self.stats.measure(endpoint)
+
+
+    def record_failure(self,stage,error,organization=None,network=None):
+        '''
+        record the failure of a stage (organization, discovery or update) for an organization or a network
+        the operation continues with the other organizations and networks, failures are summarized at its end
+        '''
+        organization = organization or {}
+        network = network or {}
+        failure = {
+            "stage": stage,
+            "organizationId": organization.get("id",network.get("organizationId")),
+            "organization": organization.get("name",network.get("organization")),
+            "networkId": network.get("id"),
+            "network": network.get("name"),
+            "error": str(error),
+            }
+        self.current_operation["failures"].append(failure)
+        # networks whose discovery failed have a failed result (their SSID is not known)
+        if stage == "discovery" and self.output:
+            self.output.write(merakitoolkitoutput.discovery_result(failure))
+
+
+    def diagnostics(self):
+        '''
+        context manager sending the messages printed by an operation to standard error
+        when the machine-readable results are written to standard output (output setting without output file)
+        '''
+        settings = self.current_operation["settings"]
+        if settings and settings["output"] and settings["output_file"] in (None,"-"):
+            return contextlib.redirect_stdout(sys.stderr)
+        return contextlib.nullcontext()
+
+
+    def report_result(self,network,action,outcome,latency):
+        '''
+        write the result of a network to the machine-readable output (if enabled)
+        '''
+        if self.output:
+            self.output.write(merakitoolkitoutput.network_result(network,action,outcome,latency))
+
+
+    def start_stats(self):
+        '''
+        start collecting the statistics of the operation if requested (summary, statistics file or metrics file)
+        '''
+        settings = self.current_operation["settings"]
+        if self.stats is None and (settings["stats"] or settings["stats_file"] or settings["metrics_file"]):
+            self.stats = merakitoolkitstats.OperationStats()
+
+
+    def report_stats(self,success=True):
+        '''
+        print the statistics of the operation and/or write them to the statistics and metrics files (if enabled)
+        the run is successful in metrics if the operation is completed (<success>) without failures
+        '''
+        settings = self.current_operation["settings"]
+        if self.stats is None:
+            return
+        if settings["metrics_file"]:
+            try:
+                self.stats.write_prometheus(
+                    settings["metrics_file"],
+                    success and not self.current_operation["failures"]
+                    )
+            except Exception as err: # pylint: disable=broad-except
+                print("An error occurred while writing the metrics file: ",err)
+        if settings["stats"]:
+            print(self.stats.summary())
+        if settings["stats_file"]:
+            try:
+                self.stats.write(settings["stats_file"])
+            except Exception as err: # pylint: disable=broad-except
+                print("An error occurred while writing the statistics file: ",err)
 
 
     async def pskchangeasync(self):
@@ -273,48 +817,250 @@ class MerakiToolkit():
         Change Pre Shared Key for an SSID in specified network name in organizations
         '''
 
+        # Verify that a network matches the network names and tags of a job
+        def network_matches(network,job):
+            if (network["name"] not in job["network"]) and ("ALL" not in job["network"]):
+                return False
+            # verify that at least one (or all) of the TAGs is in the list of network tags
+            # networks can be already filtered by Meraki dashboard, this is only a safeguard
+            if job["tags"]:
+                tags_match = all if job["tags_filter"] == "all" else any
+                if not tags_match(tag in network["tags"] for tag in job["tags"]):
+                    return False
+            return True
+
         # Coroutine to process Networks in an organization for PSK change
-        # returns data of a network to process (if parameters has a match)
-        # returns None if there is no match -> needs to explicitly cleanup later 'None' entries from networks list
-        async def process_network(organization,network,settings):
-            if (network["name"] not in settings["network"]) and ("ALL" not in settings["network"]):
-                return None
-            # verify that at least one of the TAGs is in the list of network tags
-            if settings["tags"]:
-                if not any( tag in settings["tags"] for tag in network["tags"]):
-                    return None
+        # SSIDs of the network are retrieved once and matched with the SSID of every job
+        # returns the list of network data to process, one for each job with a match (empty if there is no match)
+        async def process_network(organization,network,jobs,settings):
+            jobs_matching = [x for x in jobs if network_matches(network,settings["jobs"][x])]
+            if not jobs_matching:
+                return []
+            # networks without a wireless product (camera, appliance, etc) have no SSIDs, skip them before
+            # spending an API call, unless explicitly requested (networks without productTypes are always evaluated)
+            if not settings["all_product_types"] and "wireless" not in network.get("productTypes",["wireless"]):
+                return []
+            # the inventory cache only skips the networks without the SSIDs of the jobs, SSIDs can be renamed or
+            # moved since cached: positions and PSKs to change are always taken from the SSIDs on Meraki dashboard
+            if self.cache:
+                cached_ssids = self.cache.get_ssids(network["id"])
+                if cached_ssids is not None:
+                    if settings["verbose"]>=2:
+                        print(f"CACHE: getting SSIDs for Network: {network['name']}")
+                    ssid_names = [settings["jobs"][x]["ssid"] for x in jobs_matching]
+                    if not any(x["name"] in ssid_names for x in cached_ssids):
+                        return []
             # retrieve SSIDs of the evaluated network
-            # uses awaitable method that will be leveraged later by asyncio.gather()
             network_ssids = await self.get_network_wireless_ssids(network)
             # some networks has no SSIDs (camera,appliance,etc) so we skip those
             if not network_ssids:
-                return None
-            network_to_process = None
-            for ssidposition in range(len(network_ssids)): # pylint: disable=consider-using-enumerate
-                if settings["ssid"] == network_ssids[ssidposition]["name"]: # SSID is found
-                    # create dictionary to collect all necessary information
-                    network_to_process = {}
-                    network_to_process["organization"] = organization["name"]
-                    network_to_process["name"] = network["name"]
-                    network_to_process["id"] = network["id"]
-                    network_to_process["ssidPosition"] = str(ssidposition)
-                    network_to_process["ssidName"] = network_ssids[ssidposition]["name"]
-                    network_to_process["wpaEncryptionMode"] = network_ssids[ssidposition]["wpaEncryptionMode"]
-                    break # SSID was found -> exit the loop
-            return network_to_process
+                return []
+            networks_to_process = []
+            # SSID positions already changed by a previous job
+            ssids_processed = {}
+            for job in jobs_matching:
+                for ssidposition in range(len(network_ssids)): # pylint: disable=consider-using-enumerate
+                    if settings["jobs"][job]["ssid"] == network_ssids[ssidposition]["name"]: # SSID is found
+                        if ssidposition in ssids_processed:
+                            print(f"PSK change : SSID {network_ssids[ssidposition]['name']} of network {network['name']} "
+                                  f"is already changed by job {ssids_processed[ssidposition]+1}, job {job+1} skipped")
+                            break
+                        ssids_processed[ssidposition] = job
+                        # create dictionary to collect all necessary information
+                        network_to_process = {}
+                        network_to_process["organization"] = organization["name"]
+                        network_to_process["organizationId"] = organization["id"]
+                        network_to_process["name"] = network["name"]
+                        network_to_process["id"] = network["id"]
+                        network_to_process["tags"] = network.get("tags") or []
+                        network_to_process["ssidPosition"] = str(ssidposition)
+                        network_to_process["ssidName"] = network_ssids[ssidposition]["name"]
+                        network_to_process["wpaEncryptionMode"] = network_ssids[ssidposition]["wpaEncryptionMode"]
+                        network_to_process["job"] = job
+                        # PSK of the job or of the network SSID (network PSK policy): generated or of the resumed operation
+                        if psks is None:
+                            network_to_process["passphrase"] = settings["jobs"][job]["passphrase"]
+                        else:
+                            network_to_process["passphrase"] = passphrases.get(
+                                merakitoolkitjournal.network_key(network_to_process)
+                                ) or psks.generate()
+                        # SSIDs already with their PSK (eg: operation repeated after a partial failure)
+                        # are not updated again
+                        network_to_process["pskUnchanged"] = \
+                            network_ssids[ssidposition].get("psk") == network_to_process["passphrase"]
+                        networks_to_process.append(network_to_process)
+                        break # SSID was found -> exit the loop
+            return networks_to_process
+
+        # Coroutine to queue to the update workers pool a discovered SSID to change
+        # (when update is None the operation is simulated), SSIDs already changed by the resumed operation are skipped
+        # results of skipped and simulated SSIDs are known at discovery and written immediately
+        async def dispatch_network(network_to_process,settings,update,latency):
+            if network_to_process["pskUnchanged"]:
+                if settings["verbose"]>=2:
+                    print(f"SKIP: PSK already set for network: {network_to_process['name']}")
+                self.report_result(network_to_process,"skip","unchanged",latency)
+            elif resumed and resumed["done"].get(merakitoolkitjournal.network_key(network_to_process)):
+                if settings["verbose"]>=2:
+                    print(f"SKIP: PSK already changed by the resumed operation for network: {network_to_process['name']}")
+                self.report_result(network_to_process,"skip","resumed",latency)
+                notify(network_to_process)
+            elif update is None:
+                self.report_result(network_to_process,"update","dryrun",latency)
+                notify(network_to_process)
+            else:
+                await update.put(network_to_process,network_to_process["passphrase"])
+
+        # Coroutine to discover a Network and queue immediately its SSIDs to change (dispatch_network),
+        # updates run while other networks are discovered
+        # returns process_network result
+        # an unexpected error is a failure of the network, other networks are processed
+        async def discover_network(organization,network,jobs,settings,update):
+            started = time.monotonic()
+            try:
+                networks_to_process = await process_network(organization,network,jobs,settings)
+            except Exception as err: # pylint: disable=broad-except
+                print(f"An error occurred while processing network {network.get('name')}: ",err)
+                self.record_failure("discovery",err,organization=organization,network=network)
+                return []
+            latency = time.monotonic() - started
+            for network_to_process in networks_to_process:
+                if self.journal:
+                    self.journal.target(network_to_process)
+                await dispatch_network(network_to_process,settings,update,latency)
+            return networks_to_process
+
+        # Coroutines of the update workers pool: update the SSIDs of a network (or of a batch of networks)
+        # and write their results as soon as they are known
+        async def update_network(network,passphrase):
+            started = time.monotonic()
+            result = await self.update_network_wireless_ssid(network,passphrase)
+            self.report_result(network,"update","success" if result else "failed",time.monotonic() - started)
+            network["updated"] = result
+            if self.journal:
+                self.journal.update(network,result)
+            if result:
+                notify(network)
+            return result
+
+        async def update_networks_batch(organization_id,updates):
+            started = time.monotonic()
+            results = await self.update_network_wireless_ssids_batch(organization_id,updates)
+            latency = time.monotonic() - started
+            for (network,_),result in zip(updates,results):
+                self.report_result(network,"update","success" if result else "failed",latency)
+                network["updated"] = result
+                if self.journal:
+                    self.journal.update(network,result)
+                if result:
+                    notify(network)
+            return results
+
+        # Schedule the notification email of a changed SSID (notify setting): the email of its job when the first
+        # SSID of the job is changed, or the email of its network (network notify mode)
+        # emails are rendered and delivered by the SMTP connections pool while the other SSIDs are updated
+        # a notification is marked as notified only when sent, failed ones are sent again by send_email_psk
+        def notify(network):
+            if smtp is None:
+                return
+            key = self.notification_key(network)
+            if key in self.current_operation["notified"] or key in notifying or not self.notification_recipients(network):
+                return
+            notifying.add(key)
+            notifications.append(asyncio.create_task(notify_network(network,key)))
+
+        async def notify_network(network,key):
+            if settings["notify_mode"] == "network":
+                sent = await self.send_email_network_async(network,smtp)
+            else:
+                sent = await self.send_email_job_async(settings["jobs"][network["job"]],smtp)
+            notifying.discard(key)
+            if sent:
+                self.current_operation["notified"].add(key)
+                if self.journal:
+                    self.journal.notified(key)
+
+        # Coroutine to process an Organization for PSK change
+        # collects the list of networks (bounded by semaphore) and starts immediately the SSID lookups
+        # for its networks, without waiting for the other organizations to return their networks list
+        # networks are queued to the discovery workers pool (discover_network) along with the update workers pool
+        # networks are listed once for all the jobs of the organization: they are filtered by tags
+        # on Meraki dashboard only when all jobs share the same tags filter
+        async def process_organization(organization,jobs,settings,semaphore,discovery,update): # pylint: disable=too-many-arguments disable=too-many-positional-arguments
+            tags_filters = {
+                (tuple(settings["jobs"][x]["tags"] or []),settings["jobs"][x]["tags_filter"]) for x in jobs
+                }
+            if len(tags_filters) == 1:
+                tags,tags_filter = tags_filters.pop()
+            else:
+                tags,tags_filter = None,"any"
+            async with semaphore:
+                if self.cache and settings["incremental"]:
+                    await self.refresh_organization_inventory(organization)
+                networks = await self.get_organization_networks(organization,list(tags) or None,tags_filter)
+            # organization networks could not be retrieved (error already reported)
+            if not networks:
+                return
+            if self.stats:
+                self.stats.count("networks_discovered",len(networks))
+            for network in networks:
+                await discovery.put(organization,network,jobs,settings,update)
 
         settings = self.current_operation["settings"]
+        # state of the interrupted operation to resume (merakitoolkitjournal.load_journal)
+        resumed = None
+        # SMTP connections pool and delivery tasks of the notifications sent during the operation (notify setting)
+        smtp = None
+        notifications = []
+        # keys of the notifications in delivery (see notification_key)
+        notifying = set()
+        # generator of the PSKs of the network SSIDs (network PSK policy) and PSKs of the resumed operation by network key
+        psks = None
+        passphrases = {}
+        # messages printed while the results are written to the standard output are sent to standard error
+        diagnostics = contextlib.ExitStack()
 
         try:
             if settings is None:
                 raise ValueError("PSK change : No operation has been defined")
+            # a resumed operation applies the PSK of the interrupted operation (eg: randomly generated)
+            if settings["resume"]:
+                resumed = merakitoolkitjournal.load_journal(settings["resume"])
+                merakitoolkitjournal.check_jobs(resumed,settings["jobs"])
+                for job,journaled in zip(settings["jobs"],resumed["jobs"]):
+                    job["passphrase"] = journaled["passphrase"]
+                self.current_operation["notified"].update(resumed["notified"])
+                passphrases = {merakitoolkitjournal.network_key(x): x.get("passphrase") for x in resumed["targets"]}
             # verify that mandatory attributes are present, otherwise raise a ValueError exception
-            if settings["organization"] is None:
-                raise ValueError("PSK change : Organization input list is empty")
-            if settings["network"] is None:
-                raise ValueError("PSK change : Networks input list is empty")
-            if (settings["passphrase"] is None) or (len(settings["passphrase"])<8):
-                raise ValueError("PSK change : PSK input is empty or less than 8 characters")
+            for job in settings["jobs"]:
+                if job["organization"] is None:
+                    raise ValueError("PSK change : Organization input list is empty")
+                if job["network"] is None:
+                    raise ValueError("PSK change : Networks input list is empty")
+                if job["ssid"] is None:
+                    raise ValueError("PSK change : SSID input is empty")
+                if (job["passphrase"] is None) or (len(job["passphrase"])<8):
+                    raise ValueError("PSK change : PSK input is empty or less than 8 characters")
+            if settings["psk_policy"] not in merakitoolkitsupport.PSK_POLICIES:
+                raise ValueError(f"PSK change : PSK policy must be one of {', '.join(merakitoolkitsupport.PSK_POLICIES)}")
+            if settings["psk_policy"] == "network":
+                if settings["notify"] and settings["notify_mode"] == "job" and [x for x in settings["jobs"] if x["email"]]:
+                    raise ValueError("PSK change : network PSK policy requires the network notify mode for emails")
+                psks = merakitoolkitsupport.PSKGenerator()
+                # PSKs of the resumed operation are not generated again
+                psks.generated.update(x for x in passphrases.values() if x)
+            if settings["notify_mode"] not in merakitoolkitnotify.NOTIFY_MODES:
+                raise ValueError(f"PSK change : notify mode must be one of {', '.join(merakitoolkitnotify.NOTIFY_MODES)}")
+            if settings["notify_mode"] == "network" and not settings["recipients"]:
+                raise ValueError("PSK change : network notify mode requires the recipients of the networks")
+            # concurrency and rate limit of 0 would stop the workers pools and the rate limiter
+            for setting in ["org_concurrency","concurrency","update_concurrency","rate_limit"]:
+                if not isinstance(settings[setting],int) or settings[setting] < 1:
+                    raise ValueError(f"PSK change : {setting} must be a positive integer")
+            if not 1 <= settings["action_batch_size"] <= merakitoolkitratelimit.DEFAULT_ACTION_BATCH_SIZE:
+                raise ValueError(
+                    f"PSK change : action batch size must be between 1 and {merakitoolkitratelimit.DEFAULT_ACTION_BATCH_SIZE}"
+                    )
 
             # network_to_process will contain the list of networks to apply the PSK change
             networks_to_process = []
@@ -322,161 +1068,451 @@ class MerakiToolkit():
             # flag to set to save relevant data for other processes
             data_has_changed = False
 
+            # collect calls statistics to print and/or save at the end of the operation
+            self.start_stats()
+
+            # journal the networks to process and the updates (if enabled) to resume the operation if interrupted,
+            # a resumed operation continues its journal
+            if settings["resume"]:
+                self.journal = merakitoolkitjournal.Journal(settings["resume"],resume=True)
+            elif settings["journal"]:
+                self.journal = merakitoolkitjournal.Journal(settings["journal"])
+                self.journal.start(settings["jobs"])
+
+            # notification emails are delivered during the updates (if enabled)
+            if settings["notify"]:
+                smtp = self.smtp_pool()
+                if settings["notify_mode"] == "network":
+                    self.renderer = merakitoolkitnotify.EmailRenderer(settings["render_processes"])
+
+            # stream the result of each network (if enabled) to a file or to the standard output
+            if settings["output"]:
+                self.output = merakitoolkitoutput.ResultWriter(settings["output"],settings["output_file"])
+                diagnostics.enter_context(self.diagnostics())
+
+            # Meraki dashboard calls of this operation share the same rate limiter and retry policy
+            self.ratelimiter = merakitoolkitratelimit.OrganizationRateLimiter(rate=settings["rate_limit"])
+            self.retrypolicy = merakitoolkitratelimit.RetryPolicy(
+                max_attempts=settings["max_attempts"],
+                backoff=settings["retry_backoff"],
+                deadline=settings["call_deadline"]
+                )
+
+            # open the local inventory cache (if enabled) to skip the discovery of known Organizations/Networks/SSIDs
+            if settings["cache"]:
+                self.cache = merakitoolkitcache.InventoryCache(
+                    self.apikey,
+                    path=settings["cache_file"],
+                    ttl=settings["cache_ttl"],
+                    refresh=settings["refresh_cache"],
+                    incremental=settings["incremental"]
+                    )
+
             # Create context manager for the async mereaki.aio.AsyncDashboardAPI object (necessary to ensure a proper closure)
             # Standard in MerakiToolKit is to store context manager variable in self.dashboard
             # connect() method is used to aggregate all settings centrally
+            started = time.monotonic()
             async with self.connect() as self.dashboard:
                 # async tasks collection:
                 # collect organizations->collect networks in organization->collect SSID->add item to list of networks to process
 
-                # async collect organizations (create task->await task)
-                task_organizations = asyncio.create_task(self.get_organizations())
-                organizations = await task_organizations
-                # process_networks_tasks -> list of coroutines for networks to process
-                process_networks_tasks = []
-                # in each organization retrieve list of networks
+                # limit the number of organizations whose networks are listed at the same time
+                organizations_semaphore = asyncio.Semaphore(settings["org_concurrency"])
+                # streaming pipeline: discovery workers pool -> update workers pool
+                # bounded pool of workers updating the SSIDs (instead of a coroutine per network), not used in dryrun
+                # in action batches mode updates are grouped by organization in batches executed by Meraki dashboard
+                if settings["dryrun"]:
+                    update = None
+                elif settings["action_batches"]:
+                    update = merakitoolkitratelimit.BatchPool(
+                        update_networks_batch,
+                        settings["action_batch_size"],
+                        settings["update_concurrency"],
+                        key=lambda network,passphrase: network["organizationId"],
+                        group_workers=merakitoolkitratelimit.ACTION_BATCH_CONCURRENCY
+                        )
+                else:
+                    update = merakitoolkitratelimit.WorkerPool(
+                        update_network,
+                        settings["update_concurrency"],
+                        maxsize=settings["update_concurrency"]*2
+                        )
+                # bounded pool of workers looking up the SSIDs of networks (instead of a coroutine per network)
+                discovery = merakitoolkitratelimit.WorkerPool(
+                    discover_network,
+                    settings["concurrency"],
+                    maxsize=settings["concurrency"]*2
+                    )
+                # a resumed operation whose discovery was completed processes the networks of its journal
+                # instead of discovering them again
+                if resumed and resumed["discovered"]:
+                    organizations = []
+                    for network_to_process in resumed["targets"]:
+                        networks_to_process.append(network_to_process)
+                        await dispatch_network(network_to_process,settings,update,0)
+                else:
+                    # async collect organizations (create task->await task)
+                    task_organizations = asyncio.create_task(self.get_organizations())
+                    organizations = await task_organizations
+                # process_organizations_tasks -> list of coroutines for organizations to process
+                process_organizations_tasks = []
+                organizations_processed = []
                 for organization in organizations:
-                    # Verify that the current organization is in the list of organizations to process
-                    if organization["name"] in settings["organization"] or "ALL" in settings["organization"]:
-                        # async collect list of networks (create task->await task)
-                        task_networks = asyncio.create_task(self.get_organization_networks(organization))
-                        networks = await task_networks
-                        # create a coroutine to process each network and add it to process_networks_tasks list
-                        for network in networks:
-                            process_networks_tasks.append(process_network(organization,network,settings))
-
-                # Collection happened through an iteration with async awaits
-                # here we process all coroutines collected asynchronously with asyncio.gather
+                    # Verify that the current organization is in the list of organizations of at least one job
+                    jobs = [
+                        x for x,job in enumerate(settings["jobs"])
+                        if organization["name"] in job["organization"] or "ALL" in job["organization"]
+                        ]
+                    if jobs:
+                        organizations_processed.append(organization)
+                        process_organizations_tasks.append(
+                            process_organization(organization,jobs,settings,organizations_semaphore,discovery,update)
+                            )
+
+                # all organizations are processed concurrently with asyncio.gather
                 # asyncio.gather -> returns values when all coroutines are completed
-                current_networks_to_process = await asyncio.gather(*process_networks_tasks)
-                # Clean current networks list of the null entries and keep only networks to process
-                # extend the final networks_to_process list with the interesting networks for the current org
-                networks_to_process.extend([x for x in current_networks_to_process if x is not None])
+                # an unexpected error is a failure of the organization, other organizations are processed
+                results = await asyncio.gather(*process_organizations_tasks,return_exceptions=True)
+                for organization,result in zip(organizations_processed,results):
+                    if isinstance(result,Exception):
+                        print(f"An error occurred while processing organization {organization['name']}: ",result)
+                        self.record_failure("organization",result,organization=organization)
+                # discovery results are in order of completion: sort them for a consistent report
+                for networks in await discovery.join():
+                    networks_to_process.extend(networks)
+                networks_to_process.sort(key=lambda x: (x["organization"],x["name"],x["job"]))
+                discovered = time.monotonic()
+                # a discovery with failures is repeated by a resumed operation
+                if self.journal and not [x for x in self.current_operation["failures"] if x["stage"] != "update"]:
+                    self.journal.discovered()
 
+                # Execution code : at this point data has been changed on Meraki Cloud (or simulated with dryrun)
+                if update is None:
+                    data_has_changed = True
+                else:
+                    updates = await update.join()
+                    data_has_changed = True in updates
+                # networks changed before the resumed operation was interrupted (eg: notification not sent)
+                if resumed and True in resumed["done"].values():
+                    data_has_changed = True
+
+                # statistics of the run: updates running during the discovery are accounted in the discovery phase
+                # networks failed in discovery (SSIDs not retrieved) or in update
+                if self.stats:
+                    self.stats.count("networks_matched",len(networks_to_process))
+                    self.stats.count("networks_skipped",len([x for x in networks_to_process if x["pskUnchanged"]]))
+                    failed = len([x for x in self.current_operation["failures"] if x["stage"] == "discovery"])
+                    if update is not None:
+                        self.stats.count("networks_updated",updates.count(True))
+                        failed += updates.count(False)
+                    self.stats.count("networks_failed",failed)
+                    self.stats.set_phase("discovery",discovered - started)
+                    self.stats.set_phase("update",time.monotonic() - discovered)
 
+                # notifications still in delivery at the end of the updates
+                if notifications:
+                    updated = time.monotonic()
+                    await asyncio.gather(*notifications)
+                    if self.stats:
+                        self.stats.set_phase("email",time.monotonic() - updated)
 
-                # Execution code : at this point data is being changed (or simulated) on Meraki Cloud
-                # NOTE : this portion could be extracted into a standalone executor method for multiple tasks
-                if settings["dryrun"] or settings["verbose"]>=1:
+                # the report is replaced by the results when they are written to the standard output
+                if (settings["dryrun"] or settings["verbose"]>=1) and not (self.output and self.output.to_stdout):
                     if settings["dryrun"]:
-                        data_has_changed = True
                         print("\033[91m","\nDRYRUN Enabled: Changes below will not be applied")
                         print("\033[0m","-"*110)
                     print(f'{"Organization:":<25} {"Network:":<45} {"SSID:":<20} {"PSK:":<20}')
                     for network in networks_to_process:
                         print("-"*110)
-                        print(f"{network['organization']:<25} {network['name']:<45} {network['ssidName']:<20} {settings['passphrase']:<20}") # pylint: disable=line-too-long
-                else:
-                    update_networks_tasks = []
-                    for network in networks_to_process:
-                        update_networks_tasks.append(self.update_network_wireless_ssid(network,settings["passphrase"]))
-                        #data_has_changed = self.update_network_wireless_ssid(network,settings["passphrase"])
-                    data_has_changed = True in await asyncio.gather(*update_networks_tasks)
+                        print(f"{network['organization']:<25} {network['name']:<45} {network['ssidName']:<20} {network['passphrase']:<20}{' (already set)' if network['pskUnchanged'] else ''}") # pylint: disable=line-too-long
+
+                # summary of the failures of organizations and networks (results of the others are not affected)
+                failures = self.current_operation["failures"]
+                if failures and not (self.output and self.output.to_stdout):
+                    print(f"\nPSK change : {len(failures)} failures, the other networks were processed")
+                    print(f'{"Stage:":<13} {"Organization:":<25} {"Network:":<45} {"Error:":<20}')
+                    for failure in failures:
+                        print("-"*110)
+                        print(f"{failure['stage']:<13} {str(failure['organization'] or failure['organizationId']):<25} "
+                              f"{str(failure['network'] or ''):<45} {failure['error']}")
 
                 # save last operation data only if a change (real or simulated) happened
                 if data_has_changed:
                     self.current_operation["networks_to_process"] = networks_to_process
                     self.current_operation["success"] = True
 
+            # with notifications the statistics are reported once by send_email_psk, after the last emails
+            if not settings["notify"]:
+                self.report_stats()
+
         except Exception as err: # pylint: disable=broad-except
             print("An error occurred while running PSK change: ",err)
+            self.report_stats(success=False)
             sys.exit(2)
+        finally:
+            # write retrieved inventory to the local cache
+            if self.cache:
+                self.cache.close()
+                self.cache = None
+            if self.output:
+                self.output.close()
+                self.output = None
+            if smtp:
+                smtp.close()
+            if self.renderer:
+                self.renderer.close()
+                self.renderer = None
+            if self.journal:
+                self.journal.close()
+                self.journal = None
+            diagnostics.close()
 
 
 
     def send_email_psk(self):
-        ''' send email for PSK change notification'''
+        '''
+        send email for PSK change notification (one email for each job with recipients and changed networks,
+        or for each network SSID with recipients in network notify mode, failed updates excluded)
+        jobs and networks already notified during the operation (notify setting) are skipped
+        statistics of the operation are reported at the end, with the emails delivery
+        '''
+
+        with self.diagnostics():
+            if not self.current_operation["success"]:
+                print("No Network changes -> Email discarded")
+                self.report_stats()
+                return False
+
+            settings = self.current_operation["settings"]
+            self.start_stats()
+            started = time.monotonic()
+            # messages of the jobs are delivered one after the other on the same SMTP connection
+            smtp = self.smtp_pool()
+            try:
+                if settings["notify_mode"] == "network":
+                    networks = [
+                        x for x in self.current_operation["networks_to_process"]
+                        if x.get("updated",True) and self.notification_key(x) not in self.current_operation["notified"]
+                        and self.notification_recipients(x)
+                        ]
+                    self.send_email_networks(networks,smtp)
+                else:
+                    # jobs with at least one SSID changed (or already with the PSK), failed updates are not notified
+                    jobs_changed = {x["job"] for x in self.current_operation["networks_to_process"] if x.get("updated",True)}
+                    for job in sorted(jobs_changed - self.current_operation["notified"]):
+                        if settings["jobs"][job]["email"] and self.send_email_job(settings["jobs"][job],smtp):
+                            self.current_operation["notified"].add(job)
+            finally:
+                smtp.close()
+            if self.stats:
+                self.stats.set_phase("email",time.monotonic() - started)
+            self.report_stats()
+            return True
+
+
+    def notification_key(self,network):
+        '''
+        returns the key of the notification of a changed network SSID in current_operation["notified"]:
+        its job or its network key (network notify mode)
+        '''
+        if self.current_operation["settings"]["notify_mode"] == "network":
+            return merakitoolkitjournal.network_key(network)
+        return network["job"]
+
+
+    def notification_recipients(self,network):
+        '''
+        returns the recipients of the notification of a changed network SSID:
+        the recipients of its job or of its network (network notify mode)
+        '''
+        settings = self.current_operation["settings"]
+        if settings["notify_mode"] == "network":
+            return merakitoolkitnotify.network_recipients(settings["recipients"],network)
+        return settings["jobs"][network["job"]]["email"]
+
+
+    def smtp_pool(self):
+        '''
+        returns a pool of SMTP connections (merakitoolkitsmtp.SMTPPool) with the SMTP settings of the operation
+        '''
+        settings = self.current_operation["settings"]
+        return merakitoolkitsmtp.SMTPPool(
+            settings["smtp_server"],
+            settings["smtp_port"],
+            mode=settings["smtp_mode"],
+            user=settings["smtp_user"],
+            password=settings["smtp_pass"],
+            connections=settings["smtp_connections"],
+            max_attempts=settings["smtp_attempts"]
+            )
+
+
+    def send_email_job(self,job,smtp):
+        ''' send email for PSK change notification of a job and return the outcome (smtp is a merakitoolkitsmtp.SMTPPool)'''
+        msg_root = self.build_email_job(job)
+        # SMTP delivery time includes connection, login and retries, size is the whole message
+        try:
+            with self.measure("email:smtp") as sizes:
+                smtp.send(msg_root)
+                if self.stats:
+                    sizes["sent"] = msg_root.as_bytes()
+            return True
+        except Exception as err: # pylint: disable=broad-except
+            print("An error occurred while sending the email: ",err)
+            return False
+
+
+    async def send_email_job_async(self,job,smtp):
+        '''
+        send email for PSK change notification of a job and return the outcome, without blocking the event loop
+        (smtp is a merakitoolkitsmtp.SMTPPool)
+        '''
+        msg_root = self.build_email_job(job)
+        try:
+            with self.measure("email:smtp") as sizes:
+                await smtp.send_async(msg_root)
+                if self.stats:
+                    sizes["sent"] = msg_root.as_bytes()
+            return True
+        except Exception as err: # pylint: disable=broad-except
+            print("An error occurred while sending the email: ",err)
+            return False
+
 
-        if not self.current_operation["success"]:
-            print("No Network changes -> Email discarded")
+    def send_email_networks(self,networks,smtp):
+        '''
+        send email for PSK change notification of each network to its recipients (smtp is a merakitoolkitsmtp.SMTPPool)
+        emails are rendered at the same time by the processes of the renderer, while they are delivered in order
+        '''
+        settings = self.current_operation["settings"]
+        renderer = merakitoolkitnotify.EmailRenderer(settings["render_processes"])
+        try:
+            renderings = []
+            for network in networks:
+                job = settings["jobs"][network["job"]]
+                images = merakitoolkitsupport.template_images(job["emailtemplate"])
+                renderings.append((network,images,renderer.submit(*self.render_arguments(job,network,images))))
+            for network,images,rendering in renderings:
+                try:
+                    with self.measure("email:render"):
+                        rendered = rendering.result()
+                    msg_root = self.compose_email(
+                        settings["jobs"][network["job"]],self.notification_recipients(network),rendered,images,network
+                        )
+                    with self.measure("email:smtp") as sizes:
+                        smtp.send(msg_root)
+                        if self.stats:
+                            sizes["sent"] = msg_root.as_bytes()
+                    self.current_operation["notified"].add(self.notification_key(network))
+                except Exception as err: # pylint: disable=broad-except
+                    print(f"An error occurred while sending the email of network {network['name']}: ",err)
+        finally:
+            renderer.close()
+
+
+    async def send_email_network_async(self,network,smtp):
+        '''
+        send email for PSK change notification of a network to its recipients and return the outcome,
+        rendered by the processes of the renderer and delivered without blocking the event loop
+        (smtp is a merakitoolkitsmtp.SMTPPool)
+        '''
+        settings = self.current_operation["settings"]
+        job = settings["jobs"][network["job"]]
+        try:
+            with self.measure("email:template_images"):
+                images = merakitoolkitsupport.template_images(job["emailtemplate"])
+            with self.measure("email:render"):
+                rendered = await self.renderer.render(*self.render_arguments(job,network,images))
+            msg_root = self.compose_email(job,self.notification_recipients(network),rendered,images,network)
+            with self.measure("email:smtp") as sizes:
+                await smtp.send_async(msg_root)
+                if self.stats:
+                    sizes["sent"] = msg_root.as_bytes()
+            return True
+        except Exception as err: # pylint: disable=broad-except
+            print(f"An error occurred while sending the email of network {network['name']}: ",err)
             return False
 
+
+    def render_arguments(self,job,network,images):
+        '''
+        returns the arguments of merakitoolkitnotify.render_email for the notification of a network of a job
+        (images are the template images of merakitoolkitsupport.template_images)
+        '''
+        return (
+            job["emailtemplate"],
+            job["ssid"],
+            network["passphrase"],
+            [x.replace(".","") for x,_ in images],
+            network["name"],
+            self.current_operation["settings"]["template_cache"]
+            )
+
+
+    def build_email_job(self,job):
+        ''' returns the email for PSK change notification of a job (SSID, PSK, recipients and template)'''
+
         settings = self.current_operation["settings"]
+        with self.measure("email:generate_email_body"):
+            msg_text = merakitoolkitsupport.generate_email_body(
+                "templatetxt.j2",
+                job["emailtemplate"],
+                job["ssid"],
+                job["passphrase"],
+                bytecode_cache=settings["template_cache"]
+                )
+
+        # Generate QR Code image to distribute in the email (in memory, the same PSK reuses the same image)
+        with self.measure("email:generate_qrcode"):
+            qrcode = merakitoolkitsupport.qrcode_png(job["ssid"],job["passphrase"])
+
+        # Gather the images of the template folder, read and encoded once (again only when an image file is modified)
+        with self.measure("email:template_images"):
+            images = merakitoolkitsupport.template_images(job["emailtemplate"])
+        # generate the list of filenames without dots, to be used in jinja2 template
+        imagelistj2 = [x.replace(".","") for x,_ in images] + ["qrcodepng"]
+
+        with self.measure("email:generate_email_body"):
+            msg_html = merakitoolkitsupport.generate_email_body(
+                "templatehtml.j2",
+                job["emailtemplate"],
+                job["ssid"],
+                job["passphrase"],
+                imagelistj2,
+                bytecode_cache=settings["template_cache"]
+                )
+
+        return self.compose_email(job,job["email"],(msg_text,msg_html,qrcode),images)
+
+
+    def compose_email(self,job,recipients,rendered,images,network=None): # pylint: disable=too-many-arguments disable=too-many-positional-arguments
+        '''
+        returns the email for PSK change notification of a job (or of a network of the job) to <recipients>
+        rendered is the text body, the HTML body and the QR code (merakitoolkitnotify.render_email)
+        images are the template images of merakitoolkitsupport.template_images
+        '''
 
+        settings = self.current_operation["settings"]
+        msg_text,msg_html,qrcode = rendered
         # Create the root MIME message
         msg_root = MIMEMultipart("related")
         msg_root['From']=settings["smtp_sender"]
-        msg_root['Bcc']=",".join(settings["email"]) # for multiple email recipients
-        msg_root['Subject']=settings["ssid"] + " PSK changed " + date.today().strftime("%d/%m/%Y")
+        msg_root['Bcc']=",".join(recipients) # for multiple email recipients
+        subject = job["ssid"] + " PSK changed " + date.today().strftime("%d/%m/%Y")
+        msg_root['Subject']=subject + " - " + network["name"] if network else subject
         msg_root.preamble = 'This is a multi-part message in MIME format.'
 
         # Attach text message part
         msg_alternative = MIMEMultipart("alternative")
         msg_root.attach(msg_alternative)
-        msg_text = merakitoolkitsupport.generate_email_body(
-            "templatetxt.j2",
-            settings["emailtemplate"],
-            settings["ssid"],
-            settings["passphrase"]
-            )
-        msg_text_mime = MIMEText(msg_text,"plain")
-        msg_alternative.attach(msg_text_mime)
-
-        # Generate QR Code image to distribute in the email
-        merakitoolkitsupport.generate_qrcode(settings["ssid"],settings["passphrase"],settings["emailtemplate"])
-
-        # Gather the list of images filenames
-        imagelist = [x for x in os.listdir(settings["emailtemplate"]) if x.lower().endswith(("png","bmp","jpg","gif"))]
-        # generate the same list but with filenames without dots, to be used in jinja2 template
-        imagelistj2 = [x.replace(".","") for x in imagelist]
-
-        # image will be a tuple with the real filename from imagelist and the dot-stripped version from imagelistj2
-        # real filename will be used to attach the image file, dot-stripped name to create he reference ID in the email
-        for image in zip(imagelist,imagelistj2):
-            # Open each image in the template folder and encode it in base64 to attach to the email
-            try:
-                with open(f'{settings["emailtemplate"]}/{image[0]}', 'rb') as imagefile:
-                    # set attachment mime and file name, the image type is png
-                    mime = MIMEBase('image', image[0][-3:], filename=image[0])
-                    # add required header data:
-                    mime.add_header('Content-Disposition', 'attachment', filename=image[0])
-                    mime.add_header('X-Attachment-Id', image[0])
-                    mime.add_header('Content-ID', f'<{image[1]}>')
-                    # read attachment file content into the MIMEBase object
-                    mime.set_payload(imagefile.read())
-                    # encode with base64
-                    encoders.encode_base64(mime)
-                    # add MIMEBase object to MIMEMultipart object
-                    msg_root.attach(mime)
-            except Exception as err: # pylint: disable=broad-except
-                print("An error occurred while opening logo image: ",err)
-
-        msg_html = merakitoolkitsupport.generate_email_body(
-            "templatehtml.j2",
-            settings["emailtemplate"],
-            settings["ssid"],
-            settings["passphrase"],
-            imagelistj2
-            )
-        msg_html_mime = MIMEText(msg_html,"html")
-        msg_alternative.attach(msg_html_mime)
+        msg_alternative.attach(MIMEText(msg_text,"plain"))
 
-        context = ssl.create_default_context()
+        # Attach the template images and the QR code
+        # real filename is used to attach the image file, dot-stripped name to create the reference ID in the email
+        for _,image in images:
+            msg_root.attach(image)
+        msg_root.attach(merakitoolkitsupport.image_attachment("qrcode.png",qrcode))
 
-        if settings["smtp_mode"] == "TLS":
-            try:
-                with smtplib.SMTP_SSL(settings["smtp_server"],settings["smtp_port"],context=context) as server:
-                    if settings["smtp_user"] and settings["smtp_pass"]:
-                        server.login(user=settings["smtp_user"],password=settings["smtp_pass"])
-                    server.send_message(msg_root)
-            except Exception as err: # pylint: disable=broad-except
-                print("An error occurred while opening the SMTP connection: ",err)
-        if settings["smtp_mode"] in ["STARTTLS","SMTP"]:
-            try:
-                server = smtplib.SMTP(host=settings["smtp_server"], port=settings["smtp_port"])
-                # apply TLS encryption only if STARTTLS is selected
-                if settings["smtp_mode"] == "STARTTLS":
-                    server.starttls()
-                # login to server only if credentials are provided
-                if settings["smtp_user"] and settings["smtp_pass"]:
-                    server.login(user=settings["smtp_user"],password=settings["smtp_pass"])
-                server.send_message(msg_root)
-            except Exception as err: # pylint: disable=broad-except
-                print("An error occurred while opening the SMTP connection: ",err)
+        msg_alternative.attach(MIMEText(msg_html,"html"))
 
-        # Cleanup QR code files
-        try:
-            if os.path.exists(f"{settings['emailtemplate']}qrcode.png"):
-                os.remove(f"{settings['emailtemplate']}qrcode.png")
-        except Exception as err: # pylint: disable=broad-except
-            print("An error occurred while deleting QR code image files: ",err)
+        return msg_root
@@ -0,0 +1,177 @@
+"""
+merakitoolkitcache
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+module for MerakiToolkit local inventory cache (Organizations, Networks and SSIDs)
+"""
+import os
+import json
+import time
+import hashlib
+import sqlite3
+
+# SSID attributes kept in cache: secrets (psk, radius, etc) are never written to disk
+SSID_CACHED_ATTRIBUTES = ["number","name","authMode","wpaEncryptionMode"]
+
+# entries kinds that in incremental mode are validated by the configuration change log instead of the TTL
+INCREMENTAL_KINDS = ["networks","ssids","sync"]
+
+# maximum lookback of the Organization configuration change log (365 days)
+CONFIGURATION_CHANGES_LOOKBACK = 365 * 86400
+# configuration change log is read with an overlap to the last synchronization (clock differences)
+CONFIGURATION_CHANGES_OVERLAP = 300
+
+def default_cache_path():
+    '''Returns the default inventory cache file in the user cache directory'''
+    if os.name == "nt":
+        cache_directory = os.environ.get("LOCALAPPDATA",os.path.expanduser("~"))
+    else:
+        cache_directory = os.environ.get("XDG_CACHE_HOME",os.path.join(os.path.expanduser("~"),".cache"))
+    return os.path.join(cache_directory,"merakitoolkit","inventory.sqlite3")
+
+
+class InventoryCache():
+    '''
+    Local SQLite cache of the Meraki dashboard inventory
+    each entry (organizations list, networks of an organization, SSIDs of a network)
+    is valid for <ttl> seconds, <refresh> ignores existing entries and stores new ones
+    in <incremental> mode networks and SSIDs entries do not expire and are invalidated
+    with the organization configuration change log (see apply_configuration_changes)
+    entries are partitioned by API key, as the visible inventory depends on it
+    '''
+    def __init__(self,apikey,path=None,ttl=86400,refresh=False,incremental=False):
+        self.path = path if path else default_cache_path()
+        self.ttl = ttl
+        self.refresh = refresh
+        self.incremental = incremental
+        # only an hash of the API key is stored to identify the owner of the cache entries
+        self.account = hashlib.sha256(apikey.encode("utf-8")).hexdigest()
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path),exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS inventory ("
+            "account TEXT, kind TEXT, key TEXT, data TEXT, updated REAL, "
+            "PRIMARY KEY (account,kind,key))"
+            )
+
+    def get(self,kind,key):
+        '''Returns a cached entry, None if missing, expired or a refresh is requested'''
+        if self.refresh:
+            return None
+        if self.incremental and kind in INCREMENTAL_KINDS:
+            oldest = 0
+        else:
+            oldest = time.time()-self.ttl
+        entry = self.connection.execute(
+            "SELECT data FROM inventory WHERE account=? AND kind=? AND key=? AND updated>=?",
+            (self.account,kind,key,oldest)
+            ).fetchone()
+        if entry is None:
+            return None
+        return json.loads(entry[0])
+
+    def set(self,kind,key,data):
+        '''Stores an entry in cache (written to disk on close)'''
+        self.connection.execute(
+            "INSERT OR REPLACE INTO inventory (account,kind,key,data,updated) VALUES (?,?,?,?,?)",
+            (self.account,kind,key,json.dumps(data),time.time())
+            )
+
+    def get_organizations(self):
+        '''Returns cached Organizations'''
+        return self.get("organizations","")
+
+    def set_organizations(self,organizations):
+        '''Stores Organizations in cache'''
+        self.set("organizations","",organizations)
+
+    def get_networks(self,organization_id,tags=None,tags_filter="any"):
+        '''Returns cached Networks of an Organization retrieved with the same tags filter'''
+        return self.get("networks",self.networks_key(organization_id,tags,tags_filter))
+
+    def set_networks(self,organization_id,networks,tags=None,tags_filter="any"):
+        '''Stores Networks of an Organization retrieved with a tags filter'''
+        self.set("networks",self.networks_key(organization_id,tags,tags_filter),networks)
+
+    def get_ssids(self,network_id):
+        '''Returns cached SSIDs layout of a Network'''
+        return self.get("ssids",network_id)
+
+    def set_ssids(self,network_id,ssids):
+        '''Stores SSIDs layout (position, name and authentication) of a Network'''
+        self.set("ssids",network_id,[
+            {attribute: ssid.get(attribute) for attribute in SSID_CACHED_ATTRIBUTES}
+            for ssid in ssids
+            ])
+
+    def get_sync(self,organization_id):
+        '''Returns the time of the last configuration change log synchronization of an Organization'''
+        return self.get("sync",organization_id)
+
+    def set_sync(self,organization_id,synchronized):
+        '''Stores the time of the last configuration change log synchronization of an Organization'''
+        self.set("sync",organization_id,synchronized)
+
+    def invalidate_networks(self,organization_id):
+        '''Removes Networks entries of an Organization (for all tags filters)'''
+        self.connection.execute(
+            "DELETE FROM inventory WHERE account=? AND kind='networks' AND (key=? OR key LIKE ?)",
+            (self.account,organization_id,f"{organization_id}:%")
+            )
+
+    def invalidate_ssids(self,network_ids):
+        '''Removes SSIDs entries of Networks'''
+        self.connection.executemany(
+            "DELETE FROM inventory WHERE account=? AND kind='ssids' AND key=?",
+            [(self.account,network_id) for network_id in network_ids]
+            )
+
+    def cached_networks(self,organization_id):
+        '''Returns all cached Networks of an Organization (for all tags filters) indexed by ID'''
+        networks = {}
+        for entry in self.connection.execute(
+            "SELECT data FROM inventory WHERE account=? AND kind='networks' AND (key=? OR key LIKE ?)",
+            (self.account,organization_id,f"{organization_id}:%")
+            ):
+            networks.update({network["id"]: network for network in json.loads(entry[0])})
+        return networks
+
+    def invalidate_organization(self,organization_id):
+        '''Removes Networks and SSIDs entries of an Organization'''
+        self.invalidate_ssids(self.cached_networks(organization_id))
+        self.invalidate_networks(organization_id)
+
+    def apply_configuration_changes(self,organization_id,changes):
+        '''
+        Invalidates the entries affected by the configuration changes of an Organization
+        - SSID changes : SSIDs of the network
+        - other network changes (name, tags, devices, etc) : SSIDs of the network and networks list
+        - organization changes, networks not in cache : networks list
+        - configuration templates changes : networks list and SSIDs of networks bound to a template
+        '''
+        networks = self.cached_networks(organization_id)
+        for change in changes:
+            network_id = change.get("networkId")
+            if network_id in networks:
+                self.invalidate_ssids([network_id])
+                if change.get("ssidNumber") is None:
+                    self.invalidate_networks(organization_id)
+            else:
+                self.invalidate_networks(organization_id)
+                # a change on a network that is not in cache could be on a configuration template
+                if network_id:
+                    self.invalidate_ssids(
+                        [x for x,network in networks.items() if network.get("isBoundToConfigTemplate")]
+                        )
+
+    @staticmethod
+    def networks_key(organization_id,tags,tags_filter):
+        '''Networks entries depend on the tags filter applied by Meraki dashboard'''
+        if not tags:
+            return organization_id
+        return f"{organization_id}:{tags_filter}:{','.join(sorted(tags))}"
+
+    def close(self):
+        '''Writes pending entries to disk and closes the cache'''
+        self.connection.commit()
+        self.connection.close()
@@ -0,0 +1,117 @@
+"""
+merakitoolkitjournal
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+module for MerakiToolkit operation journal (append-only JSON Lines file to resume an interrupted PSK change)
+"""
+import json
+import os
+
+# records are synchronized to disk every DEFAULT_SYNC_RECORDS records, at the end of the discovery and when closed
+DEFAULT_SYNC_RECORDS = 100
+
+# job settings that must be the same to resume an operation (PSK of the journal is applied)
+JOURNAL_JOB_SETTINGS = ["organization","network","tags","tags_filter","ssid"]
+
+
+def network_key(network):
+    '''Returns the key of a network SSID in the journal'''
+    return f"{network['id']}/{network['ssidPosition']}"
+
+
+class Journal():
+    '''
+    Append-only journal of an operation, records (one JSON object for each line):
+    run -> jobs of the operation (with PSK, the file is readable only by its owner)
+    target -> network SSID to process (network data of the PSK change operation)
+    discovered -> discovery of all Organizations completed
+    update -> outcome of the update of a network SSID
+    notified -> notification email of a job (or of a network SSID in network notify mode) sent
+    records are written through the buffer of the file and synchronized to disk every <sync_records> records
+    '''
+    def __init__(self,path,resume=False,sync_records=DEFAULT_SYNC_RECORDS):
+        self.path = path
+        self.sync_records = sync_records
+        self.pending = 0
+        flags = os.O_WRONLY | os.O_CREAT | (os.O_APPEND if resume else os.O_TRUNC)
+        self.file = os.fdopen(os.open(path,flags,0o600),"w",encoding="utf-8")
+
+    def write(self,record,sync=False):
+        '''Appends a record, synchronized to disk if <sync> or with the previous records when they are enough'''
+        self.file.write(json.dumps(record) + "\n")
+        self.pending += 1
+        if sync or self.pending >= self.sync_records:
+            self.sync()
+
+    def start(self,jobs):
+        '''Writes the jobs of a new operation'''
+        self.write({"type":"run","jobs":jobs},sync=True)
+
+    def target(self,network):
+        '''Writes a network SSID to process'''
+        self.write({"type":"target","network":network})
+
+    def discovered(self):
+        '''Writes the completion of the discovery'''
+        self.write({"type":"discovered"},sync=True)
+
+    def update(self,network,success):
+        '''Writes the outcome of the update of a network SSID'''
+        self.write({"type":"update","key":network_key(network),"success":success})
+
+    def notified(self,key):
+        '''Writes the notification of a job (or of a network SSID by network key)'''
+        self.write({"type":"notified","key":key},sync=True)
+
+    def sync(self):
+        '''Writes the buffered records to disk'''
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+
+    def close(self):
+        '''Synchronizes and closes the journal'''
+        self.sync()
+        self.file.close()
+
+
+def load_journal(path):
+    '''
+    Returns the state of the operation of a journal:
+    jobs, targets (network SSIDs in order of discovery), done (outcome of the updates by network key),
+    discovered (discovery completed) and notified (jobs or network keys whose notification email was sent)
+    a truncated last record (operation interrupted while writing) is ignored
+    '''
+    state = {"jobs":None,"targets":{},"done":{},"discovered":False,"notified":set()}
+    with open(path,"r",encoding="utf-8") as journal_file:
+        lines = journal_file.read().splitlines()
+    for number,line in enumerate(lines):
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as err:
+            if number == len(lines) - 1:
+                break
+            raise ValueError(f"journal {path} record {number+1} is not valid: {err}") from err
+        if record["type"] == "run":
+            state["jobs"] = record["jobs"]
+        elif record["type"] == "target":
+            state["targets"][network_key(record["network"])] = record["network"]
+        elif record["type"] == "discovered":
+            state["discovered"] = True
+        elif record["type"] == "update":
+            state["done"][record["key"]] = record["success"]
+        elif record["type"] == "notified":
+            state["notified"].add(record["key"])
+    if state["jobs"] is None:
+        raise ValueError(f"journal {path} has no operation to resume")
+    state["targets"] = list(state["targets"].values())
+    return state
+
+
+def check_jobs(state,jobs):
+    '''Raises a ValueError if the jobs are not the jobs of the journaled operation'''
+    if len(state["jobs"]) != len(jobs):
+        raise ValueError("journal was written by an operation with a different number of jobs")
+    for number,(journaled,job) in enumerate(zip(state["jobs"],jobs)):
+        for setting in JOURNAL_JOB_SETTINGS:
+            if journaled.get(setting) != job.get(setting):
+                raise ValueError(f"journal was written by an operation with a different {setting} (job {number+1})")
@@ -0,0 +1,97 @@
+"""
+merakitoolkitnotify
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+module for MerakiToolkit notifications of each network (recipients of the networks and emails rendering in processes)
+"""
+import asyncio
+import json
+import multiprocessing
+from concurrent.futures import Future,ProcessPoolExecutor
+from . import merakitoolkitsupport
+
+# job: one email for each job to the recipients of the job
+# network: one email for each network SSID to the recipients of the network (recipients file)
+NOTIFY_MODES = ["job","network"]
+
+# prefix of the recipients file keys matching the networks by tag
+TAG_PREFIX = "tag:"
+
+
+def load_recipients(path):
+    '''
+    Returns the recipients of the networks listed in a JSON recipients file
+    the file contains a dictionary of network names, network IDs or tags (as "tag:<tag>") with their
+    list of email addresses (a single address can be given as a string)
+    '''
+    with open(path,"r",encoding="utf-8") as recipients_file:
+        recipients = json.load(recipients_file)
+    if not isinstance(recipients,dict) or not recipients:
+        raise ValueError(f"{path} : no recipients defined")
+    for key,emails in recipients.items():
+        if isinstance(emails,str):
+            recipients[key] = [emails]
+        elif not isinstance(emails,list) or not all(isinstance(x,str) for x in emails):
+            raise ValueError(f"{path} : recipients of {key} are not a list of email addresses")
+    return recipients
+
+
+def network_recipients(recipients,network):
+    '''Returns the email addresses of a network (network data of the PSK change operation) in recipients order'''
+    keys = [network["name"],network["id"]] + [TAG_PREFIX + x for x in network.get("tags") or []]
+    emails = []
+    for key in keys:
+        for email in recipients.get(key,[]):
+            if email not in emails:
+                emails.append(email)
+    return emails
+
+
+def render_email(path,ssid,psk,images,network=None,bytecode_cache=None): # pylint: disable=too-many-arguments disable=too-many-positional-arguments
+    '''
+    Returns the text body, the HTML body and the QR code (PNG bytes) of a notification email
+    <images> are the jinja2 variables of the template images (the QR code is added)
+    '''
+    text = merakitoolkitsupport.generate_email_body(
+        "templatetxt.j2",path,ssid,psk,network=network,bytecode_cache=bytecode_cache
+        )
+    html = merakitoolkitsupport.generate_email_body(
+        "templatehtml.j2",path,ssid,psk,images + ["qrcodepng"],network=network,bytecode_cache=bytecode_cache
+        )
+    return text,html,merakitoolkitsupport.qrcode_png(ssid,psk)
+
+
+class EmailRenderer():
+    '''
+    Renders notification emails (render_email) in a pool of <processes> processes (CPU count if None),
+    templates and QR codes are cached by each process
+    with 0 processes emails are rendered by the calling thread (eg: platforms without multiprocessing)
+    processes are started when needed with the spawn method (safe with the threads of the SMTP pool)
+    '''
+    def __init__(self,processes=None):
+        if processes is not None and processes < 0:
+            raise ValueError("render processes must be 0 or more")
+        self.processes = processes
+        self.executor = None
+
+    def submit(self,*args,**kwargs):
+        '''Starts the rendering of an email, returns a concurrent.futures.Future of the render_email result'''
+        if self.processes == 0:
+            future = Future()
+            try:
+                future.set_result(render_email(*args,**kwargs))
+            except Exception as err: # pylint: disable=broad-except
+                future.set_exception(err)
+            return future
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.processes,mp_context=multiprocessing.get_context("spawn"))
+        return self.executor.submit(render_email,*args,**kwargs)
+
+    async def render(self,*args,**kwargs):
+        '''Renders an email without blocking the event loop'''
+        return await asyncio.wrap_future(self.submit(*args,**kwargs))
+
+    def close(self):
+        '''Stops the processes of the pool'''
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
@@ -0,0 +1,96 @@
+"""
+merakitoolkitoutput
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+module for MerakiToolkit machine-readable results (JSON Lines or CSV, a line for each network as soon as it is processed)
+"""
+import csv
+import json
+import sys
+
+OUTPUT_FORMATS = ["jsonl","csv"]
+
+# fields of a network result
+# action: update (PSK to change), skip (PSK already set or already changed by a resumed operation)
+# or discover (network discovery failed, SSID fields are empty)
+# outcome: success, failed, dryrun (update not applied), unchanged (PSK already set) or resumed (already changed)
+# latency: seconds of the Meraki dashboard calls of the action (SSIDs lookup for dryrun and skip, empty for discover)
+RESULT_FIELDS = [
+    "organization",
+    "organizationId",
+    "network",
+    "networkId",
+    "ssidNumber",
+    "ssidName",
+    "job",
+    "action",
+    "outcome",
+    "latency",
+    ]
+
+
+def network_result(network,action,outcome,latency):
+    '''Returns the result of a network (network data of the PSK change operation) in output fields'''
+    return {
+        "organization": network["organization"],
+        "organizationId": network["organizationId"],
+        "network": network["name"],
+        "networkId": network["id"],
+        "ssidNumber": int(network["ssidPosition"]),
+        "ssidName": network["ssidName"],
+        "job": network["job"] + 1,
+        "action": action,
+        "outcome": outcome,
+        "latency": round(latency,3),
+        }
+
+
+def discovery_result(failure):
+    '''Returns the result of a network whose discovery failed (failure of the PSK change operation) in output fields'''
+    return {
+        "organization": failure["organization"],
+        "organizationId": failure["organizationId"],
+        "network": failure["network"],
+        "networkId": failure["networkId"],
+        "ssidNumber": None,
+        "ssidName": None,
+        "job": None,
+        "action": "discover",
+        "outcome": "failed",
+        "latency": None,
+        }
+
+
+class ResultWriter():
+    '''
+    Writes the results of an operation in <output_format> (jsonl or csv) to a file or to standard output (<path> None or "-")
+    the standard output is the one at creation (messages of the operation are then redirected to standard error)
+    results are written through the buffer of the file (flushed when full and when the writer is closed)
+    '''
+    def __init__(self,output_format,path=None):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"output format must be one of {', '.join(OUTPUT_FORMATS)}")
+        self.output_format = output_format
+        self.path = path
+        self.to_stdout = path in (None,"-")
+        if self.to_stdout:
+            self.file = sys.stdout
+        else:
+            self.file = open(path,"w",encoding="utf-8",newline="") # pylint: disable=consider-using-with
+        self.csv = None
+        if output_format == "csv":
+            self.csv = csv.DictWriter(self.file,fieldnames=RESULT_FIELDS)
+            self.csv.writeheader()
+
+    def write(self,result):
+        '''Writes a result'''
+        if self.csv:
+            self.csv.writerow(result)
+        else:
+            self.file.write(json.dumps(result) + "\n")
+
+    def close(self):
+        '''Flushes the results and closes the file (standard output is only flushed)'''
+        if self.to_stdout:
+            self.file.flush()
+        else:
+            self.file.close()
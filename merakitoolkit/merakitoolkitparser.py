@@ -10,7 +10,7 @@ import sys
 import os
 
 # additional libraries
-from  .merakitoolkit import __version__,__copyright__,__license__
+from . import __version__,__copyright__,__license__
 
 class MyParser(argparse.ArgumentParser):
     '''
@@ -23,6 +23,17 @@ class MyParser(argparse.ArgumentParser):
         sys.exit(2)
 
 
+def positive_int(value):
+    '''argparse type of the options that must be a positive integer (eg: concurrency, rate limit)'''
+    try:
+        number = int(value)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'") from err
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer: '{value}'")
+    return number
+
+
 def parser():
     '''
     Support function to create the parser for all program options
@@ -65,6 +76,11 @@ def parser():
                         nargs="+",
                         help="Specify a list of tags",
                         action="store")
+    psksubparser.add_argument("--tags-filter",
+                        help="networks must match any or all of the tags [any|all] default=any",
+                        choices=["any","all"],
+                        default="any",
+                        action="store")
     psksubparser.add_argument("-v",
                         "--verbose",
                         help='''Incremental logging level
@@ -118,22 +134,162 @@ def parser():
     psksubparser.add_argument("--smtp-pass",
                         help="specify a password for SMTP connection",
                         action="store")
-    pskrequirednamed = psksubparser.add_argument_group('required arguments')
+    psksubparser.add_argument("--org-concurrency",
+                        help="maximum number of Organizations processed concurrently (default=10)",
+                        type=positive_int,
+                        default=10,
+                        action="store")
+    psksubparser.add_argument("--concurrency",
+                        help="maximum number of Networks whose SSIDs are looked up concurrently (default=20)",
+                        type=positive_int,
+                        default=20,
+                        action="store")
+    psksubparser.add_argument("--update-concurrency",
+                        help="maximum number of SSIDs updated concurrently (default=10)",
+                        type=positive_int,
+                        default=10,
+                        action="store")
+    psksubparser.add_argument("--rate-limit",
+                        help="maximum Meraki dashboard requests per second for each Organization (default=10)",
+                        type=positive_int,
+                        default=10,
+                        action="store")
+    psksubparser.add_argument("--max-attempts",
+                        help="maximum attempts of a Meraki dashboard request (default=5)",
+                        type=int,
+                        default=5,
+                        action="store")
+    psksubparser.add_argument("--retry-backoff",
+                        help="initial wait in seconds before repeating a failed request, doubled at each attempt (default=1)",
+                        type=float,
+                        default=1,
+                        action="store")
+    psksubparser.add_argument("--call-deadline",
+                        help="maximum time in seconds for a Meraki dashboard request including retries (default=300)",
+                        type=float,
+                        default=300,
+                        action="store")
+    psksubparser.add_argument("--all-product-types",
+                        help="look up SSIDs also in networks without wireless products (by default skipped)",
+                        default=False,
+                        action="store_true")
+    psksubparser.add_argument("--cache",
+                        help="use the local inventory cache of Organizations, Networks and SSIDs "
+                             "(SSIDs to change are always checked on Meraki dashboard)",
+                        default=False,
+                        action="store_true")
+    psksubparser.add_argument("--refresh-cache",
+                        help="ignore the local inventory cache content and refresh it",
+                        default=False,
+                        action="store_true")
+    psksubparser.add_argument("--cache-ttl",
+                        help="validity in seconds of the local inventory cache entries (default=86400)",
+                        type=int,
+                        default=86400,
+                        action="store")
+    psksubparser.add_argument("--incremental",
+                        help="refresh the local inventory cache from the Organizations configuration change log",
+                        default=False,
+                        action="store_true")
+    psksubparser.add_argument("--cache-file",
+                        help="local inventory cache file (default in user cache directory)",
+                        action="store")
+    psksubparser.add_argument("--action-batches",
+                        help="update SSIDs with Meraki dashboard action batches grouped by Organization "
+                             "instead of a request for each network",
+                        default=False,
+                        action="store_true")
+    psksubparser.add_argument("--action-batch-size",
+                        help="maximum number of SSIDs updated by an action batch (default=100, maximum 100)",
+                        type=int,
+                        default=100,
+                        action="store")
+    psksubparser.add_argument("--base-url",
+                        help="Meraki dashboard API base URL (default=https://api.meraki.com/api/v1)",
+                        action="store")
+    psksubparser.add_argument("--stats",
+                        help="print a summary of calls, failures, retries, latencies and sizes by Meraki dashboard "
+                             "endpoint and email delivery step",
+                        default=False,
+                        action="store_true")
+    psksubparser.add_argument("--stats-file",
+                        help="write the operation statistics (with latency histograms) to a JSON file",
+                        action="store")
+    psksubparser.add_argument("--metrics-file",
+                        help="write the run metrics in Prometheus text format (eg: for node_exporter textfile collector)",
+                        action="store")
+    psksubparser.add_argument("--output",
+                        help="write the result of each network (organization, network, SSID, action, outcome, latency) "
+                             "as soon as it is known, in JSON Lines or CSV format",
+                        choices=["jsonl","csv"],
+                        action="store")
+    psksubparser.add_argument("--output-file",
+                        help="file for --output results "
+                             "(default standard output, replacing the report, messages are sent to standard error)",
+                        action="store")
+    journal_group = psksubparser.add_mutually_exclusive_group()
+    journal_group.add_argument("--journal",
+                        help="write the networks to process and the updates to a journal file, to resume the operation "
+                             "if interrupted (the file contains the PSK)",
+                        action="store")
+    journal_group.add_argument("--resume",
+                        metavar="JOURNAL",
+                        help="resume the operation of a journal file with its PSK: networks already changed are skipped "
+                             "and networks are not discovered again if the discovery was completed",
+                        action="store")
+    psksubparser.add_argument("--smtp-connections",
+                        help="SMTP connections to deliver the emails at the same time (default=2)",
+                        default=2,
+                        type=int,
+                        action="store")
+    psksubparser.add_argument("--smtp-attempts",
+                        help="attempts to deliver an email when the SMTP server fails temporarily (default=3)",
+                        default=3,
+                        type=int,
+                        action="store")
+    psksubparser.add_argument("--template-cache",
+                        help="directory to save the compiled email templates, reused by the following runs",
+                        action="store")
+    psksubparser.add_argument("--psk-policy",
+                        help="job: the same PSK for all the networks of a job (default), "
+                             "network: a unique generated PSK for each network SSID (emails with --notify-mode network)",
+                        choices=["job","network"],
+                        default="job",
+                        action="store")
+    psksubparser.add_argument("--notify-mode",
+                        help="job: one email for each job to --email recipients (default), "
+                             "network: one email for each network SSID to its recipients (--recipients-file)",
+                        choices=["job","network"],
+                        default="job",
+                        action="store")
+    psksubparser.add_argument("--recipients-file",
+                        help="JSON file with the email recipients of the networks by network name, network ID "
+                             "or tag (\"tag:<tag>\"), for --notify-mode network",
+                        action="store")
+    psksubparser.add_argument("--render-processes",
+                        help="processes rendering the emails of --notify-mode network (default=CPU count, "
+                             "0 to render in the main process)",
+                        type=int,
+                        action="store")
+    psksubparser.add_argument("--jobs-file",
+                        help="JSON file with a list of PSK change jobs (organization, network, tags, tags_filter, ssid, "
+                             "passphrase, passrandomize, email, emailtemplate), missing settings are taken from the "
+                             "command line, all jobs are processed with a single discovery of the inventory",
+                        action="store")
+    # required arguments can be omitted when they are given for each job in a job file (--jobs-file)
+    pskrequirednamed = psksubparser.add_argument_group('required arguments (unless given in --jobs-file)')
     pskrequirednamed.add_argument("-o",
                                "--organization",
                                nargs="+",
-                               help="Specify one or more Organizations (ALL for all Organizations)",
-                               required=True)
+                               help="Specify one or more Organizations (ALL for all Organizations)")
     pskrequirednamed.add_argument("-n",
                                "--network",
                                nargs="+",
                                help="Specify one or more networks (ALL for all networks)",
-                               action="store",
-                               required=True)
+                               action="store")
     pskrequirednamed.add_argument("-s",
                                "--ssid",
-                               help="Specify an SSID",
-                               required=True)
+                               help="Specify an SSID")
     # ---------------------------------------------
 
 
@@ -146,12 +302,19 @@ def parser():
     else:
         args = merakiparser.parse_args()
         if args.command == "psk":
+            # verify that required arguments are given in input or in the job file
+            if not args.jobs_file:
+                missing = [x for x in ["organization","network","ssid"] if getattr(args,x) is None]
+                if missing:
+                    psksubparser.error(f"the following arguments are required: {', '.join(missing)}")
+            if args.notify_mode == "network" and not args.recipients_file:
+                psksubparser.error("--notify-mode network requires --recipients-file")
             # verify that email template path is not missing the last forward slash
             if args.emailtemplate[-1] != "/":
                 args.emailtemplate += "/"
 
             # verify that template path chosen is valid
-            if args.email:
+            if args.email or args.recipients_file:
                 templates = ["templatehtml.j2","templatetxt.j2"]
                 for template in templates:
                     try:
@@ -0,0 +1,227 @@
+"""
+merakitoolkitratelimit
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+module for MerakiToolkit Meraki dashboard calls pacing, retries and concurrency
+"""
+import asyncio
+import random
+
+# Meraki dashboard budget: 10 requests per second per organization with a burst of 10 requests
+DEFAULT_RATE = 10
+DEFAULT_BURST = 10
+
+# retry policy defaults: attempts of a call, first backoff and maximum backoff in seconds, deadline of a call in seconds
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BACKOFF = 1
+DEFAULT_MAX_BACKOFF = 60
+DEFAULT_DEADLINE = 300
+
+# concurrent workers for networks discovery (SSIDs lookup) and SSIDs updates
+DEFAULT_DISCOVERY_WORKERS = 20
+DEFAULT_UPDATE_WORKERS = 10
+
+# Meraki dashboard action batches: actions of an asynchronous batch, unfinished batches of an organization
+# and maximum wait in seconds between the checks of a batch status
+DEFAULT_ACTION_BATCH_SIZE = 100
+ACTION_BATCH_CONCURRENCY = 5
+ACTION_BATCH_MAX_POLL = 30
+
+def retry_after(err,default=None):
+    '''Returns the seconds to wait indicated by a Meraki dashboard error response (Retry-After header)'''
+    try:
+        return int(err.response.headers["Retry-After"])
+    except Exception: # pylint: disable=broad-except
+        return default
+
+
+class TokenBucket():
+    '''
+    Token bucket of one organization: <rate> tokens per second up to <rate>+<burst> tokens
+    waiting calls are served in order of arrival (asyncio.Lock is fair)
+    '''
+    def __init__(self,rate=DEFAULT_RATE,burst=DEFAULT_BURST):
+        self.rate = rate
+        self.capacity = rate + burst
+        self.tokens = self.capacity
+        self.updated = None
+        self.paused_until = 0
+        self.lock = asyncio.Lock()
+
+    def refill(self,now):
+        '''Adds tokens accumulated since the last refill'''
+        if self.updated is not None:
+            self.tokens = min(self.capacity,self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        '''Waits until a token is available (and the bucket is not paused) and consumes it'''
+        loop = asyncio.get_running_loop()
+        async with self.lock:
+            while True:
+                now = loop.time()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self,seconds):
+        '''Stops serving tokens for <seconds> (eg: Retry-After received with a 429 error)'''
+        now = asyncio.get_running_loop().time()
+        self.paused_until = max(self.paused_until,now + seconds)
+        # the budget is exhausted on Meraki dashboard side
+        self.tokens = 0
+        self.updated = self.paused_until
+
+
+class OrganizationRateLimiter():
+    '''
+    Rate limiter shared by all Meraki dashboard calls of an operation
+    each organization has its own token bucket, so calls of an organization with many networks
+    cannot consume the budget of the others and a 429 error pauses only the calls of its organization
+    calls not related to an organization (eg: getOrganizations) use a bucket with organization_id None
+    '''
+    def __init__(self,rate=DEFAULT_RATE,burst=DEFAULT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+
+    def bucket(self,organization_id):
+        '''Returns the token bucket of an organization (created at the first call)'''
+        if organization_id not in self.buckets:
+            self.buckets[organization_id] = TokenBucket(self.rate,self.burst)
+        return self.buckets[organization_id]
+
+    async def acquire(self,organization_id):
+        '''Waits for the permission to send a call for an organization'''
+        await self.bucket(organization_id).acquire()
+
+    def pause(self,organization_id,seconds):
+        '''Pauses all calls for an organization for <seconds>'''
+        self.bucket(organization_id).pause(seconds)
+
+
+class RetryPolicy():
+    '''
+    Retry policy shared by all Meraki dashboard calls
+    a call is attempted up to <max_attempts> times and within <deadline> seconds
+    429 errors (Too many requests) are retried after the Retry-After time indicated by Meraki dashboard,
+    server errors (5XX) and connection errors or timeouts (no response) after an exponential backoff
+    starting at <backoff> seconds up to <max_backoff> seconds with full jitter
+    '''
+    def __init__(self,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 backoff=DEFAULT_BACKOFF,
+                 max_backoff=DEFAULT_MAX_BACKOFF,
+                 deadline=DEFAULT_DEADLINE):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+
+    @staticmethod
+    def retryable(err):
+        '''Returns True if the failed call can be repeated'''
+        return err.status is None or err.status == 429 or err.status >= 500
+
+    def wait(self,attempt,err,max_attempts=None):
+        '''
+        Returns the seconds to wait before repeating a call failed at <attempt>, None if it is not to be repeated
+        <max_attempts> lowers the attempts of the policy for a call (eg: 1 for non-idempotent calls)
+        '''
+        if attempt >= min(max_attempts or self.max_attempts,self.max_attempts) or not self.retryable(err):
+            return None
+        if err.status == 429:
+            wait = retry_after(err)
+            if wait is not None:
+                return wait
+        return random.uniform(0,min(self.max_backoff,self.backoff * 2 ** (attempt - 1)))
+
+
+class WorkerPool():
+    '''
+    Bounded pool of <workers> tasks awaiting <function> for each item put in its queue
+    items wait in the queue (at most <maxsize>, 0 for unbounded) instead of creating a coroutine for each one
+    results are collected in order of completion
+    '''
+    def __init__(self,function,workers,maxsize=0):
+        self.function = function
+        self.queue = asyncio.Queue(maxsize)
+        self.results = []
+        self.errors = []
+        self.tasks = [asyncio.create_task(self.worker()) for x in range(workers)]
+
+    async def worker(self):
+        '''Processes items from the queue until the pool is closed'''
+        while True:
+            item = await self.queue.get()
+            try:
+                self.results.append(await self.function(*item))
+            except Exception as err: # pylint: disable=broad-except
+                # the error is raised by join(), the worker keeps serving the queue
+                self.errors.append(err)
+            finally:
+                self.queue.task_done()
+
+    async def put(self,*item):
+        '''Adds an item (arguments of function) to the queue, waits if the queue is full'''
+        await self.queue.put(item)
+
+    async def join(self):
+        '''Waits for all items to be processed, stops the workers and returns the results'''
+        await self.queue.join()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks,return_exceptions=True)
+        if self.errors:
+            raise self.errors[0]
+        return self.results
+
+
+class BatchPool():
+    '''
+    Pool grouping the items put in its queue by <key> into batches of up to <size> items
+    each batch is processed by <function>(group,items) returning a result for each item of the batch,
+    full batches are processed while new items are added, partial batches when the pool is joined
+    up to <workers> batches are processed at the same time, of which up to <group_workers> of the same group
+    results are collected in order of completion
+    '''
+    def __init__(self,function,size,workers,key,group_workers=0):
+        self.function = function
+        self.size = size
+        self.key = key
+        self.group_workers = group_workers
+        self.batches = {}
+        self.semaphores = {}
+        self.pool = WorkerPool(self.process,workers,maxsize=workers)
+
+    async def process(self,group,items):
+        '''Processes a batch of items of a group (bounded by the group concurrency)'''
+        if not self.group_workers:
+            return await self.function(group,items)
+        if group not in self.semaphores:
+            self.semaphores[group] = asyncio.Semaphore(self.group_workers)
+        async with self.semaphores[group]:
+            return await self.function(group,items)
+
+    async def put(self,*item):
+        '''Adds an item to the batch of its group, the batch is queued when full'''
+        group = self.key(*item)
+        batch = self.batches.setdefault(group,[])
+        batch.append(item)
+        if len(batch) >= self.size:
+            del self.batches[group]
+            await self.pool.put(group,batch)
+
+    async def join(self):
+        '''Queues the partial batches, waits for all batches to be processed and returns the results of the items'''
+        for group,batch in list(self.batches.items()):
+            del self.batches[group]
+            await self.pool.put(group,batch)
+        results = []
+        for batch_results in await self.pool.join():
+            results.extend(batch_results)
+        return results
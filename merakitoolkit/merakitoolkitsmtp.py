@@ -0,0 +1,138 @@
+"""
+merakitoolkitsmtp
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+module for MerakiToolkit email delivery (pool of SMTP connections with retries)
+"""
+import asyncio
+import queue
+import smtplib
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# SMTP connections open at the same time (messages are delivered concurrently on different connections)
+DEFAULT_SMTP_CONNECTIONS = 2
+# attempts to deliver a message (the first one included) and seconds before the second attempt (doubled at each attempt)
+DEFAULT_SMTP_ATTEMPTS = 3
+DEFAULT_SMTP_BACKOFF = 1
+# seconds to wait for the SMTP server before a connection or a command fails
+DEFAULT_SMTP_TIMEOUT = 30
+
+SMTP_MODES = ["TLS","STARTTLS","SMTP"]
+
+
+def retryable(err):
+    '''Returns True if a delivery failed with a temporary error (connection errors and 4xx SMTP replies)'''
+    if isinstance(err,smtplib.SMTPResponseException):
+        return 400 <= err.smtp_code < 500
+    if isinstance(err,(smtplib.SMTPRecipientsRefused,smtplib.SMTPNotSupportedError,ssl.SSLCertVerificationError)):
+        return False
+    return isinstance(err,OSError)
+
+
+class SMTPPool(): # pylint: disable=too-many-instance-attributes
+    '''
+    Pool of up to <connections> SMTP connections, opened when needed and reused for the following messages
+    a connection is dropped when a delivery fails, temporary failures are repeated on a new connection
+    up to <max_attempts> times waiting <backoff> seconds (doubled at each attempt)
+    smtplib is blocking: send() delivers from the calling thread, send_async() from a thread of the pool
+    '''
+    def __init__(self, # pylint: disable=too-many-arguments disable=too-many-positional-arguments
+                 host,
+                 port,
+                 mode="TLS",
+                 user=None,
+                 password=None,
+                 connections=DEFAULT_SMTP_CONNECTIONS,
+                 max_attempts=DEFAULT_SMTP_ATTEMPTS,
+                 backoff=DEFAULT_SMTP_BACKOFF,
+                 timeout=DEFAULT_SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.mode = mode
+        self.user = user
+        self.password = password
+        self.connections = connections
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(connections)
+        self.executor = None
+        # connections opened (eg: to verify that connections are reused)
+        self.opened = 0
+
+    def connect(self):
+        '''Opens and authenticates a new SMTP connection'''
+        if not self.host:
+            raise ValueError("SMTP server is not defined")
+        if self.mode not in SMTP_MODES:
+            raise ValueError(f"SMTP mode must be one of {', '.join(SMTP_MODES)}")
+        if self.mode == "TLS":
+            connection = smtplib.SMTP_SSL(self.host,self.port,timeout=self.timeout,context=ssl.create_default_context())
+        else:
+            connection = smtplib.SMTP(host=self.host,port=self.port,timeout=self.timeout)
+            # apply TLS encryption only if STARTTLS is selected
+            if self.mode == "STARTTLS":
+                connection.starttls(context=ssl.create_default_context())
+        # login to server only if credentials are provided
+        if self.user and self.password:
+            connection.login(user=self.user,password=self.password)
+        self.opened += 1
+        return connection
+
+    def acquire(self):
+        '''Returns an idle connection or a new one'''
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            return self.connect()
+
+    @staticmethod
+    def drop(connection):
+        '''Closes a connection without waiting for the server'''
+        try:
+            connection.close()
+        except Exception: # pylint: disable=broad-except
+            pass
+
+    def send(self,message):
+        '''Delivers a message (email.message.Message), raises the error of the last attempt if it fails'''
+        with self.slots:
+            attempt = 1
+            while True:
+                connection = None
+                try:
+                    connection = self.acquire()
+                    connection.send_message(message)
+                    self.idle.put(connection)
+                    return
+                except Exception as err: # pylint: disable=broad-except
+                    if connection is not None:
+                        self.drop(connection)
+                    if attempt >= self.max_attempts or not retryable(err):
+                        raise
+                    time.sleep(self.backoff * 2 ** (attempt - 1))
+                    attempt += 1
+
+    async def send_async(self,message):
+        '''Delivers a message from a thread of the pool, without blocking the event loop'''
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.connections,thread_name_prefix="merakitoolkit-smtp")
+        await asyncio.get_running_loop().run_in_executor(self.executor,self.send,message)
+
+    def close(self):
+        '''Closes the idle connections and the threads of the pool'''
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        while True:
+            try:
+                connection = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                connection.quit()
+            except Exception: # pylint: disable=broad-except
+                self.drop(connection)
@@ -0,0 +1,229 @@
+"""
+merakitoolkitstats
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+module for MerakiToolkit operation statistics (Meraki dashboard calls and email delivery)
+"""
+import json
+import math
+import os
+import time
+from contextlib import contextmanager
+
+# upper bounds in seconds of the latency histogram buckets (calls slower than the last bound are counted in +Inf)
+LATENCY_BUCKETS = [0.05,0.1,0.25,0.5,1,2.5,5,10,30,60]
+
+# networks counters of a run exported as Prometheus metric merakitoolkit_networks{state=...}
+NETWORKS_STATES = ["discovered","matched","updated","skipped","failed"]
+
+def payload_size(data):
+    '''Returns the size in bytes of data encoded in JSON (as sent to or received from Meraki dashboard)'''
+    if data is None:
+        return 0
+    if isinstance(data,(str,bytes)):
+        return len(data)
+    return len(json.dumps(data,default=str).encode("utf-8"))
+
+
+class EndpointStats(): # pylint: disable=too-many-instance-attributes
+    '''Counters and latencies of the calls of an endpoint'''
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.sent = 0
+        self.received = 0
+        self.seconds = 0.0
+        self.latencies = []
+        self.buckets = [0 for x in LATENCY_BUCKETS]
+
+    def record(self,seconds,attempts=1,rate_limited=0,failed=False,sent=0,received=0): # pylint: disable=too-many-arguments disable=too-many-positional-arguments
+        '''Adds a call (with its retries) to the counters'''
+        self.calls += 1
+        self.failures += int(failed)
+        self.retries += attempts - 1
+        self.rate_limited += rate_limited
+        self.sent += sent
+        self.received += received
+        self.seconds += seconds
+        self.latencies.append(seconds)
+        for bucket,bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[bucket] += 1
+                break
+
+    def percentile(self,percentile):
+        '''Returns the latency (nearest rank) under which are <percentile> % of the calls'''
+        if not self.latencies:
+            return 0.0
+        latencies = sorted(self.latencies)
+        return latencies[max(0,math.ceil(percentile / 100 * len(latencies)) - 1)]
+
+    def to_dict(self):
+        '''Returns the counters, latency percentiles and histogram (cumulative counts by upper bound)'''
+        histogram = {}
+        cumulative = 0
+        for bound,count in zip(LATENCY_BUCKETS,self.buckets):
+            cumulative += count
+            histogram[str(bound)] = cumulative
+        histogram["+Inf"] = self.calls
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "bytes_sent": self.sent,
+            "bytes_received": self.received,
+            "seconds": self.seconds,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "histogram": histogram,
+            }
+
+
+class OperationStats():
+    '''
+    Statistics of an operation by endpoint (Meraki dashboard API operation or email delivery step)
+    sizes of Meraki dashboard calls are the JSON size of the request parameters and of the response data
+    '''
+    def __init__(self):
+        self.started = time.time()
+        self.endpoints = {}
+        # run counters (eg: networks_updated, rate_limit_wait_seconds) and phases durations in seconds
+        self.counters = {}
+        self.phases = {}
+
+    def count(self,counter,value=1):
+        '''Adds <value> to a run counter'''
+        self.counters[counter] = self.counters.get(counter,0) + value
+
+    def set_phase(self,phase,seconds):
+        '''Sets the duration of a phase of the run'''
+        self.phases[phase] = seconds
+
+    def record(self,endpoint,seconds,attempts=1,rate_limited=0,failed=False,sent=None,received=None): # pylint: disable=too-many-arguments disable=too-many-positional-arguments
+        '''Adds a call of an endpoint to the statistics'''
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = EndpointStats()
+        self.endpoints[endpoint].record(
+            seconds,
+            attempts=attempts,
+            rate_limited=rate_limited,
+            failed=failed,
+            sent=payload_size(sent),
+            received=payload_size(received)
+            )
+
+    @contextmanager
+    def measure(self,endpoint):
+        '''
+        Context manager recording the execution time of a block as a call of an endpoint
+        the block fails if it raises an exception, sizes can be set in the yielded dictionary (sent, received)
+        '''
+        sizes = {"sent":None,"received":None}
+        started = time.perf_counter()
+        failed = True
+        try:
+            yield sizes
+            failed = False
+        finally:
+            self.record(endpoint,time.perf_counter()-started,failed=failed,**sizes)
+
+    def to_dict(self):
+        '''Returns the statistics of all endpoints'''
+        return {
+            "started": self.started,
+            "seconds": time.time() - self.started,
+            "counters": self.counters,
+            "phases": self.phases,
+            "endpoints": {x: y.to_dict() for x,y in sorted(self.endpoints.items())},
+            }
+
+    def summary(self):
+        '''Returns a table with the statistics of each endpoint'''
+        lines = [
+            f'{"Endpoint:":<38} {"Calls:":>7} {"Failed:":>7} {"Retries:":>8} {"429:":>6} '
+            f'{"p50 ms:":>8} {"p95 ms:":>8} {"p99 ms:":>8} {"KB sent:":>9} {"KB recv:":>9}'
+            ]
+        for endpoint,stats in sorted(self.endpoints.items()):
+            lines.append("-"*110)
+            lines.append(
+                f'{endpoint:<38} {stats.calls:>7} {stats.failures:>7} {stats.retries:>8} {stats.rate_limited:>6} '
+                f'{stats.percentile(50)*1000:>8.1f} {stats.percentile(95)*1000:>8.1f} {stats.percentile(99)*1000:>8.1f} '
+                f'{stats.sent/1024:>9.1f} {stats.received/1024:>9.1f}'
+                )
+        return "\n".join(lines)
+
+    def write(self,path):
+        '''Writes the statistics to a JSON file'''
+        with open(path,"w",encoding="utf-8") as stats_file:
+            json.dump(self.to_dict(),stats_file,indent=2)
+
+    def prometheus(self,success):
+        '''Returns the statistics of the run in Prometheus text format (values of the last run)'''
+        metrics = []
+
+        def metric(name,metric_type,description,samples):
+            metrics.append(f"# HELP {name} {description}")
+            metrics.append(f"# TYPE {name} {metric_type}")
+            metrics.extend(sample_lines(name,samples))
+
+        metric("merakitoolkit_last_run_timestamp_seconds","gauge","End time of the last PSK change run",
+               [({},round(time.time(),3))])
+        metric("merakitoolkit_last_run_success","gauge","1 if the last PSK change run completed without failures",
+               [({},int(success))])
+        metric("merakitoolkit_run_duration_seconds","gauge","Duration of the last PSK change run",
+               [({},round(time.time() - self.started,3))])
+        metric("merakitoolkit_phase_duration_seconds","gauge",
+               "Duration of the phases of the last run (update: time after the end of the discovery)",
+               [({"phase":x},round(y,3)) for x,y in sorted(self.phases.items())])
+        metric("merakitoolkit_networks","gauge","Networks of the last run by state",
+               [({"state":x},self.counters.get(f"networks_{x}",0)) for x in NETWORKS_STATES])
+        metric("merakitoolkit_rate_limit_wait_seconds","gauge","Seconds of pause requested by 429 errors in the last run",
+               [({},round(self.counters.get("rate_limit_wait_seconds",0),3))])
+        endpoints = sorted(self.endpoints.items())
+        metric("merakitoolkit_api_calls","gauge","Calls of the last run by endpoint",
+               [({"endpoint":x},y.calls) for x,y in endpoints])
+        metric("merakitoolkit_api_call_failures","gauge","Failed calls of the last run by endpoint",
+               [({"endpoint":x},y.failures) for x,y in endpoints])
+        metric("merakitoolkit_api_call_retries","gauge","Repeated calls of the last run by endpoint",
+               [({"endpoint":x},y.retries) for x,y in endpoints])
+        metric("merakitoolkit_api_rate_limited","gauge","429 errors of the last run by endpoint",
+               [({"endpoint":x},y.rate_limited) for x,y in endpoints])
+        # call durations histogram: buckets, sum and count of the same metric family
+        samples = []
+        for endpoint,stats in endpoints:
+            for bound,count in stats.to_dict()["histogram"].items():
+                samples.append(({"endpoint":endpoint,"le":bound},count))
+        metric("merakitoolkit_api_call_duration_seconds","histogram","Duration of the calls of the last run by endpoint",[])
+        metrics.extend(sample_lines("merakitoolkit_api_call_duration_seconds_bucket",samples))
+        metrics.extend(sample_lines("merakitoolkit_api_call_duration_seconds_sum",
+                                    [({"endpoint":x},round(y.seconds,3)) for x,y in endpoints]))
+        metrics.extend(sample_lines("merakitoolkit_api_call_duration_seconds_count",
+                                    [({"endpoint":x},y.calls) for x,y in endpoints]))
+        return "\n".join(metrics) + "\n"
+
+    def write_prometheus(self,path,success):
+        '''
+        Writes the statistics to a Prometheus metrics file (eg: for node_exporter textfile collector)
+        the file is replaced atomically, so it is never read partially written
+        '''
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path,"w",encoding="utf-8") as metrics_file:
+            metrics_file.write(self.prometheus(success))
+        os.replace(temporary_path,path)
+
+
+def sample_lines(name,samples):
+    '''Returns the Prometheus text lines of the samples (labels dictionary, value) of a metric'''
+    lines = []
+    for labels,value in samples:
+        labels = ",".join(f'{x}="{escape_label(y)}"' for x,y in labels.items())
+        lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+    return lines
+
+
+def escape_label(value):
+    '''Escapes a Prometheus label value'''
+    return str(value).replace("\\","\\\\").replace('"','\\"').replace("\n","\\n")
@@ -3,17 +3,64 @@ merakitoolkitsupport
 ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 module for MerakiToolkit support functions
 """
-import random
+import functools
+import io
+import json
+import os
+import secrets
 import string
-import jinja2
-import pyqrcode
-from xkcdpass import xkcd_password as xp
+from email.mime.base import MIMEBase
+from email import encoders
+# jinja2, pyqrcode and xkcdpass are imported only by the functions using them (fast CLI startup)
 
-def generate_email_body(templatename,path,ssid,psk,images=None):
-    '''Generate email body from a jinja template <templatename>'''
+# QR codes kept in memory (one for each SSID and PSK, shared by the emails with the same PSK)
+QRCODE_CACHE_SIZE = 256
+# images of the email templates kept encoded in memory (one for each version of a file)
+IMAGE_CACHE_SIZE = 256
+IMAGE_EXTENSIONS = ("png","bmp","jpg","gif")
+# files of an email template (text and HTML body)
+TEMPLATE_FILES = ["templatetxt.j2","templatehtml.j2"]
+
+# symbols added to the generated PSKs
+PSK_SYMBOLS = "@#!.&()="
+# PSK policies: job (the same PSK for all the networks of a job) or network (a unique generated PSK for each network SSID)
+PSK_POLICIES = ["job","network"]
+
+# settings of a PSK change job, settings missing from a job are taken from the operation settings
+JOB_SETTINGS = [
+    "organization",
+    "network",
+    "tags",
+    "tags_filter",
+    "ssid",
+    "passphrase",
+    "passrandomize",
+    "email",
+    "emailtemplate",
+    ]
+
+@functools.lru_cache(maxsize=None)
+def template_environment(path,bytecode_cache=None):
+    '''
+    Returns the jinja environment of the templates in the directory <path> (one for each directory and bytecode cache)
+    templates are compiled once and compiled again only when their file is modified (auto_reload)
+    compiled templates are saved in the directory <bytecode_cache> (if given) and reused by the following runs
+    '''
+    import jinja2 # pylint: disable=import-outside-toplevel
+    if bytecode_cache:
+        os.makedirs(bytecode_cache,exist_ok=True)
+        bytecode_cache = jinja2.FileSystemBytecodeCache(bytecode_cache)
+    return jinja2.Environment(loader=jinja2.FileSystemLoader(path),auto_reload=True,bytecode_cache=bytecode_cache)
+
+def generate_email_body(templatename,path,ssid,psk,images=None,network=None,bytecode_cache=None): # pylint: disable=too-many-arguments disable=too-many-positional-arguments
+    '''
+    Generate email body from a jinja template <templatename> (templates are compiled once, see template_environment)
+    <network> is the name of the network of a notification of a single network (None for the notification of a job)
+    '''
     data = {
         "ssid":ssid,
         "psk":psk,
+        "network":network,
     }
 
     # Adds images to the dictionary to unpack in the jinja template
@@ -21,34 +68,150 @@ def generate_email_body(templatename,path,ssid,psk,images=None):
     if images:
         for image in images:
             data[image] = image
-    environment = jinja2.Environment(loader=jinja2.FileSystemLoader(path))
+    environment = template_environment(os.path.abspath(path),bytecode_cache)
     template = environment.get_template(templatename)
     content = template.render(**data)
     return content
 
-def generate_qrcode(ssid,psk,path,wifi_protocol="WPA2"):
-    '''generate a QRcode from a given SSID and PSK and save it to QRcode.png file'''
+@functools.lru_cache(maxsize=QRCODE_CACHE_SIZE)
+def qrcode_png(ssid,psk,wifi_protocol="WPA2",scale=4):
+    '''Returns the PNG image (bytes) of the QRcode of a given SSID and PSK, generated in memory once for each input'''
+    import pyqrcode # pylint: disable=import-outside-toplevel
     qrcode = pyqrcode.create(F'WIFI:S:{ssid};T:{wifi_protocol};P:{psk};;')
-    qrcode.png (path+'qrcode.png', scale=4)
-    return qrcode
+    image = io.BytesIO()
+    qrcode.png(image,scale=scale)
+    return image.getvalue()
+
+def image_attachment(filename,data):
+    '''Returns a MIME part with an image attached to an email, referenced in HTML templates by the dot-stripped filename'''
+    # set attachment mime and file name, the image type is the file extension
+    mime = MIMEBase('image', filename[-3:], filename=filename)
+    # add required header data:
+    mime.add_header('Content-Disposition', 'attachment', filename=filename)
+    mime.add_header('X-Attachment-Id', filename)
+    mime.add_header('Content-ID', f'<{filename.replace(".","")}>')
+    # read attachment file content into the MIMEBase object and encode it with base64
+    mime.set_payload(data)
+    encoders.encode_base64(mime)
+    return mime
+
+@functools.lru_cache(maxsize=IMAGE_CACHE_SIZE)
+def template_image(path,mtime,size): # pylint: disable=unused-argument
+    '''
+    Returns the MIME part of the image file <path>, read and encoded once for each version (<mtime> and <size>) of the file
+    the same part is attached to all emails and must not be modified
+    '''
+    with open(path,"rb") as imagefile:
+        return image_attachment(os.path.basename(path),imagefile.read())
+
+def template_images(path):
+    '''
+    Returns the filenames and MIME parts of the images in the template directory <path> (see template_image)
+    a qrcode.png file is excluded (the QR code is generated), images that can't be read are skipped
+    '''
+    images = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if not entry.name.lower().endswith(IMAGE_EXTENSIONS) or entry.name == "qrcode.png":
+                continue
+            try:
+                stat = entry.stat()
+                images.append((entry.name,template_image(os.path.abspath(entry.path),stat.st_mtime_ns,stat.st_size)))
+            except OSError as err:
+                print("An error occurred while opening logo image: ",err)
+    return images
+
+@functools.lru_cache(maxsize=None)
+def psk_wordlist(min_length=8,max_length=12):
+    '''
+    Returns the words of the xkcdpass dictionary used to generate PSKs (the dictionary is read once)
+    words with other characters than letters (eg: drop-down) are excluded: a letter of the PSK is always uppercase
+    '''
+    from xkcdpass import xkcd_password as xp # pylint: disable=import-outside-toplevel
+    words = xp.generate_wordlist(wordfile=xp.locate_wordfile(),min_length=min_length,max_length=max_length)
+    return tuple(x for x in words if x.isalpha())
+
+def randomize_psk(psk,bits=None):
+    '''
+    Returns a PSK with an uppercase letter, a symbol and a digit at random positions
+    all the random choices are taken from <bits> (a random integer of at least 64 bits, drawn with secrets if None)
+    '''
+    if bits is None:
+        bits = secrets.randbits(64)
+    bits,uppercase_position = divmod(bits,len(psk))
+    bits,symbol_position = divmod(bits,len(psk) + 1)
+    bits,symbol = divmod(bits,len(PSK_SYMBOLS))
+    bits,digit_position = divmod(bits,len(psk) + 2)
+    digit = string.digits[bits % 10]
+    psk = psk[:uppercase_position] + psk[uppercase_position].upper() + psk[uppercase_position + 1:]
+    psk = psk[:symbol_position] + PSK_SYMBOLS[symbol] + psk[symbol_position:]
+    return psk[:digit_position] + digit + psk[digit_position:]
 
 def generate_psk(psk_list:list,randomize:bool=False):
     '''Returns a PSK given a list of words, if empty generate a random PSK'''
-    psk = random.choice(psk_list)
+    psk = secrets.choice(psk_list)
     if psk == "":
         # Generate a psk from a dictionary
-        word_file = xp.locate_wordfile()
-        words = xp.generate_wordlist(wordfile=word_file, min_length=8, max_length=12)
-        acrostic_word = random.choice(words)
-        psk_list_generated = xp.generate_xkcdpassword(words, acrostic=acrostic_word, numwords=10, delimiter="::").split("::")
-        psk = random.choice(psk_list_generated)
+        psk = secrets.choice(psk_wordlist())
         randomize = True
     if randomize:
-        uppercase_position = random.randint(0,len(psk)-1)
-        symbols_position = [random.randint(0,len(psk)-1) for x in range(1)]
-        digit_position = random.randint(0,len(psk)-1)
-        psk = psk[:uppercase_position] + psk[uppercase_position].upper() + psk[uppercase_position + 1:]
-        for symbol_position in symbols_position:
-            psk = psk[:symbol_position] + random.choice("@#!.&()=") + psk[symbol_position:]
-        psk = psk[:digit_position] + random.choice(string.digits) + psk[digit_position:]
+        psk = randomize_psk(psk)
     return psk
+
+
+class PSKGenerator():
+    '''
+    Generates unique random PSKs (as generate_psk without a PSK in input) for the network SSIDs of an operation
+    the dictionary is read once and PSKs already generated by the generator are never repeated
+    '''
+    def __init__(self):
+        self.words = psk_wordlist()
+        self.generated = set()
+
+    def generate(self):
+        '''Returns a new PSK'''
+        while True:
+            # a single draw of random bits for the word and its randomization
+            bits,word = divmod(secrets.randbits(96),len(self.words))
+            psk = randomize_psk(self.words[word],bits)
+            if psk not in self.generated:
+                self.generated.add(psk)
+                return psk
+
+    def batch(self,count):
+        '''Returns <count> new PSKs'''
+        return [self.generate() for x in range(count)]
+
+
+def load_jobs(path):
+    '''
+    Returns the PSK change jobs listed in a JSON job file
+    the file contains a list of jobs (or a dictionary with the list in "jobs"), each job is a dictionary
+    with the settings in JOB_SETTINGS, a single organization/network/tag/email can be given as a string
+    the email template of a job must be a folder with the template files (TEMPLATE_FILES)
+    '''
+    with open(path,"r",encoding="utf-8") as jobs_file:
+        jobs = json.load(jobs_file)
+    if isinstance(jobs,dict):
+        jobs = jobs.get("jobs")
+    if not isinstance(jobs,list) or not jobs:
+        raise ValueError(f"{path} : no jobs defined")
+    for number,job in enumerate(jobs,1):
+        if not isinstance(job,dict):
+            raise ValueError(f"{path} : job {job} is not a dictionary of settings")
+        unknown_settings = [x for x in job if x not in JOB_SETTINGS]
+        if unknown_settings:
+            raise ValueError(f"{path} : unknown job settings {unknown_settings}")
+        for setting in ["organization","network","tags","email"]:
+            if isinstance(job.get(setting),str):
+                job[setting] = [job[setting]]
+        # email template path is used as a prefix of the template files names
+        if job.get("emailtemplate") and job["emailtemplate"][-1] != "/":
+            job["emailtemplate"] += "/"
+        if job.get("emailtemplate"):
+            if not os.path.isdir(job["emailtemplate"]):
+                raise ValueError(f"{path} : email template {job['emailtemplate']} of job {number} is not a folder")
+            missing = [x for x in TEMPLATE_FILES if not os.path.isfile(job["emailtemplate"] + x)]
+            if missing:
+                raise ValueError(f"{path} : email template {job['emailtemplate']} of job {number} is missing {missing}")
+    return jobs
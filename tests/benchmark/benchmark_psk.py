@@ -0,0 +1,177 @@
+"""
+benchmark_psk
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+PSK change benchmark against the local mock Meraki dashboard (mockdashboard)
+reports wall time, requests per second and peak memory (maximum resident set size of the MerakiToolkit process)
+of the discovery (dryrun) and update phases
+for each inventory size, run from the repository root:
+    PYTHONPATH=. python tests/benchmark/benchmark_psk.py [--networks 10 1000 10000 50000] [--output results.json]
+mock dashboard and MerakiToolkit run in separate processes, so measures of each run are not affected by the others
+"""
+
+# standard libraries
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import sys
+import time
+
+# peak memory is read from the process resource usage (not available on Windows)
+try:
+    import resource
+except ImportError:
+    resource = None # pylint: disable=invalid-name
+
+# additional libraries
+import mockdashboard # pylint: disable=import-error
+
+
+def serve(dashboard_options,base_url_queue,stop_event,stats_queue):
+    '''Runs the mock dashboard until stop_event is set, then returns its requests accounting'''
+    async def run():
+        dashboard = mockdashboard.MockDashboard(**dashboard_options)
+        base_url_queue.put(await dashboard.start())
+        await asyncio.get_running_loop().run_in_executor(None,stop_event.wait)
+        stats_queue.put(dashboard.stats())
+        await dashboard.stop()
+    asyncio.run(run())
+
+
+def peak_memory_mb():
+    '''
+    Returns the peak memory in MB of the running process (maximum resident set size), None if not available
+    memory is not traced during the timed operation (eg: tracemalloc slows it down several times)
+    '''
+    if resource is None:
+        return None
+    # maximum resident set size is in kilobytes (bytes on macOS)
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024 / 1024 if sys.platform == "darwin" else maxrss / 1024
+
+
+def change_psk(settings,results_queue):
+    '''Runs a PSK change and returns its wall time, peak memory and outcome'''
+    from merakitoolkit import merakitoolkit # pylint: disable=import-outside-toplevel
+    # dryrun report and errors are printed only if the operation fails
+    output = io.StringIO()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        merakiobj = merakitoolkit.MerakiToolkit(settings)
+        asyncio.run(merakiobj.pskchangeasync())
+    elapsed = time.perf_counter() - started
+    if not merakiobj.current_operation["success"]:
+        print(output.getvalue()[-2000:])
+    results_queue.put({
+        "seconds": elapsed,
+        "peak_memory_mb": peak_memory_mb(),
+        "success": merakiobj.current_operation["success"],
+        "networks_to_process": len(merakiobj.current_operation.get("networks_to_process",[])),
+        })
+
+
+def benchmark(phase,networks,args):
+    '''Runs a phase (discovery or update) for an inventory of <networks> networks and returns its measures'''
+    dashboard_options = {
+        "organizations": max(1,networks // args.networks_per_organization),
+        "networks": networks,
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "rate_limited": args.rate_limited,
+        "error_rate": args.error_rate,
+        "rate_limit": args.server_rate_limit,
+        "retry_after": args.retry_after,
+        "seed": 1,
+        }
+    base_url_queue = multiprocessing.Queue()
+    stats_queue = multiprocessing.Queue()
+    results_queue = multiprocessing.Queue()
+    stop_event = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve,args=(dashboard_options,base_url_queue,stop_event,stats_queue))
+    server.start()
+    try:
+        settings = {
+            "apikey": mockdashboard.APIKEY,
+            "command": "psk",
+            "tags": None,
+            "verbose": 0,
+            "dryrun": phase == "discovery",
+            "passphrase": "benchmark1",
+            "passrandomize": False,
+            "email": None,
+            "emailtemplate": None,
+            "smtp_server": None,
+            "smtp_port": None,
+            "smtp_mode": "TLS",
+            "smtp_user": None,
+            "smtp_pass": None,
+            "organization": ["ALL"],
+            "network": ["ALL"],
+            "ssid": mockdashboard.SSID_NAME,
+            "base_url": base_url_queue.get(timeout=60),
+            "rate_limit": args.rate_limit,
+            "concurrency": args.concurrency,
+            "update_concurrency": args.update_concurrency,
+            "action_batches": args.action_batches,
+            "retry_backoff": args.retry_backoff,
+            }
+        client = multiprocessing.Process(target=change_psk,args=(settings,results_queue))
+        client.start()
+        results = results_queue.get()
+        client.join()
+    finally:
+        stop_event.set()
+    stats = stats_queue.get(timeout=60)
+    server.join()
+    results.update({
+        "phase": phase,
+        "networks": networks,
+        "organizations": dashboard_options["organizations"],
+        "requests": stats["requests"],
+        "requests_per_second": stats["requests"] / results["seconds"],
+        "statuses": stats["statuses"],
+        })
+    return results
+
+
+def main():
+    '''Runs the benchmarks and prints a report'''
+    parser = argparse.ArgumentParser(description="MerakiToolkit PSK change benchmark on a local mock Meraki dashboard")
+    parser.add_argument("--networks",type=int,nargs="+",default=[10,1000,10000,50000])
+    parser.add_argument("--phases",nargs="+",choices=["discovery","update"],default=["discovery","update"])
+    parser.add_argument("--networks-per-organization",type=int,default=1000)
+    parser.add_argument("--latency",type=float,default=0.02,help="mock dashboard response time in seconds")
+    parser.add_argument("--jitter",type=float,default=0.01)
+    parser.add_argument("--rate-limited",type=float,default=0,help="probability of a 429 error")
+    parser.add_argument("--error-rate",type=float,default=0,help="probability of a 500 error")
+    parser.add_argument("--server-rate-limit",type=int,default=0,help="mock dashboard requests per second by Organization")
+    parser.add_argument("--retry-after",type=int,default=1)
+    parser.add_argument("--rate-limit",type=int,default=100000,help="MerakiToolkit requests per second by Organization")
+    parser.add_argument("--concurrency",type=int,default=20)
+    parser.add_argument("--update-concurrency",type=int,default=10)
+    parser.add_argument("--retry-backoff",type=float,default=1)
+    parser.add_argument("--action-batches",action="store_true")
+    parser.add_argument("--output",help="JSON file to save the results (eg: to compare with a previous run)")
+    args = parser.parse_args()
+
+    results = []
+    print(f'{"Phase:":<10} {"Networks:":>10} {"Orgs:":>6} {"Seconds:":>10} {"Requests:":>10} {"Req/s:":>10} {"Peak MB:":>10} {"429:":>6} {"5XX:":>6}') # pylint: disable=line-too-long
+    for networks in args.networks:
+        for phase in args.phases:
+            result = benchmark(phase,networks,args)
+            results.append(result)
+            server_errors = sum(y for x,y in result["statuses"].items() if x.startswith("5"))
+            print(f'{phase:<10} {networks:>10} {result["organizations"]:>6} {result["seconds"]:>10.2f} '
+                  f'{result["requests"]:>10} {result["requests_per_second"]:>10.1f} {result["peak_memory_mb"] or 0:>10.1f} '
+                  f'{result["statuses"].get("429",0):>6} {server_errors:>6}')
+            if not result["success"]:
+                print(f"WARNING: {phase} of {networks} networks did not complete successfully")
+    if args.output:
+        with open(args.output,"w",encoding="utf-8") as output_file:
+            json.dump(results,output_file,indent=2)
+
+
+if __name__ == "__main__":
+    main()
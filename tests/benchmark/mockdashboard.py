@@ -0,0 +1,300 @@
+"""
+mockdashboard
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+local Meraki dashboard API serving a synthetic inventory, for MerakiToolkit tests and benchmarks
+can be started standalone and used with merakitoolkit psk --base-url <URL printed at startup>
+"""
+
+# standard libraries
+import argparse
+import asyncio
+import collections
+import json
+import random
+import time
+
+# additional libraries
+from aiohttp import web
+
+# SSID changed by the benchmarks in every wireless network (SSID position 1)
+SSID_NAME = "Benchmark"
+SSID_PSK = "benchmark"
+APIKEY = "123456789"
+
+
+class MockDashboard(): # pylint: disable=too-many-arguments disable=too-many-positional-arguments
+    '''
+    Synthetic Meraki dashboard with <organizations> Organizations and <networks> Networks in total,
+    each wireless network has <ssids> SSIDs (SSID_NAME in position 1), one network out of ten is a camera network
+    every request is delayed by <latency> seconds +/- <jitter>, requests fail with a 429 error
+    (Retry-After <retry_after>) with probability <rate_limited> or when an Organization exceeds
+    <rate_limit> requests per second (0 for no limit), and with a 500 error with probability <error_rate>
+    networks are returned in a single page: Meraki SDK follows pagination links only on meraki.com hosts
+    '''
+    def __init__(self,
+                 organizations=1,
+                 networks=10,
+                 ssids=15,
+                 latency=0,
+                 jitter=0,
+                 rate_limited=0,
+                 error_rate=0,
+                 rate_limit=0,
+                 retry_after=1,
+                 seed=None):
+        self.ssids = ssids
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limited = rate_limited
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.organizations = [{"id":str(100000+x),"name":f"Organization {x}"} for x in range(organizations)]
+        self.networks = {}
+        self.networks_by_organization = {x["id"]: [] for x in self.organizations}
+        for x in range(networks):
+            organization = self.organizations[x % organizations]
+            network = {
+                "id": f"L_{x}",
+                "organizationId": organization["id"],
+                "name": f"Network {x}",
+                "productTypes": ["camera"] if x % 10 == 9 else ["appliance","switch","wireless"],
+                "tags": [f"group{x % 10}"],
+                "isBoundToConfigTemplate": False,
+                }
+            self.networks[network["id"]] = network
+            self.networks_by_organization[organization["id"]].append(network)
+        # SSIDs are generated at each request, only changed PSKs are stored: (network ID, SSID number) -> PSK
+        self.psks = {}
+        self.action_batches = {}
+        # requests accounting: by operation, by HTTP status and requests in the current second by organization
+        self.operations = collections.Counter()
+        self.statuses = collections.Counter()
+        self.window = {}
+        # errors (HTTP status) returned to the next API requests before failures injection
+        self.failures = collections.deque()
+        self.runner = None
+
+    def ssid(self,network_id,number):
+        '''Returns the SSID of a network in position <number>'''
+        if number == 0:
+            ssid = {"number":number,"name":f"{self.networks[network_id]['name']} - wireless WiFi","enabled":True}
+        elif number == 1:
+            ssid = {"number":number,"name":SSID_NAME,"enabled":True}
+        else:
+            return {"number":number,"name":f"Unconfigured SSID {number+1}","enabled":False,"authMode":"open"}
+        ssid["authMode"] = "psk"
+        ssid["encryptionMode"] = "wpa"
+        ssid["wpaEncryptionMode"] = "WPA2 only"
+        ssid["psk"] = self.psks.get((network_id,number),SSID_PSK)
+        return ssid
+
+    def request_organization(self,request):
+        '''Returns the Organization ID of a request (rate limits are applied by Organization)'''
+        if "organizationId" in request.match_info:
+            return request.match_info["organizationId"]
+        if request.match_info.get("networkId") in self.networks:
+            return self.networks[request.match_info["networkId"]]["organizationId"]
+        return None
+
+    def over_rate_limit(self,organization_id):
+        '''Counts a request of an Organization and returns True if it exceeds the requests per second'''
+        second = int(time.monotonic())
+        window = self.window.get(organization_id)
+        if window is None or window[0] != second:
+            window = self.window[organization_id] = [second,0]
+        window[1] += 1
+        return window[1] > self.rate_limit
+
+    def error(self,status,message,headers=None):
+        '''Returns a Meraki dashboard error response'''
+        return web.json_response({"errors":[message]},status=status,headers=headers)
+
+    @web.middleware
+    async def middleware(self,request,handler):
+        '''Applies authentication, latency and failures injection to API requests and counts them'''
+        if request.path.startswith("/_"):
+            return await handler(request)
+        self.operations[request.match_info.route.name] += 1
+        response = await self.process(request,handler)
+        self.statuses[response.status] += 1
+        return response
+
+    async def process(self,request,handler):
+        '''Processes an API request as Meraki dashboard would do'''
+        if request.headers.get("Authorization") != f"Bearer {APIKEY}":
+            return self.error(401,"Invalid API key")
+        delay = self.latency + self.random.uniform(-self.jitter,self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.failures:
+            status = self.failures.popleft()
+            if status == 429:
+                return self.error(429,"Too many requests",{"Retry-After":str(self.retry_after)})
+            return self.error(status,"Injected failure")
+        if self.rate_limit and self.over_rate_limit(self.request_organization(request)):
+            return self.error(429,"Too many requests",{"Retry-After":str(self.retry_after)})
+        if self.random.random() < self.rate_limited:
+            return self.error(429,"Too many requests",{"Retry-After":str(self.retry_after)})
+        if self.random.random() < self.error_rate:
+            return self.error(500,"Internal server error")
+        return await handler(request)
+
+    async def get_organizations(self,request): # pylint: disable=unused-argument
+        '''GET /organizations'''
+        return web.json_response(self.organizations)
+
+    async def get_organization_networks(self,request):
+        '''GET /organizations/{organizationId}/networks (tags filter applied)'''
+        networks = self.networks_by_organization.get(request.match_info["organizationId"])
+        if networks is None:
+            return self.error(404,"Organization not found")
+        tags = request.query.getall("tags[]",[])
+        if tags:
+            tags_match = all if request.query.get("tagsFilterType") == "withAllTags" else any
+            networks = [x for x in networks if tags_match(tag in x["tags"] for tag in tags)]
+        return web.json_response(networks)
+
+    async def get_organization_configuration_changes(self,request): # pylint: disable=unused-argument
+        '''GET /organizations/{organizationId}/configurationChanges (no changes)'''
+        return web.json_response([])
+
+    async def get_network_wireless_ssids(self,request):
+        '''GET /networks/{networkId}/wireless/ssids'''
+        network = self.networks.get(request.match_info["networkId"])
+        if network is None:
+            return self.error(404,"Network not found")
+        if "wireless" not in network["productTypes"]:
+            return self.error(400,"This endpoint only supports wireless networks")
+        return web.json_response([self.ssid(network["id"],x) for x in range(self.ssids)])
+
+    async def update_network_wireless_ssid(self,request):
+        '''PUT /networks/{networkId}/wireless/ssids/{number} (only PSK is applied)'''
+        network = self.networks.get(request.match_info["networkId"])
+        number = int(request.match_info["number"])
+        if network is None or "wireless" not in network["productTypes"] or number >= self.ssids:
+            return self.error(404,"SSID not found")
+        body = await request.json()
+        if "psk" in body:
+            self.psks[(network["id"],number)] = body["psk"]
+        return web.json_response(self.ssid(network["id"],number))
+
+    async def create_organization_action_batch(self,request):
+        '''POST /organizations/{organizationId}/actionBatches (actions applied, completed at the first status check)'''
+        body = await request.json()
+        if len(body.get("actions",[])) > 100:
+            return self.error(400,"Maximum number of actions in an asynchronous batch is 100")
+        for action in body["actions"]:
+            resource = action["resource"].split("/")
+            self.psks[(resource[2],int(resource[5]))] = action["body"]["psk"]
+        batch = {
+            "id": str(len(self.action_batches)+1),
+            "organizationId": request.match_info["organizationId"],
+            "confirmed": body.get("confirmed",False),
+            "synchronous": body.get("synchronous",False),
+            "status": {"completed":False,"failed":False,"errors":[],"createdResources":[]},
+            "actions": body["actions"],
+            }
+        self.action_batches[batch["id"]] = batch
+        return web.json_response(batch,status=201)
+
+    async def get_organization_action_batch(self,request):
+        '''GET /organizations/{organizationId}/actionBatches/{actionBatchId}'''
+        batch = self.action_batches.get(request.match_info["actionBatchId"])
+        if batch is None:
+            return self.error(404,"Action batch not found")
+        batch["status"]["completed"] = True
+        return web.json_response(batch)
+
+    async def get_stats(self,request): # pylint: disable=unused-argument
+        '''GET /_stats (requests accounting, not part of Meraki dashboard API)'''
+        return web.json_response(self.stats())
+
+    def stats(self):
+        '''Returns the number of requests received by operation and by HTTP status'''
+        return {
+            "requests": sum(self.operations.values()),
+            "operations": dict(self.operations),
+            "statuses": {str(x): y for x,y in self.statuses.items()},
+            }
+
+    def application(self):
+        '''Returns the aiohttp application serving Meraki dashboard API under /api/v1'''
+        app = web.Application(middlewares=[self.middleware])
+        api = "/api/v1"
+        app.router.add_get(f"{api}/organizations",self.get_organizations,name="getOrganizations")
+        app.router.add_get(f"{api}/organizations/{{organizationId}}/networks",
+                           self.get_organization_networks,name="getOrganizationNetworks")
+        app.router.add_get(f"{api}/organizations/{{organizationId}}/configurationChanges",
+                           self.get_organization_configuration_changes,name="getOrganizationConfigurationChanges")
+        app.router.add_post(f"{api}/organizations/{{organizationId}}/actionBatches",
+                            self.create_organization_action_batch,name="createOrganizationActionBatch")
+        app.router.add_get(f"{api}/organizations/{{organizationId}}/actionBatches/{{actionBatchId}}",
+                           self.get_organization_action_batch,name="getOrganizationActionBatch")
+        app.router.add_get(f"{api}/networks/{{networkId}}/wireless/ssids",
+                           self.get_network_wireless_ssids,name="getNetworkWirelessSsids")
+        app.router.add_put(f"{api}/networks/{{networkId}}/wireless/ssids/{{number}}",
+                           self.update_network_wireless_ssid,name="updateNetworkWirelessSsid")
+        app.router.add_get("/_stats",self.get_stats,name="stats")
+        return app
+
+    async def start(self,host="127.0.0.1",port=0):
+        '''Starts serving (port 0 for a free port) and returns the base URL of the API'''
+        self.runner = web.AppRunner(self.application(),access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner,host,port)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        return f"http://{host}:{port}/api/v1"
+
+    async def stop(self):
+        '''Stops serving'''
+        await self.runner.cleanup()
+
+
+def main():
+    '''Runs a mock Meraki dashboard until interrupted'''
+    parser = argparse.ArgumentParser(description="Local mock Meraki dashboard API")
+    parser.add_argument("--organizations",type=int,default=1)
+    parser.add_argument("--networks",type=int,default=10)
+    parser.add_argument("--ssids",type=int,default=15)
+    parser.add_argument("--latency",type=float,default=0,help="seconds added to each response")
+    parser.add_argument("--jitter",type=float,default=0,help="random variation of the latency in seconds")
+    parser.add_argument("--rate-limited",type=float,default=0,help="probability of a 429 error")
+    parser.add_argument("--error-rate",type=float,default=0,help="probability of a 500 error")
+    parser.add_argument("--rate-limit",type=int,default=0,help="requests per second for each Organization")
+    parser.add_argument("--retry-after",type=int,default=1)
+    parser.add_argument("--host",default="127.0.0.1")
+    parser.add_argument("--port",type=int,default=8080)
+    args = parser.parse_args()
+
+    async def serve():
+        dashboard = MockDashboard(
+            organizations=args.organizations,
+            networks=args.networks,
+            ssids=args.ssids,
+            latency=args.latency,
+            jitter=args.jitter,
+            rate_limited=args.rate_limited,
+            error_rate=args.error_rate,
+            rate_limit=args.rate_limit,
+            retry_after=args.retry_after
+            )
+        base_url = await dashboard.start(args.host,args.port)
+        print(f"Mock Meraki dashboard: {base_url} API key: {APIKEY}")
+        try:
+            while True:
+                await asyncio.sleep(3600)
+        finally:
+            print(json.dumps(dashboard.stats()))
+            await dashboard.stop()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
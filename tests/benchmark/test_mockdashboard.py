@@ -0,0 +1,170 @@
+'''test MerakiToolkit against the local mock Meraki dashboard'''
+
+import asyncio
+import functools
+import logging
+import pytest
+import mockdashboard # pylint: disable=import-error
+import merakitoolkit.merakitoolkit as merakitoolkit # pylint: disable=import-error
+import merakitoolkit.merakitoolkitstats as merakitoolkitstats # pylint: disable=import-error
+
+
+def psk_settings(base_url,**settings):
+    '''return PSK change settings for the mock dashboard SSID in all organizations and networks'''
+    settings_psk= {
+        'apikey': mockdashboard.APIKEY,
+        'tags': None,
+        'verbose': 0,
+        'dryrun': False,
+        'passphrase': "psk12345",
+        'passrandomize': False,
+        'email': None,
+        'emailtemplate': './templates/psk/default/',
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'TLS',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ["ALL"],
+        'network': ["ALL"],
+        "ssid":mockdashboard.SSID_NAME,
+        "command":"psk",
+        "base_url":base_url,
+        "rate_limit":1000,
+        "retry_backoff":0.01,
+        }
+    settings_psk.update(settings)
+    return settings_psk
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+@pytest.mark.parametrize("action_batches",[False,True])
+async def test_mockdashboard_psk_change(action_batches):
+    '''
+    test pskchangeasync method with Meraki SDK requests to the mock dashboard
+    organizations : 3
+    networks : 30 (27 wireless networks)
+    '''
+    dashboard = mockdashboard.MockDashboard(organizations=3,networks=30)
+    base_url = await dashboard.start()
+    try:
+        merakiobj = merakitoolkit.MerakiToolkit(psk_settings(base_url,action_batches=action_batches))
+        await merakiobj.pskchangeasync()
+    finally:
+        await dashboard.stop()
+    assert merakiobj.current_operation["success"] is True
+    assert len(merakiobj.current_operation["networks_to_process"]) == 27
+    assert len([x for x in dashboard.psks.values() if x == "psk12345"]) == 27
+    # camera networks are not looked up
+    assert dashboard.operations["getNetworkWirelessSsids"] == 27
+    if action_batches:
+        assert dashboard.operations["createOrganizationActionBatch"] == 3
+        assert dashboard.operations["updateNetworkWirelessSsid"] == 0
+    else:
+        assert dashboard.operations["updateNetworkWirelessSsid"] == 27
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+async def test_mockdashboard_psk_change_failures():
+    '''
+    test pskchangeasync method with Meraki SDK requests to the mock dashboard failing with 429 and 500 errors
+    organizations : 2
+    networks : 20 (18 wireless networks)
+    '''
+    dashboard = mockdashboard.MockDashboard(organizations=2,networks=20,rate_limited=0.2,error_rate=0.1,retry_after=0,seed=1)
+    base_url = await dashboard.start()
+    try:
+        merakiobj = merakitoolkit.MerakiToolkit(psk_settings(base_url,max_attempts=20))
+        await merakiobj.pskchangeasync()
+    finally:
+        await dashboard.stop()
+    assert dashboard.statuses[429] > 0
+    assert dashboard.statuses[500] > 0
+    assert len([x for x in dashboard.psks.values() if x == "psk12345"]) == 18
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+@pytest.mark.parametrize("status",[429,500])
+async def test_mockdashboard_call_retry_wait(status):
+    '''
+    test dashboard_call method with Meraki SDK requests to the mock dashboard failing once
+    429 errors are waited once for the Retry-After time (organization paused at once, no wait in Meraki SDK)
+    500 errors are retried after the retry policy backoff (no wait in Meraki SDK)
+    '''
+    dashboard = mockdashboard.MockDashboard(retry_after=2)
+    dashboard.failures.append(status)
+    base_url = await dashboard.start()
+    try:
+        merakiobj = merakitoolkit.MerakiToolkit(psk_settings(base_url))
+        merakiobj.stats = merakitoolkitstats.OperationStats()
+        async with merakiobj.connect() as merakiobj.dashboard:
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            call = asyncio.create_task(
+                merakiobj.dashboard_call("100000",merakiobj.dashboard.organizations.getOrganizations)
+                )
+            if status == 429:
+                # organization is paused as soon as the 429 error is received
+                while not dashboard.statuses[status]:
+                    await asyncio.sleep(0.01)
+                await asyncio.sleep(0.1)
+                assert merakiobj.ratelimiter.bucket("100000").paused_until >= started + 2
+            organizations = await call
+            elapsed = loop.time() - started
+    finally:
+        await dashboard.stop()
+    assert organizations == dashboard.organizations
+    assert dashboard.statuses[status] == 1
+    if status == 429:
+        assert 2 <= elapsed < 3
+        assert merakiobj.stats.counters["rate_limit_wait_seconds"] == 2
+    else:
+        assert elapsed < 0.5
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+async def test_mockdashboard_call_logging(caplog):
+    '''
+    test dashboard_call method logging the Meraki SDK requests and responses with the session logger (verbose 3)
+    '''
+    dashboard = mockdashboard.MockDashboard()
+    dashboard.failures.append(500)
+    base_url = await dashboard.start()
+    try:
+        merakiobj = merakitoolkit.MerakiToolkit(psk_settings(base_url))
+        async with merakiobj.connect() as merakiobj.dashboard:
+            merakiobj.dashboard._session._logger = logging.getLogger("merakitoolkit.test") # pylint: disable=protected-access
+            with caplog.at_level(logging.DEBUG,logger="merakitoolkit.test"):
+                await merakiobj.dashboard_call("100000",merakiobj.dashboard.organizations.getOrganizations)
+    finally:
+        await dashboard.stop()
+    messages = [(x.levelname,x.getMessage()) for x in caplog.records]
+    assert [x for x in messages if x[0] == "INFO" and x[1].startswith("GET ")]
+    assert [x for x in messages if x[0] == "WARNING" and "getOrganizations" in x[1] and " - 500 " in x[1]]
+    assert [x for x in messages if x[0] == "INFO" and "getOrganizations" in x[1] and " - 200 " in x[1]]
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+async def test_mockdashboard_call_unsupported_sdk(monkeypatch):
+    '''
+    test connect method with a Meraki SDK session without the attributes used by request_once
+    requests are sent by Meraki SDK (once)
+    '''
+    monkeypatch.setattr(merakitoolkit,"SDK_SESSION_ATTRIBUTES",merakitoolkit.SDK_SESSION_ATTRIBUTES + ["_missing"])
+    dashboard = mockdashboard.MockDashboard()
+    base_url = await dashboard.start()
+    try:
+        merakiobj = merakitoolkit.MerakiToolkit(psk_settings(base_url))
+        async with merakiobj.connect() as merakiobj.dashboard:
+            session = merakiobj.dashboard._session # pylint: disable=protected-access
+            assert not isinstance(session._request,functools.partial) # pylint: disable=protected-access
+            assert session._maximum_retries == 1 # pylint: disable=protected-access
+            organizations = await merakiobj.dashboard_call("100000",merakiobj.dashboard.organizations.getOrganizations)
+    finally:
+        await dashboard.stop()
+    assert organizations == dashboard.organizations
@@ -0,0 +1,63 @@
+'''test the startup time of merakitoolkit command line (commands not calling Meraki dashboard)'''
+
+import json
+import os
+import subprocess
+import sys
+import pytest
+
+# repository root, added to the path of the measured interpreter
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# libraries imported only by the operations that need them
+DEFERRED_MODULES = ["asyncio","meraki","aiohttp","requests","jinja2","pyqrcode","xkcdpass"]
+
+# budget in milliseconds of the import time of the command line (python -X importtime)
+# generous by default as timings depend on the machine (about 5 ms, Meraki SDK alone takes about 200 ms),
+# can be set with the MERAKITK_STARTUP_BUDGET_MS environment variable (eg: 20)
+STARTUP_BUDGET_MS = float(os.environ.get("MERAKITK_STARTUP_BUDGET_MS",100))
+
+# runs the command line in the measured interpreter and prints the modules imported
+STARTUP_CODE = '''
+import json
+import sys
+from merakitoolkit import __main__
+sys.argv = ["merakitoolkit"] + json.loads(sys.argv[1])
+try:
+    __main__.main()
+except SystemExit:
+    pass
+sys.__stderr__.write("modules: " + json.dumps(sorted(sys.modules)) + "\\n")
+'''
+
+
+def startup(args):
+    '''
+    Runs the command line with <args> in a new interpreter with -X importtime
+    returns the import times in microseconds (cumulative, by module) and the modules imported
+    '''
+    env = dict(os.environ,PYTHONPATH=ROOT)
+    result = subprocess.run(
+        [sys.executable,"-X","importtime","-c",STARTUP_CODE,json.dumps(args)],
+        capture_output=True,text=True,check=True,env=env,cwd=ROOT
+        )
+    import_times = {}
+    modules = []
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "cumulative" not in line:
+            _,cumulative,module = line[len("import time:"):].split("|")
+            import_times[module.strip()] = int(cumulative)
+        elif line.startswith("modules: "):
+            modules = json.loads(line[len("modules: "):])
+    return import_times,modules
+
+
+@pytest.mark.parametrize("args",[["--help"],["psk","--help"],["psktemplategen","--help"]])
+def test_startup(args):
+    '''test commands not calling Meraki dashboard: heavy libraries are not imported (and import time is in budget)'''
+    import_times,modules = startup(args)
+    imported = [x for x in DEFERRED_MODULES if x in modules]
+    assert not imported, f"{imported} imported by merakitoolkit {' '.join(args)}"
+    startup_ms = import_times["merakitoolkit.__main__"] / 1000
+    slowest = sorted(import_times.items(),key=lambda x: x[1],reverse=True)[:10]
+    assert startup_ms <= STARTUP_BUDGET_MS, f"startup {startup_ms:.1f} ms over budget, slowest imports (us): {slowest}"
@@ -1,7 +1,21 @@
 '''tests common functionalities for merakitoolkit'''
+import os
 import sys
+import csv
+import json
+import asyncio
+import pytest
+import jinja2
 import merakitoolkit.merakitoolkitparser as merakitoolkitparser # pylint: disable=import-error
 import merakitoolkit.merakitoolkit as merakitoolkit # pylint: disable=import-error
+import merakitoolkit.merakitoolkitcache as merakitoolkitcache # pylint: disable=import-error
+import merakitoolkit.merakitoolkitratelimit as merakitoolkitratelimit # pylint: disable=import-error
+import merakitoolkit.merakitoolkitsupport as merakitoolkitsupport # pylint: disable=import-error
+import merakitoolkit.merakitoolkitstats as merakitoolkitstats # pylint: disable=import-error
+import merakitoolkit.merakitoolkitoutput as merakitoolkitoutput # pylint: disable=import-error
+import merakitoolkit.merakitoolkitjournal as merakitoolkitjournal # pylint: disable=import-error
+import merakitoolkit.merakitoolkitsmtp as merakitoolkitsmtp # pylint: disable=import-error
+import merakitoolkit.merakitoolkitnotify as merakitoolkitnotify # pylint: disable=import-error
 
 def test_import_success():
     '''Verify that merakitoolkit can be imported successfully'''
@@ -41,6 +55,38 @@ def test_parser_psk_min_params(monkeypatch):
     assert args.tags is None
     assert args.passphrase is None
     assert args.passrandomize is False
+    assert args.org_concurrency == 10
+    assert args.rate_limit == 10
+    assert args.concurrency == 20
+    assert args.update_concurrency == 10
+    assert args.max_attempts == 5
+    assert args.retry_backoff == 1
+    assert args.call_deadline == 300
+    assert args.all_product_types is False
+    assert args.tags_filter == "any"
+    assert args.cache is False
+    assert args.refresh_cache is False
+    assert args.cache_ttl == 86400
+    assert args.cache_file is None
+    assert args.incremental is False
+    assert args.jobs_file is None
+    assert args.action_batches is False
+    assert args.action_batch_size == 100
+    assert args.base_url is None
+    assert args.stats is False
+    assert args.stats_file is None
+    assert args.metrics_file is None
+    assert args.output is None
+    assert args.output_file is None
+    assert args.journal is None
+    assert args.resume is None
+    assert args.smtp_connections == 2
+    assert args.smtp_attempts == 3
+    assert args.template_cache is None
+    assert args.psk_policy == "job"
+    assert args.notify_mode == "job"
+    assert args.recipients_file is None
+    assert args.render_processes is None
 
 def test_parser_psk_all_params(monkeypatch):
     '''
@@ -65,7 +111,38 @@ def test_parser_psk_all_params(monkeypatch):
     "--smtp-mode","STARTTLS",
     "--smtp-user","user-smtp",
     "--smtp-pass","pass-smtp",
-    "--smtp-sender","MerakiTookit!"
+    "--smtp-sender","MerakiTookit!",
+    "--org-concurrency","3",
+    "--rate-limit","5",
+    "--concurrency","4",
+    "--update-concurrency","2",
+    "--max-attempts","3",
+    "--retry-backoff","0.5",
+    "--call-deadline","30",
+    "--all-product-types",
+    "--tags-filter","all",
+    "--cache",
+    "--refresh-cache",
+    "--cache-ttl","60",
+    "--incremental",
+    "--cache-file","./inventory.sqlite3",
+    "--jobs-file","./jobs.json",
+    "--action-batches",
+    "--action-batch-size","20",
+    "--base-url","http://127.0.0.1:8080/api/v1",
+    "--stats",
+    "--stats-file","./stats.json",
+    "--metrics-file","./merakitoolkit.prom",
+    "--output","csv",
+    "--output-file","./results.csv",
+    "--journal","./journal.jsonl",
+    "--smtp-connections","4",
+    "--smtp-attempts","5",
+    "--template-cache","./templatecache",
+    "--psk-policy","network",
+    "--notify-mode","network",
+    "--recipients-file","./recipients.json",
+    "--render-processes","2"
     ])
 
     # Modify sys.exit behavior to prevent test failure
@@ -98,4 +175,557 @@ def test_parser_psk_all_params(monkeypatch):
     assert args.smtp_pass == "pass-smtp"
     assert args.smtp_sender == "MerakiTookit!"
     assert args.passrandomize is True
+    assert args.org_concurrency == 3
+    assert args.rate_limit == 5
+    assert args.concurrency == 4
+    assert args.update_concurrency == 2
+    assert args.max_attempts == 3
+    assert args.retry_backoff == 0.5
+    assert args.call_deadline == 30
+    assert args.all_product_types is True
+    assert args.tags_filter == "all"
+    assert args.cache is True
+    assert args.refresh_cache is True
+    assert args.cache_ttl == 60
+    assert args.cache_file == "./inventory.sqlite3"
+    assert args.incremental is True
+    assert args.jobs_file == "./jobs.json"
+    assert args.action_batches is True
+    assert args.action_batch_size == 20
+    assert args.base_url == "http://127.0.0.1:8080/api/v1"
+    assert args.stats is True
+    assert args.stats_file == "./stats.json"
+    assert args.metrics_file == "./merakitoolkit.prom"
+    assert args.output == "csv"
+    assert args.output_file == "./results.csv"
+    assert args.journal == "./journal.jsonl"
+    assert args.resume is None
+    assert args.smtp_connections == 4
+    assert args.smtp_attempts == 5
+    assert args.template_cache == "./templatecache"
+    assert args.psk_policy == "network"
+    assert args.notify_mode == "network"
+    assert args.recipients_file == "./recipients.json"
+    assert args.render_processes == 2
     assert return_code == 0
+
+def test_parser_psk_jobs_file(monkeypatch):
+    '''test main call with a job file instead of organization, network and SSID arguments'''
+    monkeypatch.setattr("sys.argv",["/merakitoolkit/__main__.py","psk","--jobs-file","./jobs.json"])
+    args,return_code = merakitoolkitparser.parser()
+    assert args.jobs_file == "./jobs.json"
+    assert args.organization is None
+    assert args.ssid is None
+    assert return_code == 0
+
+    # without a job file organization, network and SSID are required
+    monkeypatch.setattr("sys.argv",["/merakitoolkit/__main__.py","psk","--organization","Organization"])
+    with pytest.raises(SystemExit):
+        merakitoolkitparser.parser()
+
+@pytest.mark.parametrize("option",["--org-concurrency","--concurrency","--update-concurrency","--rate-limit"])
+def test_parser_psk_positive_int(monkeypatch,option):
+    '''test options that must be a positive integer'''
+    arguments = ["/merakitoolkit/__main__.py","psk","--organization","Organization","--network","ALL","-s","SSID"]
+    monkeypatch.setattr("sys.argv",arguments + [option,"3"])
+    args,_ = merakitoolkitparser.parser()
+    assert vars(args)[option[2:].replace("-","_")] == 3
+    for value in ["0","-1","two"]:
+        monkeypatch.setattr("sys.argv",arguments + [option,value])
+        with pytest.raises(SystemExit):
+            merakitoolkitparser.parser()
+
+def test_load_jobs(tmp_path):
+    '''test job file loading and validation'''
+    jobs_file = tmp_path / "jobs.json"
+    template_path = tmp_path / "template"
+    template_path.mkdir()
+    (template_path / "templatetxt.j2").write_text("PSK: {{ psk }}",encoding="utf-8")
+    (template_path / "templatehtml.j2").write_text("<p>PSK: {{ psk }}</p>",encoding="utf-8")
+    jobs_file.write_text(json.dumps({"jobs":[
+        {"organization":"Organization","network":["ALL"],"ssid":"Guest","emailtemplate":str(template_path)},
+        {"ssid":"IoT","tags":"iot","passphrase":"iotpsk123"}
+        ]}),encoding="utf-8")
+    jobs = merakitoolkitsupport.load_jobs(str(jobs_file))
+    assert jobs[0]["organization"] == ["Organization"]
+    assert jobs[0]["emailtemplate"] == f"{template_path}/"
+    assert jobs[1]["tags"] == ["iot"]
+    assert "network" not in jobs[1]
+
+    jobs_file.write_text(json.dumps([{"ssid":"Guest","psk":"guestpsk1"}]),encoding="utf-8")
+    with pytest.raises(ValueError):
+        merakitoolkitsupport.load_jobs(str(jobs_file))
+    jobs_file.write_text(json.dumps({"jobs":[]}),encoding="utf-8")
+    with pytest.raises(ValueError):
+        merakitoolkitsupport.load_jobs(str(jobs_file))
+
+    # email template folder missing or without the template files
+    for emailtemplate in [str(tmp_path / "missing"),str(tmp_path)]:
+        jobs_file.write_text(json.dumps([{"ssid":"Guest","emailtemplate":emailtemplate}]),encoding="utf-8")
+        with pytest.raises(ValueError,match="email template"):
+            merakitoolkitsupport.load_jobs(str(jobs_file))
+    (template_path / "templatehtml.j2").unlink()
+    jobs_file.write_text(json.dumps([{"ssid":"Guest","emailtemplate":str(template_path)}]),encoding="utf-8")
+    with pytest.raises(ValueError,match="templatehtml.j2"):
+        merakitoolkitsupport.load_jobs(str(jobs_file))
+
+
+def test_inventory_cache(tmp_path):
+    '''test inventory cache entries expiration, partitioning by API key and exclusion of secrets'''
+    cache_file = str(tmp_path / "inventory.sqlite3")
+    cache = merakitoolkitcache.InventoryCache("123456789",path=cache_file)
+    cache.set_organizations([{"id":"1","name":"Organization"}])
+    cache.set_networks("1",[{"id":"N_1","name":"Network1"}],tags=["tag2","tag1"])
+    cache.set_ssids("N_1",[{"number":0,"name":"SSID","authMode":"psk","psk":"secret123"}])
+    cache.close()
+
+    cache = merakitoolkitcache.InventoryCache("123456789",path=cache_file)
+    assert cache.get_organizations() == [{"id":"1","name":"Organization"}]
+    assert cache.get_networks("1",tags=["tag1","tag2"]) == [{"id":"N_1","name":"Network1"}]
+    assert cache.get_networks("1") is None
+    assert cache.get_networks("1",tags=["tag1","tag2"],tags_filter="all") is None
+    assert cache.get_ssids("N_1")[0]["name"] == "SSID"
+    assert "psk" not in cache.get_ssids("N_1")[0]
+    cache.close()
+
+    # entries belong to the API key that retrieved them
+    cache = merakitoolkitcache.InventoryCache("987654321",path=cache_file)
+    assert cache.get_organizations() is None
+    cache.close()
+
+    # expired entries are not returned
+    cache = merakitoolkitcache.InventoryCache("123456789",path=cache_file,ttl=-1)
+    assert cache.get_organizations() is None
+    cache.close()
+
+
+def test_inventory_cache_configuration_changes(tmp_path):
+    '''test inventory cache invalidation from an organization configuration change log'''
+    cache = merakitoolkitcache.InventoryCache("123456789",path=str(tmp_path / "inventory.sqlite3"),incremental=True)
+    networks = [
+        {"id":"N_1","name":"Network1","isBoundToConfigTemplate":False},
+        {"id":"N_2","name":"Network2","isBoundToConfigTemplate":True},
+        ]
+
+    def populate():
+        cache.set_networks("1",networks)
+        cache.set_ssids("N_1",[{"number":0,"name":"SSID"}])
+        cache.set_ssids("N_2",[{"number":0,"name":"SSID"}])
+
+    # SSID change : only SSIDs of the network
+    populate()
+    cache.apply_configuration_changes("1",[{"networkId":"N_1","ssidNumber":0}])
+    assert cache.get_ssids("N_1") is None
+    assert cache.get_ssids("N_2") is not None
+    assert cache.get_networks("1") is not None
+
+    # network change : SSIDs of the network and networks list
+    populate()
+    cache.apply_configuration_changes("1",[{"networkId":"N_1","ssidNumber":None}])
+    assert cache.get_ssids("N_1") is None
+    assert cache.get_ssids("N_2") is not None
+    assert cache.get_networks("1") is None
+
+    # organization change : networks list
+    populate()
+    cache.apply_configuration_changes("1",[{"networkId":None}])
+    assert cache.get_ssids("N_1") is not None
+    assert cache.get_networks("1") is None
+
+    # change on a network not in cache (configuration template) : networks bound to templates
+    populate()
+    cache.apply_configuration_changes("1",[{"networkId":"L_9","ssidNumber":0}])
+    assert cache.get_ssids("N_1") is not None
+    assert cache.get_ssids("N_2") is None
+    assert cache.get_networks("1") is None
+
+    # incremental entries do not expire
+    populate()
+    cache.ttl = -1
+    assert cache.get_networks("1") is not None
+    cache.close()
+
+
+def test_organization_rate_limiter():
+    '''test rate limiter pacing and pause of an organization without affecting the others'''
+    async def run():
+        loop = asyncio.get_running_loop()
+        ratelimiter = merakitoolkitratelimit.OrganizationRateLimiter(rate=100,burst=0)
+        start = loop.time()
+        # burst of the bucket capacity is served immediately, then 100 requests per second
+        await asyncio.gather(*[ratelimiter.acquire("1") for x in range(120)])
+        paced = loop.time() - start
+        ratelimiter.pause("1",0.3)
+        start = loop.time()
+        await ratelimiter.acquire("2")
+        not_paused = loop.time() - start
+        await ratelimiter.acquire("1")
+        paused = loop.time() - start
+        return paced,not_paused,paused
+
+    paced,not_paused,paused = asyncio.run(run())
+    assert 0.15 <= paced < 1
+    assert not_paused < 0.1
+    assert paused >= 0.3
+
+
+def test_retry_policy():
+    '''test retry policy decisions for Meraki dashboard errors'''
+    class MockError(): # pylint: disable=too-few-public-methods
+        '''Meraki SDK error with HTTP status and headers'''
+        def __init__(self,status,headers=None):
+            self.status = status
+            self.response = type("MockResponse",(),{"headers":headers if headers else {}})()
+
+    retrypolicy = merakitoolkitratelimit.RetryPolicy(max_attempts=4,backoff=1,max_backoff=3)
+    # Retry-After is respected for 429 errors
+    assert retrypolicy.wait(1,MockError(429,{"Retry-After":"7"})) == 7
+    # exponential backoff with jitter for server and connection errors, capped by max_backoff
+    assert 0 <= retrypolicy.wait(1,MockError(500)) <= 1
+    assert 0 <= retrypolicy.wait(2,MockError(None)) <= 2
+    assert 0 <= retrypolicy.wait(3,MockError(503)) <= 3
+    # client errors are not repeated, attempts are bounded
+    assert retrypolicy.wait(1,MockError(400)) is None
+    assert retrypolicy.wait(4,MockError(500)) is None
+    # attempts can be lowered for a call (eg: non-idempotent calls)
+    assert retrypolicy.wait(1,MockError(500),max_attempts=1) is None
+    assert 0 <= retrypolicy.wait(1,MockError(500),max_attempts=2) <= 1
+
+
+def test_worker_pool():
+    '''test worker pool bounded concurrency and results'''
+    running = {"now":0,"max":0}
+
+    async def function(value):
+        running["now"] += 1
+        running["max"] = max(running["max"],running["now"])
+        await asyncio.sleep(0.001)
+        running["now"] -= 1
+        return value * 2
+
+    async def run():
+        pool = merakitoolkitratelimit.WorkerPool(function,3,maxsize=2)
+        for value in range(20):
+            await pool.put(value)
+        return await pool.join()
+
+    results = asyncio.run(run())
+    assert sorted(results) == [value * 2 for value in range(20)]
+    assert running["max"] == 3
+
+def test_batch_pool():
+    '''test batch pool grouping, batch size and results'''
+    batches = []
+
+    async def function(group,items):
+        batches.append((group,len(items)))
+        await asyncio.sleep(0.001)
+        return [value * 2 for group,value in items]
+
+    async def run():
+        pool = merakitoolkitratelimit.BatchPool(function,4,2,key=lambda group,value: group,group_workers=1)
+        for value in range(10):
+            await pool.put("even" if value % 2 == 0 else "odd",value)
+        await pool.put("other",10)
+        return await pool.join()
+
+    results = asyncio.run(run())
+    assert sorted(results) == [value * 2 for value in range(11)]
+    assert sorted(batches) == [("even",1),("even",4),("odd",1),("odd",4),("other",1)]
+
+def test_operation_stats():
+    '''test operation statistics counters, percentiles and histogram'''
+    stats = merakitoolkitstats.OperationStats()
+    for latency in range(1,101):
+        stats.record("getNetworkWirelessSsids",latency/1000,received=[{"name":"SSID"}])
+    stats.record("updateNetworkWirelessSsid",0.2,attempts=3,rate_limited=2,sent={"psk":"psk12345"})
+    with pytest.raises(ValueError):
+        with stats.measure("email:smtp") as sizes:
+            sizes["sent"] = b"message"
+            raise ValueError("SMTP error")
+
+    endpoints = stats.to_dict()["endpoints"]
+    assert endpoints["getNetworkWirelessSsids"]["calls"] == 100
+    assert endpoints["getNetworkWirelessSsids"]["p50"] == 0.05
+    assert endpoints["getNetworkWirelessSsids"]["p95"] == 0.095
+    assert endpoints["getNetworkWirelessSsids"]["p99"] == 0.099
+    assert endpoints["getNetworkWirelessSsids"]["histogram"]["0.05"] == 50
+    assert endpoints["getNetworkWirelessSsids"]["histogram"]["0.1"] == 100
+    assert endpoints["getNetworkWirelessSsids"]["bytes_received"] == 100 * len('[{"name": "SSID"}]')
+    assert endpoints["updateNetworkWirelessSsid"]["retries"] == 2
+    assert endpoints["updateNetworkWirelessSsid"]["rate_limited"] == 2
+    assert endpoints["email:smtp"]["failures"] == 1
+    assert endpoints["email:smtp"]["bytes_sent"] == len(b"message")
+    assert "updateNetworkWirelessSsid" in stats.summary()
+
+
+def test_operation_stats_prometheus(tmp_path):
+    '''test operation statistics in Prometheus text format'''
+    stats = merakitoolkitstats.OperationStats()
+    stats.record("getNetworkWirelessSsids",0.07,attempts=2,rate_limited=1)
+    stats.record("getNetworkWirelessSsids",0.3)
+    stats.count("networks_updated",3)
+    stats.count("rate_limit_wait_seconds",2)
+    stats.set_phase("discovery",1.5)
+    metrics_file = tmp_path / "merakitoolkit.prom"
+    stats.write_prometheus(str(metrics_file),False)
+
+    lines = metrics_file.read_text(encoding="utf-8").splitlines()
+    assert "merakitoolkit_last_run_success 0" in lines
+    assert 'merakitoolkit_phase_duration_seconds{phase="discovery"} 1.5' in lines
+    assert 'merakitoolkit_networks{state="updated"} 3' in lines
+    assert 'merakitoolkit_networks{state="failed"} 0' in lines
+    assert "merakitoolkit_rate_limit_wait_seconds 2" in lines
+    assert 'merakitoolkit_api_calls{endpoint="getNetworkWirelessSsids"} 2' in lines
+    assert 'merakitoolkit_api_call_retries{endpoint="getNetworkWirelessSsids"} 1' in lines
+    assert "# TYPE merakitoolkit_api_call_duration_seconds histogram" in lines
+    assert 'merakitoolkit_api_call_duration_seconds_bucket{endpoint="getNetworkWirelessSsids",le="0.05"} 0' in lines
+    assert 'merakitoolkit_api_call_duration_seconds_bucket{endpoint="getNetworkWirelessSsids",le="0.1"} 1' in lines
+    assert 'merakitoolkit_api_call_duration_seconds_bucket{endpoint="getNetworkWirelessSsids",le="+Inf"} 2' in lines
+    assert 'merakitoolkit_api_call_duration_seconds_count{endpoint="getNetworkWirelessSsids"} 2' in lines
+    # temporary file is renamed to the metrics file
+    assert [x.name for x in tmp_path.iterdir()] == ["merakitoolkit.prom"]
+    assert merakitoolkitstats.escape_label('a"b\\c') == 'a\\"b\\\\c'
+
+
+@pytest.mark.parametrize("output_format",["jsonl","csv"])
+def test_result_writer(tmp_path,output_format):
+    '''test machine-readable results of networks in JSON Lines and CSV format'''
+    network = {
+        "organization":"Organization 1",
+        "organizationId":"1",
+        "name":"Network 1",
+        "id":"L_1",
+        "ssidPosition":"3",
+        "ssidName":"SSID, with comma",
+        "job":0,
+        }
+    output_file = tmp_path / f"results.{output_format}"
+    writer = merakitoolkitoutput.ResultWriter(output_format,str(output_file))
+    writer.write(merakitoolkitoutput.network_result(network,"update","success",0.12345))
+    writer.write(merakitoolkitoutput.network_result(network,"skip","unchanged",0.5))
+    writer.close()
+
+    if output_format == "jsonl":
+        results = [json.loads(x) for x in output_file.read_text(encoding="utf-8").splitlines()]
+    else:
+        with open(output_file,encoding="utf-8",newline="") as results_file:
+            results = list(csv.DictReader(results_file))
+    assert len(results) == 2
+    assert list(results[0]) == merakitoolkitoutput.RESULT_FIELDS
+    assert results[0]["ssidName"] == "SSID, with comma"
+    assert str(results[0]["ssidNumber"]) == "3"
+    assert str(results[0]["job"]) == "1"
+    assert str(results[0]["latency"]) == "0.123"
+    assert results[1]["outcome"] == "unchanged"
+    with pytest.raises(ValueError):
+        merakitoolkitoutput.ResultWriter("xml",str(output_file))
+
+
+def test_journal(tmp_path):
+    '''test operation journal records, resume state and jobs verification'''
+    jobs = [{"organization":["ALL"],"network":["ALL"],"tags":None,"tags_filter":"any","ssid":"SSID","passphrase":"psk12345"}]
+    networks = [{"id":f"L_{x}","ssidPosition":"1","name":f"Network {x}"} for x in range(3)]
+    journal_file = tmp_path / "journal.jsonl"
+    journal = merakitoolkitjournal.Journal(str(journal_file),sync_records=2)
+    journal.start(jobs)
+    for network in networks:
+        journal.target(network)
+    # records are synchronized to disk in batches: third target is not written yet
+    assert len(journal_file.read_text(encoding="utf-8").splitlines()) == 3
+    journal.update(networks[0],True)
+    journal.close()
+
+    state = merakitoolkitjournal.load_journal(str(journal_file))
+    assert state["jobs"] == jobs
+    assert [x["id"] for x in state["targets"]] == ["L_0","L_1","L_2"]
+    assert state["done"] == {"L_0/1":True}
+    assert state["discovered"] is False
+
+    # resumed journal is continued, a truncated last record is ignored
+    journal = merakitoolkitjournal.Journal(str(journal_file),resume=True)
+    journal.discovered()
+    journal.update(networks[1],False)
+    journal.close()
+    with open(journal_file,"a",encoding="utf-8") as truncated:
+        truncated.write('{"type": "upd')
+    state = merakitoolkitjournal.load_journal(str(journal_file))
+    assert state["discovered"] is True
+    assert state["done"] == {"L_0/1":True,"L_1/1":False}
+
+    merakitoolkitjournal.check_jobs(state,jobs)
+    with pytest.raises(ValueError):
+        merakitoolkitjournal.check_jobs(state,[dict(jobs[0],ssid="Other SSID")])
+    with pytest.raises(ValueError):
+        merakitoolkitjournal.check_jobs(state,jobs*2)
+
+
+class MockSMTP():
+    '''SMTP connection delivering the messages to a list, failing with the errors queued by the test'''
+    connections = []
+    errors = []
+
+    def __init__(self,host,port,timeout=None): # pylint: disable=unused-argument
+        self.messages = []
+        self.closed = False
+        MockSMTP.connections.append(self)
+
+    def send_message(self,message):
+        '''deliver a message or fail with the next queued error'''
+        if MockSMTP.errors:
+            raise MockSMTP.errors.pop(0)
+        self.messages.append(message)
+
+    def quit(self):
+        '''close the connection'''
+        self.closed = True
+
+    close = quit
+
+
+@pytest.mark.asyncio
+async def test_smtp_pool(monkeypatch):
+    '''test SMTP connections pool reuse, concurrency limit and retries'''
+    monkeypatch.setattr(merakitoolkitsmtp.smtplib,"SMTP",MockSMTP)
+    MockSMTP.connections = []
+    MockSMTP.errors = [merakitoolkitsmtp.smtplib.SMTPServerDisconnected("Connection unexpectedly closed")]
+    pool = merakitoolkitsmtp.SMTPPool("smtp.example.com",25,mode="SMTP",connections=2,backoff=0)
+    await asyncio.gather(*[pool.send_async(f"message {x}") for x in range(6)])
+    pool.send("message 6")
+
+    # connection of the temporary error is dropped, messages are delivered by 2 connections at most
+    assert sorted(x for connection in MockSMTP.connections for x in connection.messages) == [f"message {x}" for x in range(7)]
+    assert 2 <= len(MockSMTP.connections) <= 3
+    assert MockSMTP.connections[0].closed is True
+    assert pool.opened == len(MockSMTP.connections)
+
+    # permanent errors are not repeated, temporary errors are repeated up to max_attempts
+    MockSMTP.errors = [merakitoolkitsmtp.smtplib.SMTPResponseException(550,"Mailbox unavailable"),"not sent"]
+    with pytest.raises(merakitoolkitsmtp.smtplib.SMTPResponseException):
+        pool.send("message 7")
+    assert MockSMTP.errors == ["not sent"]
+    MockSMTP.errors = [merakitoolkitsmtp.smtplib.SMTPResponseException(421,"Try again later") for x in range(3)]
+    with pytest.raises(merakitoolkitsmtp.smtplib.SMTPResponseException):
+        pool.send("message 8")
+    assert MockSMTP.errors == []
+    pool.close()
+    assert all(x.closed for x in MockSMTP.connections)
+
+    with pytest.raises(ValueError):
+        merakitoolkitsmtp.SMTPPool(None,25).send("message")
+
+
+def test_generate_email_body(tmp_path):
+    '''test email templates compiled once, reloaded when modified and saved in the bytecode cache'''
+    template_path = tmp_path / "template"
+    template_path.mkdir()
+    template_file = template_path / "templatetxt.j2"
+    template_file.write_text("SSID: {{ ssid }} PSK: {{ psk }}",encoding="utf-8")
+    bytecode_cache = tmp_path / "bytecode"
+
+    for psk in ["psk12345","psk67890"]:
+        body = merakitoolkitsupport.generate_email_body(
+            "templatetxt.j2",f"{template_path}/","SSID",psk,bytecode_cache=str(bytecode_cache)
+            )
+        assert body == f"SSID: SSID PSK: {psk}"
+    environment = merakitoolkitsupport.template_environment(str(template_path),str(bytecode_cache))
+    assert len(environment.cache) == 1
+    assert len(os.listdir(bytecode_cache)) == 1
+
+    # modified template is compiled again
+    template_file.write_text("PSK of {{ ssid }}: {{ psk }}",encoding="utf-8")
+    modified = os.stat(template_file).st_mtime + 10
+    os.utime(template_file,(modified,modified))
+    body = merakitoolkitsupport.generate_email_body(
+        "templatetxt.j2",f"{template_path}/","SSID","psk12345",bytecode_cache=str(bytecode_cache)
+        )
+    assert body == "PSK of SSID: psk12345"
+    assert merakitoolkitsupport.template_environment(str(template_path),str(bytecode_cache)) is environment
+
+def test_qrcode_png():
+    '''test QR codes generated in memory once for each SSID and PSK'''
+    merakitoolkitsupport.qrcode_png.cache_clear()
+    qrcode = merakitoolkitsupport.qrcode_png("SSID","psk12345")
+    assert qrcode.startswith(b"\x89PNG\r\n\x1a\n")
+    assert merakitoolkitsupport.qrcode_png("SSID","psk12345") is qrcode
+    assert merakitoolkitsupport.qrcode_png("SSID","psk67890") != qrcode
+    cache = merakitoolkitsupport.qrcode_png.cache_info()
+    assert cache.hits == 1 and cache.misses == 2
+
+    # QR code is attached from memory
+    attachment = merakitoolkitsupport.image_attachment("qrcode.png",qrcode)
+    assert attachment["Content-ID"] == "<qrcodepng>"
+    assert attachment.get_payload(decode=True) == qrcode
+
+def test_template_images(tmp_path):
+    '''test template images read and encoded once, read again when modified'''
+    merakitoolkitsupport.template_image.cache_clear()
+    (tmp_path / "logo.png").write_bytes(b"logo")
+    (tmp_path / "qrcode.png").write_bytes(b"old qrcode")
+    (tmp_path / "templatetxt.j2").write_text("SSID: {{ ssid }}",encoding="utf-8")
+
+    images = merakitoolkitsupport.template_images(str(tmp_path))
+    assert [x for x,_ in images] == ["logo.png"]
+    assert images[0][1]["Content-ID"] == "<logopng>"
+    assert images[0][1].get_payload(decode=True) == b"logo"
+    assert merakitoolkitsupport.template_images(str(tmp_path))[0][1] is images[0][1]
+    cache = merakitoolkitsupport.template_image.cache_info()
+    assert cache.hits == 1 and cache.misses == 1
+
+    # modified image is read again
+    (tmp_path / "logo.png").write_bytes(b"new logo")
+    modified = os.stat(tmp_path / "logo.png").st_mtime + 10
+    os.utime(tmp_path / "logo.png",(modified,modified))
+    assert merakitoolkitsupport.template_images(str(tmp_path))[0][1].get_payload(decode=True) == b"new logo"
+
+def test_network_recipients(tmp_path):
+    '''test recipients of the networks by network name, network ID and tag'''
+    recipients_file = tmp_path / "recipients.json"
+    recipients_file.write_text(json.dumps({
+        "Network1": ["site1@domain.com","all@domain.com"],
+        "L_1234": "site2@domain.com",
+        "tag:tag1": ["all@domain.com","tag1@domain.com"],
+        }),encoding="utf-8")
+    recipients = merakitoolkitnotify.load_recipients(str(recipients_file))
+    assert recipients["L_1234"] == ["site2@domain.com"]
+    network = {"name":"Network1","id":"L_1234","tags":["tag1","tag2"]}
+    assert merakitoolkitnotify.network_recipients(recipients,network) == [
+        "site1@domain.com","all@domain.com","site2@domain.com","tag1@domain.com"
+        ]
+    assert merakitoolkitnotify.network_recipients(recipients,{"name":"Network2","id":"L_5678","tags":[]}) == []
+
+    recipients_file.write_text(json.dumps({"Network1": [1]}),encoding="utf-8")
+    with pytest.raises(ValueError):
+        merakitoolkitnotify.load_recipients(str(recipients_file))
+
+def test_email_renderer():
+    '''test emails rendered in the calling thread (0 processes) as render_email'''
+    path = "./merakitoolkit/templates/psk/default/"
+    renderer = merakitoolkitnotify.EmailRenderer(0)
+    text,html,qrcode = asyncio.run(renderer.render(path,"SSID","psk12345",["logopng"],"Network1"))
+    assert "SSID" in text and "Network1" in text and "psk12345" in text
+    assert "cid:logopng" in html and "cid:qrcodepng" in html
+    assert qrcode == merakitoolkitsupport.qrcode_png("SSID","psk12345")
+    # rendering errors are raised by the result
+    with pytest.raises(jinja2.TemplateNotFound):
+        renderer.submit("./missing/","SSID","psk12345",[]).result()
+    renderer.close()
+    with pytest.raises(ValueError):
+        merakitoolkitnotify.EmailRenderer(-1)
+
+def test_psk_generator():
+    '''test unique PSKs generated from the dictionary with an uppercase letter, a symbol and a digit'''
+    generator = merakitoolkitsupport.PSKGenerator()
+    psks = generator.batch(20000)
+    assert len(set(psks)) == 20000
+    for psk in psks:
+        assert 10 <= len(psk) <= 14
+        assert any(x.isupper() for x in psk)
+        assert any(x in merakitoolkitsupport.PSK_SYMBOLS for x in psk)
+        assert any(x.isdigit() for x in psk)
+    # PSKs are not repeated by the following batches of the generator
+    assert not set(generator.batch(1000)) & set(psks)
+    # dictionary is read once
+    assert merakitoolkitsupport.psk_wordlist() is generator.words
+    # randomization is taken from the random bits
+    assert merakitoolkitsupport.randomize_psk("abcdefgh",0) == "0@Abcdefgh"
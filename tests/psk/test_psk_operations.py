@@ -1,11 +1,14 @@
 '''test meraki operations'''
 
 import os
+import io
+import csv
 import json
 import pytest
 import meraki
 import meraki.aio
 import merakitoolkit.merakitoolkit as merakitoolkit # pylint: disable=import-error
+import merakitoolkit.merakitoolkitsmtp as merakitoolkitsmtp # pylint: disable=import-error
 
 # Assume that the correct Meraki API key is the following
 APIKEY_CORRECT = "123456789"
@@ -13,6 +16,21 @@ APIKEY_CORRECT = "123456789"
 # Will contain the updated data at each call of mocked functions
 mock_meraki_dashboard_results = {}
 
+class MockResponse(): # pylint: disable=too-few-public-methods
+    '''minimal aiohttp response returned with Meraki SDK errors'''
+    def __init__(self,status,headers=None):
+        self.status = status
+        self.reason = "Mock error"
+        self.headers = headers if headers else {}
+
+def mock_api_error(status,operation):
+    '''return a Meraki SDK error for an HTTP status (429 errors ask to retry immediately)'''
+    return meraki.exceptions.AsyncAPIError(
+        {"tags":["mock"],"operation":operation},
+        MockResponse(status,{"Retry-After":"0"} if status == 429 else None),
+        {"errors":[f"Mock error {status}"]}
+        )
+
 @pytest.fixture(name="mock_meraki_dashboard")
 def fixture_mock_meraki_dashboard(monkeypatch):
     '''fixture to return offline dashboard data'''
@@ -32,6 +50,26 @@ def fixture_mock_meraki_dashboard(monkeypatch):
     mock_meraki_dashboard_results["organization_data"] = organization_data
     mock_meraki_dashboard_results["networks_data"] = networks_data
     mock_meraki_dashboard_results["ssid_data"] = ssid_data
+    # list of network IDs for which SSIDs were requested (to be used for assertions)
+    mock_meraki_dashboard_results["ssid_requests"] = []
+    # sequence of SSIDs lookups and updates as (operation, network ID) (to be used for assertions)
+    mock_meraki_dashboard_results["requests"] = []
+    # network IDs whose next SSIDs requests fail with the given list of HTTP status (can be modified by tests)
+    mock_meraki_dashboard_results["ssid_errors"] = {}
+    # list of organization IDs for which networks were requested (to be used for assertions)
+    mock_meraki_dashboard_results["network_requests"] = []
+    # configuration change log entries by organization ID (can be modified by tests)
+    mock_meraki_dashboard_results["configuration_changes"] = {}
+    # list of organization IDs for which configuration changes were requested (to be used for assertions)
+    mock_meraki_dashboard_results["configuration_changes_requests"] = []
+    # list of (organization ID, number of actions) of the action batches created (to be used for assertions)
+    mock_meraki_dashboard_results["action_batches"] = []
+    # action batches fail instead of applying their actions (can be modified by tests)
+    mock_meraki_dashboard_results["action_batches_failed"] = False
+    # next action batches creations fail with the given list of HTTP status (can be modified by tests)
+    mock_meraki_dashboard_results["action_batches_errors"] = []
+    # (network ID, SSID position) whose next updates fail with the given list of HTTP status (can be modified by tests)
+    mock_meraki_dashboard_results["update_errors"] = {}
 
     # mock function to get organizations
     # verify if API key is correct and return fake organization data
@@ -43,25 +81,70 @@ def fixture_mock_meraki_dashboard(monkeypatch):
             raise Exception("Mock wrong Meraki API key")
 
     # parse the networks data file data and return only a list with matching organization ID
+    # tags and tagsFilterType parameters are applied as Meraki dashboard would do
+    # ASYNC: mock functions had to be changed to "async def" to comply with the execution flow of the original methods
+    async def mock_getOrganizationNetworks(obj,org_id,**kwargs): # pylint: disable=unused-argument disable=invalid-name
+        mock_meraki_dashboard_results["network_requests"].append(org_id)
+        networks = [x for x in networks_data if x["organizationId"] == org_id]
+        if "tags" in kwargs:
+            tags_match = all if kwargs.get("tagsFilterType") == "withAllTags" else any
+            networks = [x for x in networks if tags_match(tag in x["tags"] for tag in kwargs["tags"])]
+        return networks
+
+    # return the configuration changes set by the test for the organization ID
     # ASYNC: mock functions had to be changed to "async def" to comply with the execution flow of the original methods
-    async def mock_getOrganizationNetworks(obj,org_id): # pylint: disable=unused-argument disable=invalid-name
-        return [x for x in networks_data if x["organizationId"] == org_id]
+    async def mock_getOrganizationConfigurationChanges(obj,org_id,**kwargs): # pylint: disable=unused-argument disable=invalid-name
+        mock_meraki_dashboard_results["configuration_changes_requests"].append(org_id)
+        return mock_meraki_dashboard_results["configuration_changes"].get(org_id,[])
 
     # ssid data is a dictionary with the networkID as key for a list of SSIDs
     # ASYNC: mock functions had to be changed to "async def" to comply with the execution flow of the original methods
     async def mock_getNetworkWirelessSsids(obj,net_id): # pylint: disable=unused-argument disable=invalid-name
+        mock_meraki_dashboard_results["ssid_requests"].append(net_id)
+        mock_meraki_dashboard_results["requests"].append(("getNetworkWirelessSsids",net_id))
+        if mock_meraki_dashboard_results["ssid_errors"].get(net_id):
+            raise mock_api_error(mock_meraki_dashboard_results["ssid_errors"][net_id].pop(0),"getNetworkWirelessSsids")
         return ssid_data.get(net_id)
 
     # mock update SSID data by updating ssid_data dictionary (to be used for assertions)
     # ASYNC: mock functions had to be changed to "async def" to comply with the execution flow of the original methods
     async def mock_updateNetworkWirelessSsid(obj,net_id,ssidPosition,psk): # pylint: disable=unused-argument disable=invalid-name
+        mock_meraki_dashboard_results["requests"].append(("updateNetworkWirelessSsid",net_id))
+        if mock_meraki_dashboard_results["update_errors"].get((net_id,int(ssidPosition))):
+            raise mock_api_error(
+                mock_meraki_dashboard_results["update_errors"][(net_id,int(ssidPosition))].pop(0),
+                "updateNetworkWirelessSsid"
+                )
         ssid_data[net_id][int(ssidPosition)]["psk"] = psk
         return ssid_data[net_id][int(ssidPosition)]
 
+    # mock action batches: actions are applied when the batch is created, the batch is reported
+    # as completed (or failed when set by the test) at the first status check
+    # ASYNC: mock functions had to be changed to "async def" to comply with the execution flow of the original methods
+    async def mock_createOrganizationActionBatch(obj,org_id,actions,**kwargs): # pylint: disable=unused-argument disable=invalid-name
+        mock_meraki_dashboard_results["requests"].append(("createOrganizationActionBatch",org_id))
+        if mock_meraki_dashboard_results["action_batches_errors"]:
+            raise mock_api_error(mock_meraki_dashboard_results["action_batches_errors"].pop(0),"createOrganizationActionBatch")
+        mock_meraki_dashboard_results["action_batches"].append((org_id,len(actions)))
+        if not mock_meraki_dashboard_results["action_batches_failed"]:
+            for action in actions:
+                resource = action["resource"].split("/")
+                ssid_data[resource[2]][int(resource[5])]["psk"] = action["body"]["psk"]
+        return {"id":str(len(mock_meraki_dashboard_results["action_batches"])),
+                "status":{"completed":False,"failed":False,"errors":[]}}
+
+    async def mock_getOrganizationActionBatch(obj,org_id,batch_id): # pylint: disable=unused-argument disable=invalid-name
+        failed = mock_meraki_dashboard_results["action_batches_failed"]
+        return {"id":batch_id,
+                "status":{"completed":not failed,"failed":failed,"errors":["Mock error"] if failed else []}}
+
     # modify meraki methods to return mock data
     # ASYNC: mocked original classes are now referring to the async version of meraki SDK
     monkeypatch.setattr(meraki.aio.AsyncOrganizations,"getOrganizations",mock_getOrganizations)
     monkeypatch.setattr(meraki.aio.AsyncOrganizations,"getOrganizationNetworks",mock_getOrganizationNetworks)
+    monkeypatch.setattr(meraki.aio.AsyncOrganizations,"getOrganizationConfigurationChanges",mock_getOrganizationConfigurationChanges) # pylint: disable=line-too-long
+    monkeypatch.setattr(meraki.aio.AsyncOrganizations,"createOrganizationActionBatch",mock_createOrganizationActionBatch) # pylint: disable=line-too-long
+    monkeypatch.setattr(meraki.aio.AsyncOrganizations,"getOrganizationActionBatch",mock_getOrganizationActionBatch)
     monkeypatch.setattr(meraki.aio.AsyncWireless,"getNetworkWirelessSsids",mock_getNetworkWirelessSsids)
     monkeypatch.setattr(meraki.aio.AsyncWireless,"updateNetworkWirelessSsid",mock_updateNetworkWirelessSsid)
 
@@ -729,3 +812,1412 @@ async def test_pskchg_org_one_net_one_dryrun_no_email2(mock_meraki_dashboard): #
     await merakiobj.pskchangeasync()
     merakiobj.send_email_psk()
     assert mock_meraki_dashboard_results["ssid_data"]["L_646829496481111675"][1]["psk"] == settings["passphrase"]
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+async def test_pskchg_org_all_net_all_dryrun_no_org_concurrency_one(mock_meraki_dashboard): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method with organizations, networks and updates processed one at a time
+    organizations : ALL
+    networks : ALL
+    dryrun : no
+    org_concurrency : 1
+    concurrency : 1
+    update_concurrency : 1
+    '''
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': False,
+        'dryrun': False,
+        'passphrase': "psk12345",
+        'passrandomize': False,
+        'email': ['email1@domain.com', 'email2@domain.com'],
+        'emailtemplate': './templates/psk/default/',
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'TLS',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ["ALL"],
+        'network': ["ALL"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        "org_concurrency":1,
+        "concurrency":1,
+        "update_concurrency":1,
+        }
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    assert len(merakiobj.current_operation["networks_to_process"]) == 5
+    assert mock_meraki_dashboard_results["ssid_data"]["L_646829496481111675"][1]["psk"] == settings["passphrase"]
+    assert mock_meraki_dashboard_results["ssid_data"]["L_636829496481105433"][3]["psk"] == settings["passphrase"]
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+@pytest.mark.parametrize("all_product_types",[False,True])
+async def test_pskchg_org_all_net_all_dryrun_yes_product_types(mock_meraki_dashboard,all_product_types): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method skipping SSID lookups for networks without wireless products
+    organizations : ALL
+    networks : ALL
+    dryrun : yes
+    all_product_types : no / yes
+    '''
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': False,
+        'dryrun': True,
+        'passphrase': "psk12345",
+        'passrandomize': False,
+        'email': ['email1@domain.com', 'email2@domain.com'],
+        'emailtemplate': './templates/psk/default/',
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'TLS',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ["ALL"],
+        'network': ["ALL"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        "all_product_types":all_product_types,
+        }
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    assert len(merakiobj.current_operation["networks_to_process"]) == 5
+    # camera only and appliance only networks are queried only when all product types are requested
+    assert ("N_646829496481189507" in mock_meraki_dashboard_results["ssid_requests"]) is all_product_types
+    assert ("N_636829496481187875" in mock_meraki_dashboard_results["ssid_requests"]) is all_product_types
+    assert "L_646829496481111675" in mock_meraki_dashboard_results["ssid_requests"]
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+async def test_pskchg_org_two_net_all_dryrun_no_tags_two_filter_all(mock_meraki_dashboard): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method with networks that must have all the tags
+    organizations : two
+    networks : ALL
+    dryrun : no
+    tags : two (all)
+    '''
+
+    settings= {
+        'apikey': '123456789',
+        'tags': ["tag1","tag3"],
+        'tags_filter': "all",
+        'verbose': False,
+        'dryrun': False,
+        'passphrase': "psk12345",
+        'passrandomize': False,
+        'email': ['email1@domain.com', 'email2@domain.com'],
+        'emailtemplate': './templates/psk/default/',
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'TLS',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ["DevNet Sandbox","Test Organization"],
+        'network': ["ALL"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        }
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    assert mock_meraki_dashboard_results["ssid_data"]["L_646829496481111675"][1]["psk"] == settings["passphrase"]
+    assert mock_meraki_dashboard_results["ssid_data"]["L_646829496481105433"][3]["psk"] == "testtest"
+    assert mock_meraki_dashboard_results["ssid_data"]["L_636829496481111675"][1]["psk"] == "testtest"
+    # networks not matching the tags are filtered out before any SSID lookup
+    assert mock_meraki_dashboard_results["ssid_requests"] == ["L_646829496481111675"]
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+async def test_pskchg_org_all_net_all_dryrun_no_cache(mock_meraki_dashboard,tmp_path): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method with the local inventory cache
+    first run populates the cache, second run does not query networks and SSIDs
+    a cache refresh queries again the dashboard
+    organizations : ALL
+    networks : ALL
+    dryrun : no
+    cache : yes
+    '''
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': False,
+        'dryrun': False,
+        'passphrase': "psk12345",
+        'passrandomize': False,
+        'email': ['email1@domain.com', 'email2@domain.com'],
+        'emailtemplate': './templates/psk/default/',
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'TLS',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ["ALL"],
+        'network': ["ALL"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        "cache":True,
+        "cache_file":str(tmp_path / "inventory.sqlite3"),
+        }
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    network_requests = len(mock_meraki_dashboard_results["network_requests"])
+    ssid_requests = len(mock_meraki_dashboard_results["ssid_requests"])
+    assert network_requests == 2
+    assert ssid_requests > 0
+
+    settings["passphrase"] = "psk67890"
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    assert len(mock_meraki_dashboard_results["network_requests"]) == network_requests
+    # only networks with the SSID in cache (SSIDs checked before the update) or whose SSIDs could not be retrieved
+    # are queried again
+    ssid_data = mock_meraki_dashboard_results["ssid_data"]
+    assert all(ssid_data.get(network_id) is None or any(x["name"] == settings["ssid"] for x in ssid_data[network_id])
+               for network_id in mock_meraki_dashboard_results["ssid_requests"][ssid_requests:])
+    assert "L_646829496481110685" not in mock_meraki_dashboard_results["ssid_requests"][ssid_requests:]
+    assert len(merakiobj.current_operation["networks_to_process"]) == 5
+    assert mock_meraki_dashboard_results["ssid_data"]["L_646829496481111675"][1]["psk"] == settings["passphrase"]
+
+    settings["refresh_cache"] = True
+    ssid_requests = len(mock_meraki_dashboard_results["ssid_requests"])
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    assert len(mock_meraki_dashboard_results["network_requests"]) == 2 * network_requests
+    assert "L_646829496481111675" in mock_meraki_dashboard_results["ssid_requests"][ssid_requests:]
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+async def test_pskchg_org_all_net_all_dryrun_no_cache_unchanged(mock_meraki_dashboard,tmp_path): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method repeated with the local inventory cache and the same PSK
+    second run skips the SSIDs already with the PSK (PSK of the SSIDs retrieved from Meraki dashboard)
+    organizations : ALL
+    networks : ALL
+    dryrun : no
+    cache : yes
+    '''
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': False,
+        'dryrun': False,
+        'passphrase': "psk12345",
+        'passrandomize': False,
+        'email': None,
+        'emailtemplate': './templates/psk/default/',
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'TLS',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ["ALL"],
+        'network': ["ALL"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        "cache":True,
+        "cache_file":str(tmp_path / "inventory.sqlite3"),
+        }
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    updates = mock_meraki_dashboard_results["requests"].count
+    updated = [x["id"] for x in merakiobj.current_operation["networks_to_process"] if x.get("updated")]
+    assert updated
+    ssid_requests = len(mock_meraki_dashboard_results["ssid_requests"])
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    # SSIDs of the updated networks are checked on Meraki dashboard and are not updated again
+    assert set(updated) <= set(mock_meraki_dashboard_results["ssid_requests"][ssid_requests:])
+    assert all(updates(("updateNetworkWirelessSsid",x)) == 1 for x in updated)
+    # no change happened
+    assert "networks_to_process" not in merakiobj.current_operation
+
+    # PSK changed on Meraki dashboard since the last run is applied again
+    ssid = mock_meraki_dashboard_results["ssid_data"]["L_646829496481111675"][1]
+    ssid["psk"] = "changedondashboard"
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    assert ssid["psk"] == settings["passphrase"]
+    assert [x["id"] for x in merakiobj.current_operation["networks_to_process"] if x.get("updated")] == \
+        ["L_646829496481111675"]
+
+    # a different PSK is applied again
+    settings["passphrase"] = "psk67890"
+    before = {x: updates(("updateNetworkWirelessSsid",x)) for x in updated}
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    assert all(updates(("updateNetworkWirelessSsid",x)) == before[x] + 1 for x in updated)
+    assert not any(x["pskUnchanged"] for x in merakiobj.current_operation["networks_to_process"])
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+@pytest.mark.parametrize("action_batches",[False,True])
+async def test_pskchg_org_all_net_all_dryrun_no_cache_moved_ssid(mock_meraki_dashboard,tmp_path,action_batches): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method with the local inventory cache when the SSID is moved to another position
+    the SSID is updated in its new position, the SSID in the cached position is not changed
+    (with a request for each network or with action batches)
+    organizations : ALL
+    networks : ALL
+    dryrun : no
+    cache : yes
+    '''
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': False,
+        'dryrun': False,
+        'passphrase': "psk12345",
+        'passrandomize': False,
+        'email': None,
+        'emailtemplate': './templates/psk/default/',
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'TLS',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ["ALL"],
+        'network': ["ALL"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        "cache":True,
+        "cache_file":str(tmp_path / "inventory.sqlite3"),
+        }
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    ssids = mock_meraki_dashboard_results["ssid_data"]["L_646829496481111675"]
+    ssids[1]["name"],ssids[2]["name"] = ssids[2]["name"],ssids[1]["name"]
+    moved_psk = ssids[1]["psk"]
+
+    settings["passphrase"] = "psk67890"
+    settings["action_batches"] = action_batches
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    assert merakiobj.current_operation["failures"] == []
+    assert ssids[2]["psk"] == settings["passphrase"]
+    # SSID now in the cached position of the changed SSID is not updated
+    assert ssids[1]["psk"] == moved_psk
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+async def test_pskchg_org_all_net_all_dryrun_no_cache_incremental(mock_meraki_dashboard,tmp_path): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method with the local inventory cache refreshed by configuration change log
+    first run populates the cache, second run queries only the change log
+    third run queries again the SSIDs of the changed network (and of the networks with the SSID)
+    organizations : ALL
+    networks : ALL
+    dryrun : no
+    cache : incremental
+    '''
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': False,
+        'dryrun': False,
+        'passphrase': "psk12345",
+        'passrandomize': False,
+        'email': ['email1@domain.com', 'email2@domain.com'],
+        'emailtemplate': './templates/psk/default/',
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'TLS',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ["ALL"],
+        'network': ["ALL"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        "cache":True,
+        "cache_file":str(tmp_path / "inventory.sqlite3"),
+        "incremental":True,
+        }
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    # never synchronized organizations are fully retrieved without reading the change log
+    assert not mock_meraki_dashboard_results["configuration_changes_requests"]
+    assert len(mock_meraki_dashboard_results["network_requests"]) == 2
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    assert len(mock_meraki_dashboard_results["configuration_changes_requests"]) == 2
+    assert len(mock_meraki_dashboard_results["network_requests"]) == 2
+    ssid_requests = len(mock_meraki_dashboard_results["ssid_requests"])
+
+    mock_meraki_dashboard_results["configuration_changes"]["549236"] = [
+        {"networkId":"L_646829496481110685","ssidNumber":1,"label":"Name"}
+        ]
+    settings["passphrase"] = "psk67890"
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    assert len(mock_meraki_dashboard_results["configuration_changes_requests"]) == 4
+    assert len(mock_meraki_dashboard_results["network_requests"]) == 2
+    assert "L_646829496481110685" in mock_meraki_dashboard_results["ssid_requests"][ssid_requests:]
+    assert "L_646829496481111677" not in mock_meraki_dashboard_results["ssid_requests"][ssid_requests:]
+    assert len(merakiobj.current_operation["networks_to_process"]) == 5
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+@pytest.mark.parametrize("setting",["org_concurrency","concurrency","update_concurrency","rate_limit"])
+async def test_pskchg_org_all_net_all_dryrun_no_concurrency_zero(mock_meraki_dashboard,setting): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method with a concurrency or rate limit of 0 (MerakiToolkit instantiated programmatically)
+    the operation is refused before calling Meraki dashboard
+    '''
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': False,
+        'dryrun': False,
+        'passphrase': "psk12345",
+        'passrandomize': False,
+        'email': None,
+        'emailtemplate': './templates/psk/default/',
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'TLS',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ["ALL"],
+        'network': ["ALL"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        setting:0,
+        }
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    with pytest.raises(SystemExit):
+        await merakiobj.pskchangeasync()
+    assert not mock_meraki_dashboard_results["requests"]
+    assert not mock_meraki_dashboard_results["network_requests"]
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+async def test_pskchg_org_one_net_one_dryrun_no_rate_limited(mock_meraki_dashboard): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method when Meraki dashboard answers 429 (Too many requests)
+    organizations : one
+    networks : one
+    dryrun : no
+    '''
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': False,
+        'dryrun': False,
+        'passphrase': "psk12345",
+        'passrandomize': False,
+        'email': ['email1@domain.com', 'email2@domain.com'],
+        'emailtemplate': './templates/psk/default/',
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'TLS',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ['DevNet Sandbox'],
+        'network': ["DNSMB3-gxxxxxxonscom.com"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        }
+
+    mock_meraki_dashboard_results["ssid_errors"]["L_646829496481111675"] = [429]
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    assert mock_meraki_dashboard_results["ssid_requests"].count("L_646829496481111675") == 2
+    assert mock_meraki_dashboard_results["ssid_data"]["L_646829496481111675"][1]["psk"] == settings["passphrase"]
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_attempts,changed",[(3,True),(2,False)])
+async def test_pskchg_org_one_net_one_dryrun_no_server_errors(mock_meraki_dashboard,max_attempts,changed): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method when Meraki dashboard answers twice with server errors
+    organizations : one
+    networks : one
+    dryrun : no
+    max attempts : 3 (changed) / 2 (not changed)
+    '''
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': False,
+        'dryrun': False,
+        'passphrase': "psk12345",
+        'passrandomize': False,
+        'email': ['email1@domain.com', 'email2@domain.com'],
+        'emailtemplate': './templates/psk/default/',
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'TLS',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ['DevNet Sandbox'],
+        'network': ["DNSMB3-gxxxxxxonscom.com"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        "max_attempts":max_attempts,
+        "retry_backoff":0.01,
+        }
+
+    mock_meraki_dashboard_results["ssid_errors"]["L_646829496481111675"] = [500,502]
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    assert mock_meraki_dashboard_results["ssid_requests"].count("L_646829496481111675") == max_attempts
+    assert (mock_meraki_dashboard_results["ssid_data"]["L_646829496481111675"][1]["psk"] == settings["passphrase"]) is changed
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+async def test_pskchg_org_all_net_all_dryrun_no_verbose_pipeline(mock_meraki_dashboard): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method updating networks while other networks are still discovered
+    organizations : ALL
+    networks : ALL
+    dryrun : no
+    verbose : 1 (changes are applied and reported)
+    '''
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': 1,
+        'dryrun': False,
+        'passphrase': "psk12345",
+        'passrandomize': False,
+        'email': ['email1@domain.com', 'email2@domain.com'],
+        'emailtemplate': './templates/psk/default/',
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'TLS',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ["ALL"],
+        'network': ["ALL"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        "org_concurrency":1,
+        "concurrency":1,
+        }
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    requests = mock_meraki_dashboard_results["requests"]
+    first_update = [x[0] for x in requests].index("updateNetworkWirelessSsid")
+    last_lookup = len(requests) - 1 - [x[0] for x in requests][::-1].index("getNetworkWirelessSsids")
+    assert first_update < last_lookup
+    assert len([x for x in requests if x[0] == "updateNetworkWirelessSsid"]) == 5
+    assert mock_meraki_dashboard_results["ssid_data"]["L_636829496481111675"][1]["psk"] == settings["passphrase"]
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+async def test_pskchg_jobs_dryrun_no(mock_meraki_dashboard,tmp_path): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method with a job file changing two SSIDs with a single discovery
+    job 1 : organizations ALL, networks ALL, SSID "Test SSID1", PSK from the operation settings
+    job 2 : organization DevNet Sandbox, network DNSMB3, SSID "Test SSID2", own PSK
+    dryrun : no
+    '''
+    jobs_file = tmp_path / "jobs.json"
+    jobs_file.write_text(json.dumps({"jobs":[
+        {"ssid":"Test SSID1"},
+        {"organization":"DevNet Sandbox","network":"DNSMB3-gxxxxxxonscom.com","ssid":"Test SSID2","passphrase":"psk23456"}
+        ]}),encoding="utf-8")
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': 0,
+        'dryrun': False,
+        'passphrase': "psk12345",
+        'passrandomize': False,
+        'email': None,
+        'emailtemplate': './templates/psk/default/',
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'TLS',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ["ALL"],
+        'network': ["ALL"],
+        "ssid":None,
+        "command":"psk",
+        "jobs_file":str(jobs_file),
+        }
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    ssid_data = mock_meraki_dashboard_results["ssid_data"]
+    assert ssid_data["L_646829496481111675"][1]["psk"] == "psk12345"
+    assert ssid_data["L_646829496481111675"][2]["psk"] == "psk23456"
+    assert ssid_data["L_636829496481111675"][1]["psk"] == "psk12345"
+    assert ssid_data["L_636829496481111675"][2].get("psk") != "psk23456"
+    assert len(merakiobj.current_operation["networks_to_process"]) == 6
+    # each network is discovered once for all jobs
+    ssid_requests = mock_meraki_dashboard_results["ssid_requests"]
+    assert len(ssid_requests) == len(set(ssid_requests))
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+@pytest.mark.parametrize("failed",[False,True])
+async def test_pskchg_org_all_net_all_dryrun_no_action_batches(mock_meraki_dashboard,failed): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method updating SSIDs with action batches
+    organizations : ALL
+    networks : ALL
+    dryrun : no
+    action batches : 2 SSIDs for each batch, completed or failed
+    '''
+    mock_meraki_dashboard_results["action_batches_failed"] = failed
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': 0,
+        'dryrun': False,
+        'passphrase': "psk12345",
+        'passrandomize': False,
+        'email': None,
+        'emailtemplate': './templates/psk/default/',
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'TLS',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ["ALL"],
+        'network': ["ALL"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        "action_batches":True,
+        "action_batch_size":2,
+        "retry_backoff":0.01,
+        }
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    # 3 SSIDs in organization 549236 and 2 SSIDs in organization 123456
+    assert sorted(mock_meraki_dashboard_results["action_batches"]) == [("123456",2),("549236",1),("549236",2)]
+    assert not mock_meraki_dashboard_results["requests"].count(("updateNetworkWirelessSsid","L_646829496481111675"))
+    if failed:
+        assert merakiobj.current_operation["success"] is False
+        assert mock_meraki_dashboard_results["ssid_data"]["L_646829496481111675"][1].get("psk") != settings["passphrase"]
+        # each network of a failed batch is a failure
+        assert len(merakiobj.current_operation["failures"]) == 5
+        assert {x["stage"] for x in merakiobj.current_operation["failures"]} == {"update"}
+    else:
+        assert merakiobj.current_operation["success"] is True
+        assert mock_meraki_dashboard_results["ssid_data"]["L_646829496481111675"][1]["psk"] == settings["passphrase"]
+        assert mock_meraki_dashboard_results["ssid_data"]["L_636829496481105433"][3]["psk"] == settings["passphrase"]
+        assert merakiobj.current_operation["failures"] == []
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+async def test_pskchg_org_one_net_all_dryrun_no_action_batches_not_repeated(mock_meraki_dashboard): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method updating SSIDs with an action batch whose creation fails with a server error
+    the creation is not repeated (the batch could have been created) and its networks are failed
+    organizations : one
+    networks : ALL
+    dryrun : no
+    '''
+    mock_meraki_dashboard_results["action_batches_errors"] = [500]
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': 0,
+        'dryrun': False,
+        'passphrase': "psk12345",
+        'passrandomize': False,
+        'email': None,
+        'emailtemplate': './templates/psk/default/',
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'TLS',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ["DevNet Sandbox"],
+        'network': ["ALL"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        "action_batches":True,
+        "retry_backoff":0.01,
+        }
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    assert mock_meraki_dashboard_results["requests"].count(("createOrganizationActionBatch","549236")) == 1
+    assert not mock_meraki_dashboard_results["action_batches"]
+    assert merakiobj.current_operation["failures"]
+    assert {x["stage"] for x in merakiobj.current_operation["failures"]} == {"update"}
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+async def test_pskchg_org_all_net_all_dryrun_no_psk_unchanged(mock_meraki_dashboard): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method skipping SSIDs that already have the PSK
+    organizations : ALL
+    networks : ALL
+    dryrun : no
+    PSK : already set in all networks except one
+    '''
+    mock_meraki_dashboard_results["ssid_data"]["L_646829496481111675"][1]["psk"] = "oldpsk12"
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': 1,
+        'dryrun': False,
+        'passphrase': "testtest",
+        'passrandomize': False,
+        'email': None,
+        'emailtemplate': './templates/psk/default/',
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'TLS',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ["ALL"],
+        'network': ["ALL"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        }
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    updates = [x for x in mock_meraki_dashboard_results["requests"] if x[0] == "updateNetworkWirelessSsid"]
+    assert updates == [("updateNetworkWirelessSsid","L_646829496481111675")]
+    assert mock_meraki_dashboard_results["ssid_data"]["L_646829496481111675"][1]["psk"] == "testtest"
+    networks_unchanged = [x for x in merakiobj.current_operation["networks_to_process"] if x["pskUnchanged"]]
+    assert len(networks_unchanged) == 4
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+async def test_pskchg_org_one_net_one_dryrun_no_stats(mock_meraki_dashboard,tmp_path,capsys): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync and send_email_psk methods statistics with a 429 error
+    organizations : one
+    networks : one
+    dryrun : no
+    '''
+    stats_file = tmp_path / "stats.json"
+    metrics_file = tmp_path / "merakitoolkit.prom"
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': False,
+        'dryrun': False,
+        'passphrase': "psk12345",
+        'passrandomize': False,
+        'email': ['email1@domain.com', 'email2@domain.com'],
+        'emailtemplate': './merakitoolkit/templates/psk/default/',
+        "smtp_sender":"MerakiToolkit",
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'SMTP',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ['DevNet Sandbox'],
+        'network': ["DNSMB3-gxxxxxxonscom.com"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        "stats":True,
+        "stats_file":str(stats_file),
+        "metrics_file":str(metrics_file),
+        }
+
+    mock_meraki_dashboard_results["ssid_errors"]["L_646829496481111675"] = [429]
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    assert "getNetworkWirelessSsids" in capsys.readouterr().out
+    # endpoints are named after the called functions (Meraki SDK methods are replaced by mock functions)
+    endpoints = {x.replace("mock_",""): y for x,y in json.loads(stats_file.read_text(encoding="utf-8"))["endpoints"].items()}
+    assert endpoints["getOrganizations"]["calls"] == 1
+    assert endpoints["getNetworkWirelessSsids"]["calls"] == 1
+    assert endpoints["getNetworkWirelessSsids"]["retries"] == 1
+    assert endpoints["getNetworkWirelessSsids"]["rate_limited"] == 1
+    assert endpoints["getNetworkWirelessSsids"]["bytes_received"] > 0
+    assert endpoints["updateNetworkWirelessSsid"]["failures"] == 0
+    assert endpoints["updateNetworkWirelessSsid"]["histogram"]["+Inf"] == 1
+    metrics = metrics_file.read_text(encoding="utf-8").splitlines()
+    assert "merakitoolkit_last_run_success 1" in metrics
+    assert 'merakitoolkit_networks{state="updated"} 1' in metrics
+    assert 'merakitoolkit_networks{state="failed"} 0' in metrics
+    # mock 429 errors ask to retry immediately (Retry-After: 0)
+    assert "merakitoolkit_rate_limit_wait_seconds 0" in metrics
+
+    # SMTP server is not available: email delivery is recorded as failed
+    merakiobj.send_email_psk()
+    endpoints = json.loads(stats_file.read_text(encoding="utf-8"))["endpoints"]
+    assert endpoints["email:generate_email_body"]["calls"] == 2
+    assert endpoints["email:generate_qrcode"]["calls"] == 1
+    assert endpoints["email:template_images"]["calls"] == 1
+    assert endpoints["email:smtp"]["failures"] == 1
+    assert 'merakitoolkit_phase_duration_seconds{phase="email"}' in metrics_file.read_text(encoding="utf-8")
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+async def test_pskchg_org_all_net_all_dryrun_yes_stats_notify(mock_meraki_dashboard,tmp_path): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync and send_email_psk methods statistics with notifications and a network failed in discovery
+    statistics and metrics are written once, after the notifications
+    organizations : ALL
+    networks : ALL
+    dryrun : yes
+    '''
+    stats_file = tmp_path / "stats.json"
+    metrics_file = tmp_path / "merakitoolkit.prom"
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': False,
+        'dryrun': True,
+        'passphrase': "psk12345",
+        'passrandomize': False,
+        'email': ['email1@domain.com'],
+        'emailtemplate': './merakitoolkit/templates/psk/default/',
+        "smtp_sender":"MerakiToolkit",
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'SMTP',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ["ALL"],
+        'network': ["ALL"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        "notify":True,
+        "stats_file":str(stats_file),
+        "metrics_file":str(metrics_file),
+        "max_attempts":1,
+        }
+
+    mock_meraki_dashboard_results["ssid_errors"]["L_646829496481111675"] = [500]
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    assert not stats_file.exists()
+    assert not metrics_file.exists()
+
+    merakiobj.send_email_psk()
+    assert "email:smtp" in json.loads(stats_file.read_text(encoding="utf-8"))["endpoints"]
+    metrics = metrics_file.read_text(encoding="utf-8").splitlines()
+    assert 'merakitoolkit_networks{state="failed"} 1' in metrics
+    assert "merakitoolkit_last_run_success 0" in metrics
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+@pytest.mark.parametrize("action_batches",[False,True])
+async def test_pskchg_org_all_net_all_dryrun_no_output_jsonl(mock_meraki_dashboard,tmp_path,action_batches): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method writing the result of each network to a JSON Lines file
+    organizations : ALL
+    networks : ALL
+    dryrun : no
+    PSK : already set in all networks except one
+    '''
+    mock_meraki_dashboard_results["ssid_data"]["L_646829496481111675"][1]["psk"] = "oldpsk12"
+    output_file = tmp_path / "results.jsonl"
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': 0,
+        'dryrun': False,
+        'passphrase': "testtest",
+        'passrandomize': False,
+        'email': None,
+        'emailtemplate': './templates/psk/default/',
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'TLS',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ["ALL"],
+        'network': ["ALL"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        "action_batches":action_batches,
+        "output":"jsonl",
+        "output_file":str(output_file),
+        }
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    results = [json.loads(x) for x in output_file.read_text(encoding="utf-8").splitlines()]
+    assert len(results) == 5
+    updated = [x for x in results if x["action"] == "update"]
+    assert len(updated) == 1
+    assert updated[0]["networkId"] == "L_646829496481111675"
+    assert updated[0]["ssidNumber"] == 1
+    assert updated[0]["outcome"] == "success"
+    assert updated[0]["latency"] >= 0
+    assert {x["outcome"] for x in results if x["action"] == "skip"} == {"unchanged"}
+    assert merakiobj.output is None
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+async def test_pskchg_org_all_net_all_dryrun_yes_output_csv(mock_meraki_dashboard,capsys): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method writing the result of each network in CSV format to the standard output
+    organizations : ALL
+    networks : ALL
+    dryrun : yes
+    '''
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': 1,
+        'dryrun': True,
+        'passphrase': "newpsk123",
+        'passrandomize': False,
+        'email': None,
+        'emailtemplate': './templates/psk/default/',
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'TLS',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ["ALL"],
+        'network': ["ALL"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        "output":"csv",
+        }
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    # results replace the report on the standard output
+    results = list(csv.DictReader(io.StringIO(capsys.readouterr().out)))
+    assert len(results) == len(merakiobj.current_operation["networks_to_process"])
+    assert {x["outcome"] for x in results} == {"dryrun"}
+    assert {x["ssidName"] for x in results} == {"Test SSID1"}
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+async def test_pskchg_org_all_net_all_dryrun_yes_output_jsonl_failures(mock_meraki_dashboard,capsys): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method writing the result of each network in JSON Lines format to the standard output
+    with verbose messages (sent to standard error) and a network whose discovery fails
+    organizations : ALL
+    networks : ALL
+    dryrun : yes
+    '''
+    mock_meraki_dashboard_results["ssid_errors"]["L_646829496481111675"] = [500]
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': 2,
+        'dryrun': True,
+        'passphrase': "newpsk123",
+        'passrandomize': False,
+        'email': None,
+        'emailtemplate': './templates/psk/default/',
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'TLS',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ["ALL"],
+        'network': ["ALL"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        "output":"jsonl",
+        "max_attempts":1,
+        }
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    captured = capsys.readouterr()
+    # the standard output contains only the results
+    results = [json.loads(x) for x in captured.out.splitlines()]
+    assert "START: getting Organizations" in captured.err
+    failed = [x for x in results if x["action"] == "discover"]
+    assert [(x["networkId"],x["outcome"],x["ssidName"]) for x in failed] == [("L_646829496481111675","failed",None)]
+    assert len(results) == len(merakiobj.current_operation["networks_to_process"]) + 1
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+@pytest.mark.parametrize("discovered",[True,False])
+async def test_pskchg_org_all_net_all_dryrun_no_resume(mock_meraki_dashboard,tmp_path,discovered): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method resuming an operation interrupted after two updates
+    organizations : ALL
+    networks : ALL
+    dryrun : no
+    discovered : discovery of the interrupted operation completed (networks are taken from the journal)
+    '''
+    journal_file = tmp_path / "journal.jsonl"
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': 0,
+        'dryrun': False,
+        'passphrase': "newpsk123",
+        'passrandomize': False,
+        'email': None,
+        'emailtemplate': './templates/psk/default/',
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'TLS',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ["ALL"],
+        'network': ["ALL"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        "journal":str(journal_file),
+        }
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    records = [json.loads(x) for x in journal_file.read_text(encoding="utf-8").splitlines()]
+    updates = [x for x in records if x["type"] == "update"]
+    assert len(updates) == 5
+    assert records[0]["type"] == "run"
+    assert records[0]["jobs"][0]["passphrase"] == "newpsk123"
+
+    # interrupted operation: only the first two updates are done (last record partially written)
+    records = [x for x in records if x["type"] in ("run","target") or (x["type"] == "discovered" and discovered)]
+    lines = [json.dumps(x) for x in records + updates[:2]]
+    journal_file.write_text("\n".join(lines) + '\n{"type": "upd',encoding="utf-8")
+    for update in updates[2:]:
+        network_id,ssid_position = update["key"].split("/")
+        mock_meraki_dashboard_results["ssid_data"][network_id][int(ssid_position)]["psk"] = "oldpsk12"
+    mock_meraki_dashboard_results["requests"].clear()
+
+    # PSK of the interrupted operation is applied instead of a new random PSK
+    settings.update({"journal":None,"resume":str(journal_file),"passphrase":None,"passrandomize":True})
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    lookups = [x for x in mock_meraki_dashboard_results["requests"] if x[0] == "getNetworkWirelessSsids"]
+    changed = [x[1] for x in mock_meraki_dashboard_results["requests"] if x[0] == "updateNetworkWirelessSsid"]
+    assert (len(lookups) == 0) is discovered
+    assert sorted(changed) == sorted(x["key"].split("/")[0] for x in updates[2:])
+    for update in updates:
+        network_id,ssid_position = update["key"].split("/")
+        assert mock_meraki_dashboard_results["ssid_data"][network_id][int(ssid_position)]["psk"] == "newpsk123"
+    assert len(merakiobj.current_operation["networks_to_process"]) == 5
+    assert merakiobj.current_operation["success"] is True
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+async def test_pskchg_org_all_net_all_dryrun_no_failures(mock_meraki_dashboard,capsys): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method completing the operation when some networks fail
+    organizations : ALL
+    networks : ALL
+    dryrun : no
+    failures : SSIDs lookup error (500) and unexpected SSID data in two networks
+    '''
+    del mock_meraki_dashboard_results["ssid_data"]["L_646829496481111675"][1]["wpaEncryptionMode"]
+    mock_meraki_dashboard_results["ssid_errors"]["L_636829496481105433"] = [500]
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': 0,
+        'dryrun': False,
+        'passphrase': "newpsk123",
+        'passrandomize': False,
+        'email': None,
+        'emailtemplate': './templates/psk/default/',
+        'smtp_server': None,
+        'smtp_port': None,
+        'smtp_mode': 'TLS',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ["ALL"],
+        'network': ["ALL"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        "max_attempts":1,
+        }
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    failures = sorted(merakiobj.current_operation["failures"],key=lambda x: x["networkId"])
+    assert [(x["stage"],x["networkId"]) for x in failures] == [
+        ("discovery","L_636829496481105433"),
+        ("discovery","L_646829496481111675"),
+        ]
+    assert failures[0]["error"] == "['Mock error 500']"
+    assert failures[1]["organization"] is not None
+    assert "2 failures" in capsys.readouterr().out
+    # other networks are updated
+    assert merakiobj.current_operation["success"] is True
+    assert len(merakiobj.current_operation["networks_to_process"]) == 3
+    for network in merakiobj.current_operation["networks_to_process"]:
+        ssid_position = int(network["ssidPosition"])
+        assert mock_meraki_dashboard_results["ssid_data"][network["id"]][ssid_position]["psk"] == "newpsk123"
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+async def test_pskchg_org_one_net_all_dryrun_no_notify(mock_meraki_dashboard,monkeypatch): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method sending the notification email during the updates
+    organizations : one
+    networks : ALL
+    dryrun : no
+    '''
+    messages = []
+
+    class MockSMTP(): # pylint: disable=too-few-public-methods
+        '''SMTP connection delivering the messages to a list'''
+        def __init__(self,host,port,timeout=None): # pylint: disable=unused-argument
+            pass
+        def send_message(self,message):
+            '''deliver a message'''
+            messages.append(message)
+        def quit(self):
+            '''close the connection'''
+
+    monkeypatch.setattr(merakitoolkitsmtp.smtplib,"SMTP",MockSMTP)
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': 0,
+        'dryrun': False,
+        'passphrase': "newpsk123",
+        'passrandomize': False,
+        'email': ['email1@domain.com', 'email2@domain.com'],
+        'emailtemplate': './merakitoolkit/templates/psk/default/',
+        "smtp_sender":"MerakiToolkit",
+        'smtp_server': "smtp.domain.com",
+        'smtp_port': 25,
+        'smtp_mode': 'SMTP',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ['DevNet Sandbox'],
+        'network': ["ALL"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        "notify":True,
+        }
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    # one email for the job, sent by the operation
+    assert len(messages) == 1
+    assert messages[0]["Bcc"] == "email1@domain.com,email2@domain.com"
+    assert merakiobj.current_operation["notified"] == {0}
+    assert not os.path.exists("./merakitoolkit/templates/psk/default/qrcode.png")
+    # job already notified is not sent again
+    merakiobj.send_email_psk()
+    assert len(messages) == 1
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+async def test_pskchg_org_one_net_all_dryrun_no_notify_failed(mock_meraki_dashboard,monkeypatch): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method with the notification email failed during the updates
+    the job is not notified and its email is sent again by send_email_psk
+    organizations : one
+    networks : ALL
+    dryrun : no
+    '''
+    messages = []
+    smtp_server = {"available":False}
+
+    class MockSMTP(): # pylint: disable=too-few-public-methods
+        '''SMTP connection delivering the messages to a list when the server is available'''
+        def __init__(self,host,port,timeout=None): # pylint: disable=unused-argument
+            if not smtp_server["available"]:
+                raise ConnectionRefusedError("SMTP server not available")
+        def send_message(self,message):
+            '''deliver a message'''
+            messages.append(message)
+        def quit(self):
+            '''close the connection'''
+
+    monkeypatch.setattr(merakitoolkitsmtp.smtplib,"SMTP",MockSMTP)
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': 0,
+        'dryrun': False,
+        'passphrase': "newpsk123",
+        'passrandomize': False,
+        'email': ['email1@domain.com', 'email2@domain.com'],
+        'emailtemplate': './merakitoolkit/templates/psk/default/',
+        "smtp_sender":"MerakiToolkit",
+        'smtp_server': "smtp.domain.com",
+        'smtp_port': 25,
+        'smtp_mode': 'SMTP',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ['DevNet Sandbox'],
+        'network': ["ALL"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        "notify":True,
+        "smtp_attempts":1,
+        }
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    assert not messages
+    assert merakiobj.current_operation["notified"] == set()
+    # email of the job is sent again
+    smtp_server["available"] = True
+    merakiobj.send_email_psk()
+    assert len(messages) == 1
+    assert merakiobj.current_operation["notified"] == {0}
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+async def test_pskchg_jobs_dryrun_no_email_failed_job(mock_meraki_dashboard,monkeypatch): # pylint: disable=unused-argument
+    '''
+    test send_email_psk method after a job whose updates all failed
+    job 1 : organization DevNet Sandbox, networks ALL, SSID "Test SSID1", updated
+    job 2 : organization DevNet Sandbox, network DNSMB3, SSID "Test SSID2", update failed
+    only the recipients of job 1 are notified
+    dryrun : no
+    '''
+    messages = []
+
+    class MockSMTP(): # pylint: disable=too-few-public-methods
+        '''SMTP connection delivering the messages to a list'''
+        def __init__(self,host,port,timeout=None): # pylint: disable=unused-argument
+            pass
+        def send_message(self,message):
+            '''deliver a message'''
+            messages.append(message)
+        def quit(self):
+            '''close the connection'''
+
+    monkeypatch.setattr(merakitoolkitsmtp.smtplib,"SMTP",MockSMTP)
+    mock_meraki_dashboard_results["update_errors"][("L_646829496481111675",2)] = [400]
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': 0,
+        'dryrun': False,
+        'passphrase': "newpsk123",
+        'passrandomize': False,
+        'email': None,
+        'emailtemplate': './merakitoolkit/templates/psk/default/',
+        "smtp_sender":"MerakiToolkit",
+        'smtp_server': "smtp.domain.com",
+        'smtp_port': 25,
+        'smtp_mode': 'SMTP',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ['DevNet Sandbox'],
+        'network': ["ALL"],
+        "ssid":None,
+        "command":"psk",
+        "jobs":[
+            {"ssid":"Test SSID1","email":["job1@domain.com"]},
+            {"network":"DNSMB3-gxxxxxxonscom.com","ssid":"Test SSID2","passphrase":"psk23456",
+             "email":["job2@domain.com"]}
+            ],
+        }
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    failures = merakiobj.current_operation["failures"]
+    assert [(x["stage"],x["networkId"]) for x in failures] == [("update","L_646829496481111675")]
+    merakiobj.send_email_psk()
+    assert [x["Bcc"] for x in messages] == ["job1@domain.com"]
+    assert merakiobj.current_operation["notified"] == {0}
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+@pytest.mark.parametrize("render_processes",[0,1])
+async def test_pskchg_org_one_net_all_dryrun_no_notify_network(mock_meraki_dashboard,monkeypatch,render_processes): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method sending the notification email of each network to its recipients
+    organizations : one
+    networks : ALL
+    dryrun : no
+    '''
+    messages = []
+
+    class MockSMTP(): # pylint: disable=too-few-public-methods
+        '''SMTP connection delivering the messages to a list'''
+        def __init__(self,host,port,timeout=None): # pylint: disable=unused-argument
+            pass
+        def send_message(self,message):
+            '''deliver a message'''
+            messages.append(message)
+        def quit(self):
+            '''close the connection'''
+
+    monkeypatch.setattr(merakitoolkitsmtp.smtplib,"SMTP",MockSMTP)
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': 0,
+        'dryrun': False,
+        'passphrase': "newpsk123",
+        'passrandomize': False,
+        'email': None,
+        'emailtemplate': './merakitoolkit/templates/psk/default/',
+        "smtp_sender":"MerakiToolkit",
+        'smtp_server': "smtp.domain.com",
+        'smtp_port': 25,
+        'smtp_mode': 'SMTP',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ['DevNet Sandbox'],
+        'network': ["ALL"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        "notify":True,
+        "notify_mode":"network",
+        "render_processes":render_processes,
+        "recipients": {
+            "DevNet Sandbox ALWAYS ON": ["site1@domain.com"],
+            "L_646829496481111545": ["site2@domain.com"],
+            "tag:tag1": ["tag1@domain.com"],
+            },
+        }
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    # one email for each network with recipients, sent by the operation
+    recipients = sorted((x["Subject"].split(" - ")[-1],x["Bcc"]) for x in messages)
+    assert recipients == [
+        ("DNSMB3-gxxxxxxonscom.com","tag1@domain.com"),
+        ("DevNet Sandbox ALWAYS ON","site1@domain.com,tag1@domain.com"),
+        ("yucansoft.co.uk","site2@domain.com"),
+        ]
+    for message in messages:
+        text = message.get_payload()[0].get_payload()[0].get_payload(decode=True).decode()
+        assert "newpsk123" in text and message["Subject"].split(" - ")[-1] in text
+        assert [x["Content-ID"] for x in message.get_payload()[1:]] == ["<logopng>","<qrcodepng>"]
+    assert len(merakiobj.current_operation["notified"]) == 3
+    # networks already notified are not sent again
+    merakiobj.send_email_psk()
+    assert len(messages) == 3
+
+    # networks not notified during the operation are sent afterwards (rendered by the processes of the renderer)
+    merakiobj.current_operation["notified"].clear()
+    merakiobj.send_email_psk()
+    assert len(messages) == 6
+    assert sorted(x["Bcc"] for x in messages[3:]) == sorted(x["Bcc"] for x in messages[:3])
+
+
+# @pytest.mark.asyncio -> necessary to define execute in a test loop any async test function (pytest-asyncio)
+@pytest.mark.asyncio
+async def test_pskchg_org_all_net_all_dryrun_no_psk_network(mock_meraki_dashboard,monkeypatch): # pylint: disable=unused-argument
+    '''
+    test pskchangeasync method with a unique generated PSK for each network SSID, notified to each network
+    organizations : ALL
+    networks : ALL
+    dryrun : no
+    '''
+    messages = []
+
+    class MockSMTP(): # pylint: disable=too-few-public-methods
+        '''SMTP connection delivering the messages to a list'''
+        def __init__(self,host,port,timeout=None): # pylint: disable=unused-argument
+            pass
+        def send_message(self,message):
+            '''deliver a message'''
+            messages.append(message)
+        def quit(self):
+            '''close the connection'''
+
+    monkeypatch.setattr(merakitoolkitsmtp.smtplib,"SMTP",MockSMTP)
+
+    settings= {
+        'apikey': '123456789',
+        'tags': None,
+        'verbose': 0,
+        'dryrun': False,
+        'passphrase': None,
+        'passrandomize': False,
+        'email': None,
+        'emailtemplate': './merakitoolkit/templates/psk/default/',
+        "smtp_sender":"MerakiToolkit",
+        'smtp_server': "smtp.domain.com",
+        'smtp_port': 25,
+        'smtp_mode': 'SMTP',
+        'smtp_user': None,
+        'smtp_pass': None,
+        'organization': ['ALL'],
+        'network': ["ALL"],
+        "ssid":"Test SSID1",
+        "command":"psk",
+        "notify":True,
+        "notify_mode":"network",
+        "render_processes":0,
+        "recipients": {"tag:tag1": ["tag1@domain.com"]},
+        "psk_policy":"network",
+        }
+
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    await merakiobj.pskchangeasync()
+    networks = merakiobj.current_operation["networks_to_process"]
+    assert len(networks) == 5
+    # each network SSID has its own PSK, applied by the update
+    assert len({x["passphrase"] for x in networks}) == 5
+    for network in networks:
+        assert not network["pskUnchanged"]
+        ssids = mock_meraki_dashboard_results["ssid_data"][network["id"]]
+        assert ssids[int(network["ssidPosition"])]["psk"] == network["passphrase"]
+    # emails of the networks with recipients have the PSK of the network
+    tagged = {x["name"]: x["passphrase"] for x in networks if "tag1" in x["tags"]}
+    assert len(messages) == len(tagged) == 3
+    for message in messages:
+        text = message.get_payload()[0].get_payload()[0].get_payload(decode=True).decode()
+        assert tagged[message["Subject"].split(" - ")[-1]] in text
+
+    # emails of the jobs would send the same PSK to all the networks
+    settings["notify_mode"] = "job"
+    settings["email"] = ["email1@domain.com"]
+    merakiobj = merakitoolkit.MerakiToolkit(settings)
+    with pytest.raises(SystemExit):
+        await merakiobj.pskchangeasync()